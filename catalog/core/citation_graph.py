@@ -0,0 +1,132 @@
+import hashlib
+import json
+import logging
+from collections import deque
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from citation.models import Publication
+
+logger = logging.getLogger(__name__)
+
+CITATION_GRAPH_CACHE_KEY = 'citation_graph.{}'
+CITATION_GRAPH_CACHE_TIMEOUT = 60 * 60
+
+# bounds on the size of a citation tree so that densely cited publications stay cheap to render
+MAX_TREE_DEPTH = 3
+MAX_TREE_CHILDREN = 50
+MAX_TREE_NODES = 1000
+
+
+class CitationGraph:
+    """
+    Citations between publications in compressed sparse row form
+
+    The publications cited by the publication nodes[i] are nodes[targets[offsets[i]:offsets[i + 1]]]. nodes is
+    sorted so publication ids are found by binary search.
+    """
+
+    def __init__(self, nodes: np.ndarray, offsets: np.ndarray, targets: np.ndarray):
+        self.nodes = nodes
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def from_pairs(cls, publication_pks, cited_pks):
+        """Build a graph from citing and cited publication id pairs, dropping self citations and duplicates"""
+        pairs = np.array([publication_pks, cited_pks], dtype=np.int64).reshape(2, -1)
+        pairs = pairs[:, pairs[0] != pairs[1]]
+        pairs = np.unique(pairs, axis=1)
+        nodes = np.unique(pairs)
+        sources = np.searchsorted(nodes, pairs[0])
+        targets = np.searchsorted(nodes, pairs[1])
+        offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(nodes)), out=offsets[1:])
+        return cls(nodes, offsets, targets)
+
+    def _index(self, pk):
+        i = np.searchsorted(self.nodes, pk)
+        if i == len(self.nodes) or self.nodes[i] != pk:
+            return None
+        return int(i)
+
+    def _neighbours(self, i):
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def citations(self, pk):
+        """Ids of the publications cited by the publication pk"""
+        i = self._index(pk)
+        if i is None:
+            return self.nodes[:0]
+        return self.nodes[self._neighbours(i)]
+
+    def tree(self, root, max_depth=MAX_TREE_DEPTH, max_children=MAX_TREE_CHILDREN, max_nodes=MAX_TREE_NODES,
+             offset=0, exclude=()):
+        """
+        Breadth first citation tree of a publication
+
+        Every publication appears at most once so citation cycles end the branch they close. Nodes that were not
+        expanded because of the depth or node limits are marked with has_children so their subtree can be requested
+        separately. Nodes with more than max_children citations end their children with a placeholder node marked
+        with more, whose offset is passed back to list the remaining children as the subtree of their parent.
+
+        :param offset: position in the citations of the root of its first child
+        :param exclude: ids of the publications already shown elsewhere in the tree, left out of the subtree
+        :return: nested dictionaries with the name (publication id), children and has_children of every node
+        """
+        root_node = {'name': int(root), 'children': [], 'has_children': False}
+        root_index = self._index(root)
+        if root_index is None:
+            return root_node
+        visited = {root_index}
+        visited.update(i for i in (self._index(pk) for pk in exclude) if i is not None)
+        n_nodes = 1
+        queue = deque([(root_index, root_node, 0)])
+        while queue:
+            i, node, depth = queue.popleft()
+            start = offset if i == root_index else 0
+            neighbours = [(position, j) for position, j in enumerate(self._neighbours(i).tolist())
+                          if position >= start and j not in visited]
+            if not neighbours:
+                continue
+            if depth >= max_depth or n_nodes >= max_nodes:
+                node['has_children'] = True
+                continue
+            expanded = neighbours[:min(max_children, max_nodes - n_nodes)]
+            for position, j in expanded:
+                visited.add(j)
+                child = {'name': int(self.nodes[j]), 'children': [], 'has_children': False}
+                node['children'].append(child)
+                queue.append((j, child, depth + 1))
+            n_nodes += len(expanded)
+            if len(expanded) < len(neighbours):
+                n_more = len(neighbours) - len(expanded)
+                node['children'].append({'name': '{} more'.format(n_more), 'children': [], 'has_children': True,
+                                         'more': True, 'offset': neighbours[len(expanded)][0]})
+        return root_node
+
+
+def _get_cache_key(filter_criteria):
+    publications = Publication.api.primary(**filter_criteria)
+    state = publications.aggregate(count=Count('pk'), last_modified=Max('date_modified'))
+    key = json.dumps([filter_criteria, state], sort_keys=True, default=str)
+    return CITATION_GRAPH_CACHE_KEY.format(hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+def get_citation_graph(filter_criteria):
+    """
+    Citation graph of the publications matching filter_criteria
+
+    Graphs are cached by filter criteria and the state of the matching publications
+    """
+    key = _get_cache_key(filter_criteria)
+    graph = cache.get(key)
+    if graph is None:
+        primary_publications = Publication.api.primary(**filter_criteria)
+        pairs = np.array(list(Publication.api.primary(**filter_criteria, citations__in=primary_publications)
+                              .values_list('pk', 'citations')), dtype=np.int64).reshape(-1, 2)
+        graph = CitationGraph.from_pairs(pairs[:, 0], pairs[:, 1])
+        cache.set(key, graph, CITATION_GRAPH_CACHE_TIMEOUT)
+    return graph
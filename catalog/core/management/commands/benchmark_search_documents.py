@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from catalog.core.search_indexes import PublicationDoc, get_public_publications
+
+
+class Command(BaseCommand):
+    help = 'Compare queries per batch and documents per second of the per instance and batched publication ' \
+           'document builders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--batches', type=int, default=10)
+
+    def from_instance(self, pks):
+        publications = get_public_publications().filter(pk__in=pks).select_related('container') \
+            .prefetch_related('tags', 'sponsors', 'platforms', 'creators', 'model_documentation')
+        return [PublicationDoc.from_instance(p) for p in publications]
+
+    def bulk_from_ids(self, pks):
+        return PublicationDoc.bulk_from_ids(pks)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        pks = list(get_public_publications().order_by('pk').values_list('pk', flat=True)
+                   [:batch_size * options['batches']])
+        batches = [pks[i:i + batch_size] for i in range(0, len(pks), batch_size)]
+        for name, builder in [('from_instance', self.from_instance), ('bulk_from_ids', self.bulk_from_ids)]:
+            n_docs = 0
+            n_queries = 0
+            started = time.time()
+            for batch in batches:
+                with CaptureQueriesContext(connection) as queries:
+                    n_docs += len(builder(batch))
+                n_queries += len(queries)
+            elapsed = time.time() - started
+            self.stdout.write('{}: {} documents in {} batches, {:.1f} queries/batch, {:.1f} docs/sec'.format(
+                name, n_docs, len(batches), n_queries / max(len(batches), 1), n_docs / elapsed if elapsed else 0))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from catalog.core.statistics import refresh_statistics
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the yearly visualization statistics of the public publications'
+
+    def handle(self, *args, **options):
+        n_rows = refresh_statistics()
+        self.stdout.write('Wrote {} statistics rows'.format(n_rows))
@@ -0,0 +1,50 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog.core.search_indexes import sync_public_indices, reconcile_deleted_publications
+from catalog.core.statistics import refresh_statistics, refresh_publication_statistics
+
+logger = logging.getLogger(__name__)
+
+
+def refresh_synced_statistics(publication_ids, previous_related_ids, previous_years):
+    """Refresh the visualization statistics of synced publications, or all of them after a bulk rebuild"""
+    if publication_ids is None:
+        refresh_statistics()
+    else:
+        refresh_publication_statistics(publication_ids, previous_related_ids, previous_years)
+
+
+class Command(BaseCommand):
+    help = 'Update the public search indices with publications changed since the last sync'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--continuous', action='store_true', default=False,
+                            help='keep polling for changes instead of exiting after one sync')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='seconds to wait between syncs in continuous mode')
+        parser.add_argument('--reconcile-interval', type=float, default=3600,
+                            help='seconds between checks for deleted publications in continuous mode')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='number of publications synced per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if not options['continuous']:
+            n_synced = sync_public_indices(batch_size=batch_size, on_synced=refresh_synced_statistics)
+            n_deleted = reconcile_deleted_publications(batch_size=batch_size, on_synced=refresh_synced_statistics)
+            self.stdout.write('Synced {} changed and {} deleted publications'.format(n_synced, n_deleted))
+            return
+
+        last_reconciled = 0
+        while True:
+            try:
+                sync_public_indices(batch_size=batch_size, on_synced=refresh_synced_statistics)
+                if time.time() - last_reconciled >= options['reconcile_interval']:
+                    reconcile_deleted_publications(batch_size=batch_size, on_synced=refresh_synced_statistics)
+                    last_reconciled = time.time()
+            except Exception:
+                logger.exception('search index sync failed, retrying in %s seconds', options['interval'])
+            time.sleep(options['interval'])
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PublicationYearStatistics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('relation', models.CharField(max_length=32)),
+                ('related_id', models.IntegerField()),
+                ('year', models.PositiveSmallIntegerField()),
+                ('publication_count', models.PositiveIntegerField(default=0)),
+                ('code_availability_count', models.PositiveIntegerField(default=0)),
+                ('odd_count', models.PositiveIntegerField(default=0)),
+                ('formal_description_count', models.PositiveIntegerField(default=0)),
+                ('visual_documentation_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='publicationyearstatistics',
+            unique_together={('relation', 'related_id', 'year')},
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import models
+
+
+class PublicationYearStatistics(models.Model):
+    """
+    Yearly publication counts of a related entity of the public publications
+
+    Materialized by catalog.core.statistics so that charts read a few indexed rows instead of aggregating every
+    publication. Rows only exist for years with publications.
+    """
+    relation = models.CharField(max_length=32)
+    related_id = models.IntegerField()
+    year = models.PositiveSmallIntegerField()
+    publication_count = models.PositiveIntegerField(default=0)
+    code_availability_count = models.PositiveIntegerField(default=0)
+    odd_count = models.PositiveIntegerField(default=0)
+    formal_description_count = models.PositiveIntegerField(default=0)
+    visual_documentation_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return '{} {} {}: {} publications'.format(self.relation, self.related_id, self.year, self.publication_count)
+
+    class Meta:
+        unique_together = ('relation', 'related_id', 'year')
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import time
+from collections import defaultdict
+
+import numpy as np
+from dateutil.parser import parse as datetime_parse
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from catalog.core.statistics import get_public_publications
+
+logger = logging.getLogger(__name__)
+
+NETWORK_GRAPH_CACHE_KEY = 'network_graph.{}.{}'
+NETWORK_GRAPH_CACHE_TIMEOUT = 24 * 60 * 60
+# seconds a process serves its store before checking whether the public publications changed
+NETWORK_GRAPH_VERSION_CHECK_INTERVAL = 60
+
+# filter criteria every publication of the store satisfies
+BASE_CRITERIA = {'is_primary': True, 'status': 'REVIEWED'}
+SUPPORTED_LOOKUPS = {'tags__name__in', 'sponsors__name__in', 'date_published__gte', 'date_published__lte'}
+MISSING_DATE = -1
+
+
+def _join_names(rows, n_publications, separator=', '):
+    names = defaultdict(list)
+    for i, name in rows:
+        if name:
+            names[i].append(name)
+    return [separator.join(names[i]) for i in range(n_publications)]
+
+
+def _to_ordinal(value):
+    return datetime_parse(value).date().toordinal() if isinstance(value, str) else value.toordinal()
+
+
+def normalize_filter_criteria(filter_criteria):
+    """
+    Filter criteria as a canonical JSON string
+
+    :raises ValueError: if the criteria can not be answered from the store
+    """
+    lookups = set(filter_criteria) - set(BASE_CRITERIA)
+    if not lookups <= SUPPORTED_LOOKUPS or any(filter_criteria.get(lookup, value) != value
+                                               for lookup, value in BASE_CRITERIA.items()):
+        raise ValueError('unsupported network graph filter criteria {}'.format(filter_criteria))
+    normalized = {}
+    for lookup in lookups:
+        value = filter_criteria[lookup]
+        normalized[lookup] = sorted(set(value)) if lookup.endswith('__in') else _to_ordinal(value)
+    return json.dumps(normalized, sort_keys=True)
+
+
+class NetworkGraphStore:
+    """
+    Citation graph of every public publication with the attributes network graph filters use
+
+    Nodes are publications ordered by id with their publication date as an ordinal and tag and sponsor
+    memberships. Edges are arrays of citing and cited node indices. Filtered graphs are computed by masking nodes
+    and the edges between them instead of querying the database again.
+    """
+
+    def __init__(self, version, pks, dates, titles, authors, tags, sponsors, tag_nodes, sponsor_nodes, sources,
+                 targets):
+        self.version = version
+        self.pks = pks
+        self.dates = dates
+        self.titles = titles
+        self.authors = authors
+        self.tags = tags
+        self.sponsors = sponsors
+        self.tag_nodes = tag_nodes
+        self.sponsor_nodes = sponsor_nodes
+        self.sources = sources
+        self.targets = targets
+
+    @staticmethod
+    def get_version():
+        state = get_public_publications().aggregate(count=Count('pk'), last_modified=Max('date_modified'))
+        return hashlib.sha1(json.dumps(state, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def build(cls, version):
+        publications = get_public_publications()
+        rows = list(publications.order_by('pk').values_list('pk', 'title', 'date_published'))
+        pks = np.array([pk for pk, _, _ in rows], dtype=np.int64)
+        dates = np.array([MISSING_DATE if d is None else d.toordinal() for _, _, d in rows], dtype=np.int64)
+        titles = [title for _, title, _ in rows]
+
+        def indexed(values_list):
+            pairs = list(values_list)
+            indices = np.searchsorted(pks, np.array([pk for pk, _ in pairs], dtype=np.int64))
+            return list(zip(indices.tolist(), (name for _, name in pairs)))
+
+        def node_sets(pairs):
+            nodes = defaultdict(list)
+            for i, name in pairs:
+                if name is not None:
+                    nodes[name].append(i)
+            return {name: np.unique(np.array(indices, dtype=np.int64)) for name, indices in nodes.items()}
+
+        author_pairs = indexed(
+            (pk, ' '.join(n for n in (given_name, family_name) if n))
+            for pk, given_name, family_name in publications.filter(creators__isnull=False)
+            .values_list('pk', 'creators__given_name', 'creators__family_name'))
+        tag_pairs = indexed(publications.filter(tags__isnull=False).values_list('pk', 'tags__name'))
+        sponsor_pairs = indexed(publications.filter(sponsors__isnull=False).values_list('pk', 'sponsors__name'))
+        edges = np.array(list(publications.filter(citations__in=publications).values_list('pk', 'citations')),
+                         dtype=np.int64).reshape(-1, 2)
+        edges = np.unique(edges[edges[:, 0] != edges[:, 1]], axis=0)
+        return cls(version=version, pks=pks, dates=dates, titles=titles,
+                   authors=_join_names(author_pairs, len(pks)),
+                   tags=_join_names(tag_pairs, len(pks)),
+                   sponsors=_join_names(sponsor_pairs, len(pks)),
+                   tag_nodes=node_sets(tag_pairs),
+                   sponsor_nodes=node_sets(sponsor_pairs),
+                   sources=np.searchsorted(pks, edges[:, 0]),
+                   targets=np.searchsorted(pks, edges[:, 1]))
+
+    def _members(self, node_sets, names):
+        mask = np.zeros(len(self.pks), dtype=bool)
+        for name in names:
+            mask[node_sets.get(name, self.pks[:0])] = True
+        return mask
+
+    def _largest_component(self, mask, sources, targets):
+        """Mask of the nodes of the largest connected component of the masked graph that has an edge"""
+        labels = np.arange(len(self.pks))
+        while True:
+            # propagate the smallest label along edges, then jump to the label of the label
+            previous = labels.copy()
+            np.minimum.at(labels, sources, labels[targets])
+            np.minimum.at(labels, targets, labels[sources])
+            labels = labels[labels]
+            if np.array_equal(labels, previous):
+                break
+        connected = np.zeros(len(self.pks), dtype=bool)
+        connected[sources] = True
+        connected[targets] = True
+        if not connected.any():
+            return connected
+        sizes = np.bincount(labels[connected & mask], minlength=len(self.pks))
+        return mask & connected & (labels == sizes.argmax())
+
+    def filter(self, filter_criteria):
+        """
+        Nodes and links of the largest citation network of the publications matching filter_criteria
+
+        :return: the network graph and the tags nodes are grouped by
+        """
+        mask = np.ones(len(self.pks), dtype=bool)
+        group = list(filter_criteria.get('tags__name__in', []))
+        if 'tags__name__in' in filter_criteria:
+            mask &= self._members(self.tag_nodes, group)
+        if 'sponsors__name__in' in filter_criteria:
+            mask &= self._members(self.sponsor_nodes, filter_criteria['sponsors__name__in'])
+        if 'date_published__gte' in filter_criteria:
+            mask &= (self.dates != MISSING_DATE) & (self.dates >= _to_ordinal(filter_criteria['date_published__gte']))
+        if 'date_published__lte' in filter_criteria:
+            mask &= (self.dates != MISSING_DATE) & (self.dates <= _to_ordinal(filter_criteria['date_published__lte']))
+        edges = mask[self.sources] & mask[self.targets]
+        sources, targets = self.sources[edges], self.targets[edges]
+        nodes = np.flatnonzero(self._largest_component(mask, sources, targets))
+        edges = np.isin(sources, nodes) & np.isin(targets, nodes)
+        groups = {}
+        for name in reversed(group):
+            for i in self.tag_nodes.get(name, ()):
+                groups[i] = name
+        graph = {
+            'nodes': [{'name': int(self.pks[i]), 'group': groups.get(i, ''), 'title': self.titles[i],
+                       'Authors': self.authors[i], 'tags': self.tags[i], 'sponsors': self.sponsors[i]}
+                      for i in nodes.tolist()],
+            'links': [{'source': int(s), 'target': int(t)} for s, t in
+                      zip(np.searchsorted(nodes, sources[edges]), np.searchsorted(nodes, targets[edges]))]
+        }
+        return graph, group
+
+
+_store = None
+_version_checked_at = None
+
+
+def get_network_graph_store():
+    """
+    Network graph store of the current public publications
+
+    Every process keeps its own store in memory and checks its version at most once every
+    NETWORK_GRAPH_VERSION_CHECK_INTERVAL seconds, so a store can lag the database by up to one interval
+    """
+    global _store, _version_checked_at
+    now = time.monotonic()
+    if _store is not None and now - _version_checked_at < NETWORK_GRAPH_VERSION_CHECK_INTERVAL:
+        return _store
+    version = NetworkGraphStore.get_version()
+    if _store is None or _store.version != version:
+        logger.info('building network graph store version %s', version)
+        _store = NetworkGraphStore.build(version)
+    _version_checked_at = now
+    return _store
+
+
+def get_network_graph(filter_criteria):
+    """
+    Network graph and tag groups of the publications matching filter_criteria, memoized by normalized criteria
+
+    :raises ValueError: if the criteria can not be answered from the store
+    """
+    criteria_key = normalize_filter_criteria(filter_criteria)
+    store = get_network_graph_store()
+    key = NETWORK_GRAPH_CACHE_KEY.format(store.version, hashlib.sha1(criteria_key.encode('utf-8')).hexdigest())
+    result = cache.get(key)
+    if result is None:
+        result = store.filter(filter_criteria)
+        cache.set(key, result, NETWORK_GRAPH_CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,55 @@
+import re
+
+import numpy as np
+
+
+class PrefixIndex:
+    """
+    Typeahead index over option labels
+
+    Every word of a label is a key, so "smi" matches "John Smith". Options can have aliases such as the ISSN of a
+    journal that are keys as a whole. Keys are kept in a sorted array and a prefix search is the range of keys found
+    by binary search. Matches are ranked by weight (publication count).
+    """
+    WORD_START = re.compile(r'(?:^|(?<=[\s\-(,.:;/]))\w', re.UNICODE)
+
+    def __init__(self, options, keys: np.ndarray, option_indices: np.ndarray, weights: np.ndarray):
+        self.options = options
+        self.keys = keys
+        self.option_indices = option_indices
+        self.weights = weights
+
+    @classmethod
+    def from_options(cls, options, weights, aliases=None):
+        """
+        :param options: dropdown options with a label and a value
+        :param weights: ranking weight of every option
+        :param aliases: other names every option is found by
+        """
+        keys = []
+        option_indices = []
+        for i, option in enumerate(options):
+            label = str(option['label']).lower()
+            for match in cls.WORD_START.finditer(label):
+                keys.append(label[match.start():])
+                option_indices.append(i)
+            for alias in (aliases[i] if aliases is not None else ()):
+                keys.append(str(alias).lower())
+                option_indices.append(i)
+        keys = np.array(keys, dtype=object)
+        order = np.argsort(keys, kind='stable')
+        return cls(options, keys[order], np.array(option_indices, dtype=np.int64)[order],
+                   np.asarray(weights, dtype=np.int64))
+
+    def search(self, q, limit=20):
+        """The limit highest ranked options with a word starting with q"""
+        q = (q or '').strip().lower()
+        if q:
+            start = np.searchsorted(self.keys, q, side='left')
+            end = np.searchsorted(self.keys, q + '\U0010ffff', side='left')
+            matches = np.unique(self.option_indices[start:end])
+        else:
+            matches = np.arange(len(self.options))
+        # ties keep the option order
+        ranked = matches[np.lexsort((matches, -self.weights[matches]))[:limit]]
+        return [self.options[i] for i in ranked]
@@ -1,15 +1,31 @@
+import gc
+import json
 import logging
+import multiprocessing
+import os
+import resource
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from fnmatch import fnmatch
+from hashlib import sha1
 from urllib.parse import urlencode
 
+from django import db
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db.models import QuerySet
+from django.db.models import QuerySet, Max, Count
 from django.http import QueryDict
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from elasticsearch_dsl import analyzer, tokenizer
 from haystack import indexes
-from typing import Dict, List
+from typing import Dict, Iterable, List
 
+from catalog.core.statistics import get_public_publications
 from citation.models import Publication, Platform, Sponsor, Tag, ModelDocumentation, Container, Author
 
 logger = logging.getLogger(__name__)
@@ -105,8 +121,9 @@ def bulk_index_update():
 #           Public Indices               #
 ##########################################
 
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import parallel_bulk, streaming_bulk
 from elasticsearch_dsl import DocType, connections, InnerDoc, aggs, query
+from elasticsearch_dsl.response import Response
 import elasticsearch_dsl as edsl
 
 ALL_DATA_FIELD = 'all_data'
@@ -117,18 +134,18 @@ class AuthorInnerDoc(InnerDoc):
     orcid = edsl.Keyword()
     researcherid = edsl.Keyword()
     email = edsl.Keyword()
-    name = edsl.Text(copy_to=ALL_DATA_FIELD)
+    name = edsl.Text(copy_to=ALL_DATA_FIELD, fields={'raw': edsl.Keyword()})
 
 
 class ContainerInnerDoc(InnerDoc):
     id = edsl.Integer(required=True)
-    name = edsl.Text(copy_to=ALL_DATA_FIELD)
+    name = edsl.Text(copy_to=ALL_DATA_FIELD, fields={'raw': edsl.Keyword()})
     issn = edsl.Keyword()
 
 
 class RelatedInnerDoc(InnerDoc):
     id = edsl.Integer(required=True)
-    name = edsl.Text(copy_to=ALL_DATA_FIELD)
+    name = edsl.Text(copy_to=ALL_DATA_FIELD, fields={'raw': edsl.Keyword()})
 
 
 def normalize_search_querydict(qd: QueryDict):
@@ -149,6 +166,20 @@ class TopHits:
         return iter(self.iterable)
 
 
+def facet_value(id, name):
+    return '{}|{}'.format(id, name)
+
+
+def parse_facet_value(value):
+    id, name = value.split('|', 1)
+    return int(id), name
+
+
+def author_name(given_name, family_name):
+    """Full name of an author leaving out missing name parts"""
+    return ' '.join(name for name in (given_name, family_name) if name)
+
+
 class AbstractAgg:
     def __init__(self, name):
         self.name = name
@@ -208,6 +239,32 @@ class NestedAgg(AbstractAgg):
         return results
 
 
+class FacetAgg(AbstractAgg):
+    """
+    Terms aggregation over a keyword field holding 'id|name' for each related entity
+
+    Bucket keys contain the names so no top hit has to be fetched for each bucket
+    """
+    def __init__(self, name, size=10, shard_size=50):
+        super().__init__(name)
+        self.size = size
+        self.shard_size = shard_size
+
+    @property
+    def field(self):
+        return '{}_facet'.format(self.name)
+
+    def count(self, search):
+        search.aggs.bucket(self.field, aggs.Terms(field=self.field, size=self.size, shard_size=self.shard_size))
+
+    def extract_count(self, response, ids):
+        results = []
+        for bucket in response.aggs[self.field].buckets:
+            id, name = parse_facet_value(bucket.key)
+            results.append({'id': id, 'name': name, 'publication_count': bucket.doc_count, 'checked': id in ids})
+        return results
+
+
 class FilterQuery:
     def __init__(self, name):
         self.field = '{}.id'.format(name)
@@ -233,6 +290,15 @@ class PublicationDocSearch:
     TAG_FIELD_NAME = 'tags'
 
     aggs = {
+        AUTHOR_FIELD_NAME: FacetAgg(AUTHOR_FIELD_NAME),
+        CONTAINER_FIELD_NAME: FacetAgg(CONTAINER_FIELD_NAME),
+        PLATFORM_FIELD_NAME: FacetAgg(PLATFORM_FIELD_NAME),
+        SPONSOR_FIELD_NAME: FacetAgg(SPONSOR_FIELD_NAME),
+        TAG_FIELD_NAME: FacetAgg(TAG_FIELD_NAME)
+    }
+
+    # slower aggregations reading names from a top hit, for indices built without the facet fields
+    top_hits_aggs = {
         AUTHOR_FIELD_NAME: NestedAgg(AUTHOR_FIELD_NAME),
         CONTAINER_FIELD_NAME: UnnestedAgg(CONTAINER_FIELD_NAME),
         PLATFORM_FIELD_NAME: NestedAgg(PLATFORM_FIELD_NAME),
@@ -248,9 +314,11 @@ class PublicationDocSearch:
         TAG_FIELD_NAME: NestedFilterQuery(TAG_FIELD_NAME)
     }
 
-    def __init__(self, search=None, cache=None):
+    def __init__(self, search=None, cache=None, aggs=None):
         self.search = PublicationDoc.search() if search is None else search
         self.cache = {} if cache is None else cache
+        if aggs is not None:
+            self.aggs = aggs
 
     def __getitem__(self, val):
         return PublicationDocSearch(self.search[val])
@@ -270,13 +338,17 @@ class PublicationDocSearch:
         logger.info('filters: %s', facet_filters)
         queries = self._filter(facet_filters)
         full_text = self._full_text(q) if q else query.MatchAll()
+        # ids break ties so that every result has a unique position to resume search_after pagination from
         if queries:
             return PublicationDocSearch(self.search.query(
-                query.Bool(should=queries, must=[full_text], minimum_should_match=1)))
+                query.Bool(should=queries, must=[full_text], minimum_should_match=1)).sort('_score', 'id'))
         elif q:
-            return PublicationDocSearch(self.search.query(full_text))
+            return PublicationDocSearch(self.search.query(full_text).sort('_score', 'id'))
         else:
-            return PublicationDocSearch(self.search.sort('-date_published'))
+            return PublicationDocSearch(self.search.sort('-date_published', 'id'))
+
+    def search_after(self, sort_values):
+        return PublicationDocSearch(self.search.extra(search_after=list(sort_values)))
 
     def source(self, fields=None, **kwargs):
         return PublicationDocSearch(self.search.source(fields=fields, **kwargs))
@@ -284,11 +356,12 @@ class PublicationDocSearch:
     def scan(self):
         return self.search.scan()
 
-    def agg_by_count(self):
+    def agg_by_count(self, top_hits=False):
         s = self.search._clone()
-        for agg in self.aggs.values():
+        aggs = self.top_hits_aggs if top_hits else self.aggs
+        for agg in aggs.values():
             agg.count(s)
-        return PublicationDocSearch(s)
+        return PublicationDocSearch(s, aggs=aggs)
 
     @classmethod
     def get_filter_field_names(cls):
@@ -304,13 +377,278 @@ class PublicationDocSearch:
         return response
 
 
-class PublicationDoc(DocType):
+class AliasedDocType(DocType):
+    """Document type whose index name is an alias for timestamped index generations"""
+
+    @classmethod
+    def _matches(cls, hit):
+        # hits report the concrete index generation they were read from
+        index_name = hit.get('_index', '')
+        alias = cls._index._name
+        return (index_name == alias or fnmatch(index_name, '{}-*'.format(alias))) \
+            and cls._doc_type.name == hit.get('_type')
+
+
+##########################################
+#          Search Result Cache           #
+##########################################
+
+SEARCH_INDEX_GENERATION_CACHE_KEY = 'search_index_generation'
+
+
+def get_search_index_generation():
+    """Token that changes whenever the contents of the public indices change"""
+    generation = cache.get(SEARCH_INDEX_GENERATION_CACHE_KEY)
+    if generation is None:
+        generation = bump_search_index_generation()
+    return generation
+
+
+def bump_search_index_generation():
+    generation = '{:f}'.format(time.time())
+    cache.set(SEARCH_INDEX_GENERATION_CACHE_KEY, generation, timeout=None)
+    return generation
+
+
+class CachedPublicationDocSearch:
+    """
+    Cache of publication search results keyed by the normalized search, filters and page
+
+    Pages of hits and facet counts are cached separately so paging through the results of a search reuses its
+    facets. Keys include the index generation so results are invalidated whenever the indices change.
+    """
+
+    def __init__(self, search: str, facet_filters: Dict[str, set], timeout=None):
+        self.search = search.strip()
+        self.facet_filters = facet_filters
+        self.timeout = settings.PUBLIC_SEARCH_CACHE_TIMEOUT if timeout is None else timeout
+        self.generation = get_search_index_generation()
+
+    def _make_key(self, kind, *args):
+        filters = {name: sorted(ids) for name, ids in self.facet_filters.items() if ids}
+        normalized = json.dumps([self.search, filters] + list(args), sort_keys=True)
+        return 'public_search:{}:{}:{}'.format(kind, self.generation, sha1(normalized.encode()).hexdigest())
+
+    def _find(self):
+        return PublicationDocSearch().find(q=self.search, facet_filters=self.facet_filters)
+
+    def get_facets(self):
+        key = self._make_key('facets')
+        facets = cache.get(key)
+        if facets is None:
+            publication_query = self._find()[:0].agg_by_count()
+            publication_query.execute(facet_filters=self.facet_filters)
+            facets = publication_query.cache
+            cache.set(key, facets, timeout=self.timeout)
+        return facets
+
+    def execute(self, start, stop, search_after=None):
+        """
+        Return the response for the hits from start to stop and the facet counts
+
+        If search_after sort values are given start and stop are relative to the hit with those sort values
+        """
+        hits_key = self._make_key('hits', start, stop, search_after)
+        facets_key = self._make_key('facets')
+        cached = cache.get_many([hits_key, facets_key])
+        publication_query = self._find()
+        if search_after is not None:
+            publication_query = publication_query.search_after(search_after)
+        publication_query = publication_query[start:stop]
+        raw_response = cached.get(hits_key)
+        facets = cached.get(facets_key)
+        if raw_response is None:
+            if facets is None:
+                publication_query = publication_query.agg_by_count()
+            response = publication_query.execute(facet_filters=self.facet_filters)
+            raw_response = dict(response.to_dict())
+            raw_response.pop('aggregations', None)
+            values = {hits_key: raw_response}
+            if facets is None:
+                facets = publication_query.cache
+                values[facets_key] = facets
+            cache.set_many(values, timeout=self.timeout)
+        elif facets is None:
+            facets = self.get_facets()
+        return Response(publication_query.search, raw_response), facets
+
+
+##########################################
+#       Visualization Aggregations       #
+##########################################
+
+# lookups every document of the public publication index satisfies
+PUBLIC_PUBLICATION_CRITERIA = {'is_primary': True, 'status': 'REVIEWED'}
+
+# document fields matched by the name lookups of visualization filter criteria and the nested path they live under
+VISUALIZATION_NAME_FIELDS = {
+    'authors__name': ('authors.name.raw', 'authors'),
+    'container__name': ('container.name.raw', None),
+    'model_documentation__name': ('model_documentation', None),
+    'platforms__name': ('platforms.name.raw', 'platforms'),
+    'sponsors__name': ('sponsors.name.raw', 'sponsors'),
+    'tags__name': ('tags.name.raw', 'tags'),
+}
+
+
+def visualization_filter_search(filter_criteria, search=None):
+    """
+    Restrict a publication search to the publications matching visualization filter criteria
+
+    Filter criteria are the queryset lookups kept in the session by the visualization views. The public indices only
+    contain reviewed primary publications so those lookups select either every document or none of them.
+    """
+    s = PublicationDoc.search() if search is None else search
+    for lookup, value in filter_criteria.items():
+        if lookup in PUBLIC_PUBLICATION_CRITERIA:
+            if value != PUBLIC_PUBLICATION_CRITERIA[lookup]:
+                s = s.query(query.MatchNone())
+        elif lookup == 'date_published__gte':
+            s = s.filter('range', date_published={'gte': value})
+        elif lookup == 'date_published__lte':
+            s = s.filter('range', date_published={'lte': value})
+        else:
+            field_lookup, _, operator = lookup.rpartition('__')
+            if operator not in ('in', 'exact'):
+                field_lookup, operator = lookup, 'exact'
+            if field_lookup not in VISUALIZATION_NAME_FIELDS:
+                raise ValueError('Unsupported visualization filter {}'.format(lookup))
+            field_name, path = VISUALIZATION_NAME_FIELDS[field_lookup]
+            q = query.Terms(**{field_name: list(value)}) if operator == 'in' else query.Term(**{field_name: value})
+            s = s.filter(query.Nested(path=path, query=q) if path else q)
+    return s
+
+
+class SearchResultSequence:
+    """
+    Window of search results that can be handed to a Django paginator
+
+    The window expected to be displayed is fetched together with the total count in a single request. Slices outside
+    of the window are fetched with another request.
+    """
+
+    def __init__(self, start=0, stop=10):
+        self._window = (start, stop)
+        self._count = None
+        self._items = None
+
+    def fetch(self, start, stop):
+        """Return the total count and the items from start to stop"""
+        raise NotImplementedError
+
+    def _load(self, start, stop):
+        self._count, self._items = self.fetch(start, stop)
+        self._window = (start, stop)
+
+    def count(self):
+        if self._count is None:
+            self._load(*self._window)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start, stop, _ = key.indices(self.count())
+        if start < self._window[0] or stop > self._window[1]:
+            self._load(start, stop)
+        offset = self._window[0]
+        return self._items[start - offset:stop - offset]
+
+
+class PublicationIdSequence(SearchResultSequence):
+    """Ids of the publications matching a search"""
+
+    def __init__(self, search, start=0, stop=10):
+        super().__init__(start=start, stop=stop)
+        self.search = search
+
+    def fetch(self, start, stop):
+        response = self.search.source(False)[start:stop].execute()
+        return response.hits.total, [int(hit.meta.id) for hit in response]
+
+
+class RelationAggregationSequence(SearchResultSequence):
+    """
+    Publication and code availability counts of the related entities of the publications matching a search
+
+    Entities are paged in facet key order with a composite aggregation so a window only returns its own buckets. The
+    after key ending each window is cached so the next window resumes from it instead of walking the buckets before
+    it again. The entity count comes from a cardinality aggregation and is approximate above the precision
+    threshold.
+    """
+    PRECISION_THRESHOLD = 40000
+    # buckets per request when walking to the start of a window without a cached after key
+    SEEK_SIZE = 1000
+
+    def __init__(self, search, field_name, start=0, stop=10):
+        super().__init__(start=start, stop=stop)
+        self.search = search
+        self.field_name = '{}_facet'.format(field_name)
+        self.generation = get_search_index_generation()
+
+    def _make_key(self, offset):
+        normalized = json.dumps([self.search.to_dict(), self.field_name, offset], sort_keys=True)
+        return 'relation_aggregation:{}:{}'.format(self.generation, sha1(normalized.encode()).hexdigest())
+
+    def _execute(self, size, after_key=None, with_count=False):
+        s = self.search[:0]
+        options = {} if after_key is None else {'after': after_key}
+        s.aggs.bucket('relations', 'composite', size=size,
+                      sources=[{'relation': {'terms': {'field': self.field_name}}}], **options) \
+            .metric('code_availability_count', 'sum', field='code_availability')
+        if with_count:
+            s.aggs.metric('relation_count', 'cardinality', field=self.field_name,
+                          precision_threshold=self.PRECISION_THRESHOLD)
+        return s.execute()
+
+    def _seek(self, start):
+        """After key of the bucket preceding start (None for the first bucket)"""
+        if start == 0:
+            return None
+        after_key = cache.get(self._make_key(start))
+        if after_key is not None:
+            return after_key
+        offset = 0
+        while offset < start:
+            relations = self._execute(min(start - offset, self.SEEK_SIZE), after_key).aggregations.relations
+            if not relations.buckets:
+                break
+            offset += len(relations.buckets)
+            after_key = relations.after_key.to_dict()
+        return after_key
+
+    def is_count_approximate(self):
+        return self.count() > self.PRECISION_THRESHOLD
+
+    def fetch(self, start, stop):
+        response = self._execute(max(stop - start, 1), self._seek(start), with_count=True)
+        aggregation = response.aggregations.relations
+        relations = []
+        for bucket in aggregation.buckets[:stop - start]:
+            ident, name = parse_facet_value(bucket.key.relation)
+            relations.append({
+                'id': ident,
+                'name': name,
+                'published_count': bucket.doc_count,
+                'code_availability_count': int(bucket.code_availability_count.value)
+            })
+        if 'after_key' in aggregation:
+            cache.set(self._make_key(start + len(relations)), aggregation.after_key.to_dict(),
+                      timeout=settings.PUBLIC_SEARCH_CACHE_TIMEOUT)
+        return response.aggregations.relation_count.value, relations
+
+
+class PublicationDoc(AliasedDocType):
     all_data = edsl.Text()
     id = edsl.Integer()
     title = edsl.Text(copy_to=ALL_DATA_FIELD)
     date_published = edsl.Date()
     last_modified = edsl.Date()
     code_archive_url = edsl.Keyword()
+    code_availability = edsl.Integer()
     doi = edsl.Keyword()
     contact_email = edsl.Keyword(copy_to=ALL_DATA_FIELD)
     container = edsl.Object(ContainerInnerDoc)
@@ -319,28 +657,119 @@ class PublicationDoc(DocType):
     platforms = edsl.Nested(RelatedInnerDoc)
     model_documentation = edsl.Keyword()
     authors = edsl.Nested(AuthorInnerDoc)
+    authors_facet = edsl.Keyword()
+    container_facet = edsl.Keyword()
+    platforms_facet = edsl.Keyword()
+    sponsors_facet = edsl.Keyword()
+    tags_facet = edsl.Keyword()
 
     @classmethod
     def from_instance(cls, publication):
+        def by_id(related):
+            # sorted in python so that prefetched relations are not queried again
+            return sorted(related.all(), key=lambda r: r.id)
+
         container = publication.container
+        tags = [RelatedInnerDoc(id=t.id, name=t.name) for t in by_id(publication.tags)]
+        sponsors = [RelatedInnerDoc(id=s.id, name=s.name) for s in by_id(publication.sponsors)]
+        platforms = [RelatedInnerDoc(id=p.id, name=p.name) for p in by_id(publication.platforms)]
+        authors = [AuthorInnerDoc(id=a.id, name=author_name(a.given_name, a.family_name), orcid=a.orcid,
+                                  researcherid=a.researcherid, email=a.email)
+                   for a in by_id(publication.creators)]
         doc = cls(meta={'id': publication.id},
                   id=publication.id,
                   title=publication.title,
                   date_published=publication.date_published,
                   last_modified=publication.date_modified,
                   code_archive_url=publication.code_archive_url,
+                  code_availability=int(bool(publication.code_archive_url)),
                   contact_email=publication.contact_email,
-                  container=ContainerInnerDoc(id=container.id, name=container.name, issn=container.issn),
+                  container=ContainerInnerDoc(id=container.id, name=container.name, issn=container.issn)
+                  if container is not None else None,
                   doi=publication.doi,
-                  tags=[RelatedInnerDoc(id=t.id, name=t.name) for t in publication.tags.all()],
-                  sponsors=[RelatedInnerDoc(id=s.id, name=s.name) for s in publication.sponsors.all()],
-                  platforms=[RelatedInnerDoc(id=p.id, name=p.name) for p in publication.platforms.all()],
-                  model_documentation=[md.name for md in publication.model_documentation.all()],
-                  authors=[
-                      AuthorInnerDoc(id=a.id, name=a.name, orcid=a.orcid, researcherid=a.researcherid, email=a.email)
-                      for a in publication.creators.all()])
+                  tags=tags,
+                  sponsors=sponsors,
+                  platforms=platforms,
+                  model_documentation=[md.name for md in by_id(publication.model_documentation)],
+                  authors=authors,
+                  authors_facet=[facet_value(a.id, a.name) for a in authors],
+                  container_facet=facet_value(container.id, container.name) if container is not None else None,
+                  platforms_facet=[facet_value(p.id, p.name) for p in platforms],
+                  sponsors_facet=[facet_value(s.id, s.name) for s in sponsors],
+                  tags_facet=[facet_value(t.id, t.name) for t in tags])
         return doc.to_dict(include_meta=True)
 
+    @classmethod
+    def bulk_from_ids(cls, publication_ids):
+        """
+        Build the bulk actions of many publications at once
+
+        Produces the same documents as from_instance but reads every relation with a single values query
+        (six queries in total) and builds the document sources as plain dictionaries. Relations are ordered by id in
+        both.
+        """
+        publications = Publication.objects.filter(pk__in=publication_ids)
+        related = {}
+
+        def related_values(relation_name, *fields):
+            values = {}
+            rows = publications.values_list('id', *('{}__{}'.format(relation_name, field) for field in fields)) \
+                .order_by('id', '{}__id'.format(relation_name))
+            for row in rows:
+                # publications without any related rows come back once with nulls from the outer join
+                if row[1] is not None:
+                    values.setdefault(row[0], []).append(row[1:])
+            return values
+
+        related['tags'] = related_values('tags', 'id', 'name')
+        related['sponsors'] = related_values('sponsors', 'id', 'name')
+        related['platforms'] = related_values('platforms', 'id', 'name')
+        related['model_documentation'] = related_values('model_documentation', 'name')
+        related['authors'] = related_values('creators', 'id', 'given_name', 'family_name', 'orcid', 'researcherid',
+                                            'email')
+
+        def without_empty(d):
+            return {k: v for k, v in d.items() if v not in ([], {}, None)}
+
+        index_name = cls._index._name
+        doc_type_name = cls._doc_type.name
+        actions = []
+        for p in publications.values('id', 'title', 'date_published', 'date_modified', 'code_archive_url',
+                                     'contact_email', 'doi', 'container__id', 'container__name', 'container__issn'):
+            pk = p['id']
+            tags = [{'id': t_id, 'name': name} for t_id, name in related['tags'].get(pk, [])]
+            sponsors = [{'id': s_id, 'name': name} for s_id, name in related['sponsors'].get(pk, [])]
+            platforms = [{'id': p_id, 'name': name} for p_id, name in related['platforms'].get(pk, [])]
+            authors = [
+                without_empty({'id': a_id, 'name': author_name(given_name, family_name), 'orcid': orcid,
+                               'researcherid': researcherid, 'email': email})
+                for a_id, given_name, family_name, orcid, researcherid, email in related['authors'].get(pk, [])]
+            source = without_empty({
+                'id': pk,
+                'title': p['title'],
+                'date_published': p['date_published'],
+                'last_modified': p['date_modified'],
+                'code_archive_url': p['code_archive_url'],
+                'code_availability': int(bool(p['code_archive_url'])),
+                'contact_email': p['contact_email'],
+                'container': without_empty({'id': p['container__id'], 'name': p['container__name'],
+                                            'issn': p['container__issn']}),
+                'doi': p['doi'],
+                'tags': tags,
+                'sponsors': sponsors,
+                'platforms': platforms,
+                'model_documentation': [name for (name,) in related['model_documentation'].get(pk, [])],
+                'authors': authors,
+                'authors_facet': [facet_value(a['id'], a['name']) for a in authors],
+                'container_facet': facet_value(p['container__id'], p['container__name'])
+                if p['container__id'] is not None else None,
+                'platforms_facet': [facet_value(r['id'], r['name']) for r in platforms],
+                'sponsors_facet': [facet_value(r['id'], r['name']) for r in sponsors],
+                'tags_facet': [facet_value(r['id'], r['name']) for r in tags],
+            })
+            actions.append({'_id': pk, '_index': index_name, '_type': doc_type_name, '_source': source})
+        return actions
+
     def get_public_detail_url(self):
         return reverse('core:public-publication-detail', kwargs={'pk': self.meta.id})
 
@@ -393,7 +822,7 @@ def get_search_index(model):
         raise ValidationError(_('Invalid model_name'), code='invalid')
 
 
-class AuthorDoc(DocType):
+class AuthorDoc(AliasedDocType):
     id = edsl.Integer(required=True)
     orcid = edsl.Keyword()
     researcherid = edsl.Keyword()
@@ -401,6 +830,7 @@ class AuthorDoc(DocType):
     name = edsl.Text(copy_to=ALL_DATA_FIELD,
                      analyzer=autocomplete_analyzer,
                      search_analyzer='standard')
+    publication_count = edsl.Integer()
 
     @classmethod
     def from_instance(cls, author):
@@ -409,7 +839,8 @@ class AuthorDoc(DocType):
                   orcid = author.orcid,
                   researcherid = author.researcherid,
                   email = author.email,
-                  name = author.name)
+                  name = author.name,
+                  publication_count = getattr(author, 'publication_count', None))
         return doc.to_dict(include_meta=True)
 
     class Index:
@@ -435,72 +866,588 @@ class ContainerDoc(DocType):
         name = 'container'
 
 
-class PlatformDoc(DocType):
+class PlatformDoc(AliasedDocType):
     id = edsl.Integer(required=True)
     name = edsl.Text(copy_to=ALL_DATA_FIELD,
                      analyzer=autocomplete_analyzer,
                      search_analyzer='standard')
+    publication_count = edsl.Integer()
 
     @classmethod
     def from_instance(cls, instance):
         doc = cls(meta = {'id': instance.id},
                   id = instance.id,
-                  name = instance.name)
+                  name = instance.name,
+                  publication_count = getattr(instance, 'publication_count', None))
         return doc.to_dict(include_meta=True)
 
     class Index:
         name = 'platform'
 
 
-class SponsorDoc(DocType):
+class SponsorDoc(AliasedDocType):
     id = edsl.Integer(required=True)
     name = edsl.Text(copy_to=ALL_DATA_FIELD,
                      analyzer=autocomplete_analyzer,
                      search_analyzer='standard')
+    publication_count = edsl.Integer()
 
     @classmethod
     def from_instance(cls, instance):
         doc = cls(meta = {'id': instance.id},
                   id = instance.id,
-                  name = instance.name)
+                  name = instance.name,
+                  publication_count = getattr(instance, 'publication_count', None))
         return doc.to_dict(include_meta=True)
 
     class Index:
         name = 'sponsor'
 
 
-class TagDoc(DocType):
+class TagDoc(AliasedDocType):
     id = edsl.Integer(required=True)
     name = edsl.Text(copy_to=ALL_DATA_FIELD)
+    publication_count = edsl.Integer()
 
     @classmethod
     def from_instance(cls, instance):
         doc = cls(meta={'id': instance.id},
                   id = instance.id,
-                  name = instance.name)
+                  name = instance.name,
+                  publication_count = getattr(instance, 'publication_count', None))
         return doc.to_dict(include_meta=True)
 
     class Index:
         name = 'tag'
 
 
-def bulk_index_public():
-    public_publications = Publication.api.primary().filter(status='REVIEWED')
-    PublicationDoc.init()
-    AuthorDoc.init()
-    PlatformDoc.init()
-    SponsorDoc.init()
-    TagDoc.init()
-    logger.info('creating publication index')
+##########################################
+#        Parallel Bulk Indexing          #
+##########################################
+
+class BulkIndexSource:
+    """
+    Model instances backing a public document type
+
+    The population to index is split into primary key ranges so that each range can be streamed and bulk loaded by
+    a separate worker process
+    """
+
+    def __init__(self, doc_type, model, select_related=(), prefetch_related=()):
+        self.doc_type = doc_type
+        self.model = model
+        self.select_related = select_related
+        self.prefetch_related = prefetch_related
+
+    @property
+    def name(self):
+        return self.doc_type._index._name
+
+    def get_queryset(self) -> QuerySet:
+        public_publications = get_public_publications()
+        if self.model is Publication:
+            return public_publications
+        return self.model.objects.filter(publications__in=public_publications)
+
+    def count(self):
+        return self.get_queryset().values('pk').distinct().count()
+
+    def iter_pks(self, chunk_size):
+        """Stream the sorted primary keys to index from a server side cursor"""
+        return self.get_queryset().order_by('pk').values_list('pk', flat=True).distinct().iterator(
+            chunk_size=chunk_size)
+
+    def hydrate(self, pks):
+        return self.model.objects.filter(pk__in=pks) \
+            .select_related(*self.select_related) \
+            .prefetch_related(*self.prefetch_related) \
+            .order_by('pk')
+
+    def documents(self, pks):
+        # prefetches are ignored by QuerySet.iterator so instances are hydrated a chunk at a time instead
+        return (self.doc_type.from_instance(instance) for instance in self.hydrate(pks))
+
+    def actions(self, start_pk, end_pk, chunk_size, max_memory_mb=None, index=None, progress=None):
+        """
+        Bulk actions for the instances with primary keys in [start_pk, end_pk]
+
+        Stops early once the worker is above max_memory_mb, recording the first primary key left to index as
+        progress['resume_pk'] so that the rest of the range can be handed to a fresh worker
+        """
+        queryset = self.get_queryset().filter(pk__gte=start_pk, pk__lte=end_pk)
+        for pks in iter_pk_chunks(queryset, chunk_size):
+            for action in deduplicate_actions(self.documents(pks)):
+                if index is not None:
+                    action['_index'] = index
+                yield action
+            if pks[-1] < end_pk and check_memory_ceiling(max_memory_mb):
+                if progress is not None:
+                    progress['resume_pk'] = pks[-1] + 1
+                return
+
+
+class PublicationBulkIndexSource(BulkIndexSource):
+    def __init__(self):
+        super().__init__(PublicationDoc, Publication)
+
+    def documents(self, pks):
+        return PublicationDoc.bulk_from_ids(pks)
+
+
+class RelatedBulkIndexSource(BulkIndexSource):
+    """Source for models related to publications, annotated with their public publication count"""
+
+    def hydrate(self, pks):
+        # the count reuses the join to public publications so every instance is returned once with its count
+        return self.get_queryset().filter(pk__in=pks) \
+            .annotate(publication_count=Count('publications')) \
+            .order_by('pk')
+
+
+def get_bulk_index_sources():
+    sources = [
+        RelatedBulkIndexSource(AuthorDoc, Author),
+        RelatedBulkIndexSource(PlatformDoc, Platform),
+        RelatedBulkIndexSource(SponsorDoc, Sponsor),
+        RelatedBulkIndexSource(TagDoc, Tag),
+        PublicationBulkIndexSource(),
+    ]
+    return OrderedDict((source.name, source) for source in sources)
+
+
+def iter_pk_chunks(queryset: QuerySet, chunk_size):
+    """Stream primary keys from a server side cursor in lists of at most chunk_size"""
+    chunk = []
+    for pk in queryset.order_by('pk').values_list('pk', flat=True).distinct().iterator(chunk_size=chunk_size):
+        chunk.append(pk)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def deduplicate_actions(actions):
+    """Drop bulk actions targeting a document that an earlier action already targeted"""
+    seen = set()
+    for action in actions:
+        key = (action['_index'], action['_id'])
+        if key not in seen:
+            seen.add(key)
+            yield action
+
+
+def split_pk_ranges(pks: Iterable[int], range_size):
+    """Split sorted primary keys into inclusive (start, end) ranges of at most range_size keys as they stream in"""
+    start_pk = end_pk = None
+    n_pks = 0
+    for pk in pks:
+        if n_pks == 0:
+            start_pk = pk
+        end_pk = pk
+        n_pks += 1
+        if n_pks == range_size:
+            yield start_pk, end_pk
+            n_pks = 0
+    if n_pks:
+        yield start_pk, end_pk
+
+
+def get_resident_memory_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * resource.getpagesize() / 2 ** 20
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def check_memory_ceiling(max_memory_mb):
+    """
+    Release what the worker can when it is above the memory ceiling
+
+    :return: whether the worker is still above the ceiling and should hand the rest of its range to a new worker
+    """
+    if max_memory_mb is None or get_resident_memory_mb() <= max_memory_mb:
+        return False
+    db.reset_queries()
+    gc.collect()
+    resident_memory_mb = get_resident_memory_mb()
+    if resident_memory_mb <= max_memory_mb:
+        return False
+    logger.warning('indexing worker %s using %.0fMB, above the %dMB ceiling, stopping early',
+                   os.getpid(), resident_memory_mb, max_memory_mb)
+    return True
+
+
+def _init_bulk_index_worker():
+    # connections inherited from the parent process cannot be shared so every worker opens its own
+    db.connections.close_all()
+    connections.create_connection(alias='default', **settings.ELASTICSEARCH['default'])
+
+
+def _bulk_index_pk_range(task):
+    """
+    Index a primary key range of a source
+
+    :return: source name, documents indexed, start and end times and the task indexing the rest of the range if the
+    worker stopped at the memory ceiling
+    """
+    source_name, start_pk, end_pk, options = task
+    source = get_bulk_index_sources()[source_name]
+    client = connections.get_connection()
+    started = time.time()
+    n_indexed = 0
+    progress = {}
+    actions = source.actions(start_pk, end_pk,
+                             chunk_size=options['chunk_size'], max_memory_mb=options['max_memory_mb'],
+                             index=options['index_names'].get(source_name), progress=progress)
+    for ok, info in parallel_bulk(client=client, actions=actions,
+                                  thread_count=options['thread_count'],
+                                  chunk_size=options['chunk_size'],
+                                  queue_size=options['queue_size']):
+        if ok:
+            n_indexed += 1
+        else:
+            logger.error('failed to index %s document: %s', source_name, info)
+    remaining_task = None
+    if 'resume_pk' in progress:
+        remaining_task = (source_name, progress['resume_pk'], end_pk, options)
+    return source_name, n_indexed, started, time.time(), remaining_task
+
+
+##########################################
+#           Index Generations            #
+##########################################
+
+# Each public document type is read through an alias (its Index name) pointing at a timestamped index generation.
+# Rebuilds load a new generation and then swap every alias over at once so searches never see a partial index.
+
+INDEX_GENERATION_TIMESTAMP_FORMAT = '%Y%m%d%H%M%S%f'
+INDEX_GENERATIONS_KEPT = 2
+
+
+def get_index_generation_names(alias):
+    client = connections.get_connection()
+    return sorted(client.indices.get(index='{}-*'.format(alias)).keys())
+
+
+def get_aliased_index_names(alias):
+    client = connections.get_connection()
+    if not client.indices.exists_alias(name=alias):
+        return []
+    return sorted(client.indices.get_alias(name=alias).keys())
+
+
+def create_index_generation(doc_type):
+    """Create an empty index generation tuned for bulk loading and return its name"""
+    alias = doc_type._index._name
+    # generations sort by their creation time, the random suffix keeps concurrent rebuilds from colliding
+    name = '{}-{}-{}'.format(alias, timezone.now().strftime(INDEX_GENERATION_TIMESTAMP_FORMAT), uuid.uuid4().hex[:8])
+    index = doc_type._index.clone(name=name)
+    index.settings(number_of_replicas=0, refresh_interval='-1')
+    index.create()
+    return name
+
+
+def finalize_index_generation(doc_type, name):
+    """Restore the search settings of a bulk loaded index generation and merge its segments"""
+    client = connections.get_connection()
+    number_of_replicas = doc_type._index._settings.get('number_of_replicas', 1)
+    client.indices.put_settings(index=name, body={
+        'index': {'refresh_interval': None, 'number_of_replicas': number_of_replicas}})
+    client.indices.refresh(index=name)
+    client.indices.forcemerge(index=name, max_num_segments=1)
+
+
+def swap_index_aliases(index_names: Dict[str, str]):
+    """Point each alias at its index generation in a single atomic alias update"""
     client = connections.get_connection()
-    bulk(client=client,
-         actions=(AuthorDoc.from_instance(a) for a in Author.objects.filter(publications__in=public_publications)))
-    bulk(client=client,
-         actions=(PlatformDoc.from_instance(p) for p in Platform.objects.filter(publications__in=public_publications)))
-    bulk(client=client,
-         actions=(SponsorDoc.from_instance(s) for s in Sponsor.objects.filter(publications__in=public_publications)))
-    bulk(client=client,
-         actions=(TagDoc.from_instance(t) for t in Tag.objects.filter(publications__in=public_publications)))
-    bulk(client=client,
-         actions=(PublicationDoc.from_instance(p) for p in public_publications.select_related('container') \
-         .prefetch_related('tags', 'sponsors', 'platforms', 'creators', 'model_documentation').iterator()))
+    actions = []
+    for alias, name in index_names.items():
+        if not client.indices.exists_alias(name=alias) and client.indices.exists(index=alias):
+            # the concrete index is deleted in the same update so that the name always resolves to an index
+            logger.warning('deleting index %s so that it can be replaced by an alias', alias)
+            actions.append({'remove_index': {'index': alias}})
+        actions.extend({'remove': {'index': old_name, 'alias': alias}} for old_name in get_aliased_index_names(alias))
+        actions.append({'add': {'index': name, 'alias': alias}})
+    client.indices.update_aliases(body={'actions': actions})
+    bump_search_index_generation()
+    logger.info('aliases now point to %s', ', '.join(index_names.values()))
+
+
+def prune_index_generations(alias, keep=INDEX_GENERATIONS_KEPT):
+    """Delete all but the newest index generations, never deleting the generation currently aliased"""
+    client = connections.get_connection()
+    aliased_names = set(get_aliased_index_names(alias))
+    for name in get_index_generation_names(alias)[:-keep]:
+        if name not in aliased_names:
+            logger.info('deleting index generation %s', name)
+            client.indices.delete(index=name)
+
+
+def rollback_public_indices():
+    """Point every public alias back at the index generation preceding the current one"""
+    index_names = {}
+    for alias in get_bulk_index_sources():
+        aliased_names = get_aliased_index_names(alias)
+        previous_names = [name for name in get_index_generation_names(alias)
+                          if aliased_names and name < aliased_names[0]]
+        if not previous_names:
+            raise ValueError('No previous index generation of {} to roll back to'.format(alias))
+        index_names[alias] = previous_names[-1]
+    swap_index_aliases(index_names)
+    return index_names
+
+
+def bulk_index_public(processes=None, thread_count=2, chunk_size=500, queue_size=4, max_memory_mb=None,
+                      in_place=False):
+    """
+    Rebuild the public elasticsearch indices with a pool of worker processes
+
+    By default every index is built as a new generation and the aliases are swapped over once all of them are loaded
+
+    :param processes: number of worker processes (defaults to the number of CPUs)
+    :param thread_count: number of parallel_bulk threads per worker
+    :param chunk_size: documents per database fetch and per bulk request
+    :param queue_size: bulk requests buffered per worker, bounds in flight documents with chunk_size
+    :param max_memory_mb: resident memory ceiling per worker, a worker above it after a chunk stops and the rest of
+        its range is queued for a fresh worker
+    :param in_place: write into the existing indices instead of building new generations
+    :return: dictionary of documents indexed and documents per second by index name
+    """
+    processes = processes or os.cpu_count() or 1
+    high_water_mark = Publication.objects.aggregate(last_modified=Max('date_modified'))['last_modified']
+    sources = get_bulk_index_sources()
+    index_names = {}
+    for name, source in sources.items():
+        if in_place:
+            source.doc_type.init()
+        else:
+            index_names[name] = create_index_generation(source.doc_type)
+    options = dict(thread_count=thread_count, chunk_size=chunk_size, queue_size=queue_size,
+                   max_memory_mb=max_memory_mb, index_names=index_names)
+    tasks = []
+    for name, source in sources.items():
+        range_size = max(chunk_size, -(-source.count() // (processes * 4)))
+        tasks.extend((name, start_pk, end_pk, options)
+                     for start_pk, end_pk in split_pk_ranges(source.iter_pks(chunk_size), range_size))
+    logger.info('indexing %s in %d primary key ranges with %d processes', ', '.join(sources), len(tasks), processes)
+
+    db.connections.close_all()
+    counts = Counter()
+    intervals = {}
+    # workers are replaced after each primary key range to return memory to the OS
+    with multiprocessing.Pool(processes=processes, initializer=_init_bulk_index_worker, maxtasksperchild=1) as pool:
+        pending = [pool.apply_async(_bulk_index_pk_range, (task,)) for task in tasks]
+        while pending:
+            name, n_indexed, started, finished, remaining_task = pending.pop(0).get()
+            if remaining_task is not None:
+                pending.append(pool.apply_async(_bulk_index_pk_range, (remaining_task,)))
+            counts[name] += n_indexed
+            first_started, last_finished = intervals.get(name, (started, finished))
+            intervals[name] = (min(first_started, started), max(last_finished, finished))
+
+    if index_names:
+        for name, source in sources.items():
+            finalize_index_generation(source.doc_type, index_names[name])
+        swap_index_aliases(index_names)
+        for name in sources:
+            prune_index_generations(name)
+    # changes synced while the rebuild was running may not be in the new generation so they are synced again
+    set_sync_high_water_mark(high_water_mark)
+
+    stats = {}
+    for name in sources:
+        started, finished = intervals.get(name, (0, 0))
+        elapsed = finished - started
+        docs_per_second = counts[name] / elapsed if elapsed > 0 else 0.0
+        stats[name] = {'count': counts[name], 'docs_per_second': docs_per_second}
+        logger.info('indexed %d %s documents (%.1f docs/sec)', counts[name], name, docs_per_second)
+    return stats
+
+
+##########################################
+#        Incremental Index Updates       #
+##########################################
+
+SYNC_HIGH_WATER_MARK_CACHE_KEY = 'search_index_sync_high_water_mark'
+SYNC_RECENT_CHANGES_CACHE_KEY = 'search_index_sync_recent_changes'
+# publications saved in a transaction that commits after a sync can have a date_modified older than the high
+# water mark so every sync looks back a little further than the last change it saw, skipping the (pk,
+# date_modified) changes in that window it already synced
+SYNC_OVERLAP = timedelta(minutes=1)
+
+RELATED_DOC_FIELD_NAMES = OrderedDict([
+    ('author', ('authors', 'creators')),
+    ('platform', ('platforms', 'platforms')),
+    ('sponsor', ('sponsors', 'sponsors')),
+    ('tag', ('tags', 'tags')),
+])
+
+
+def get_sync_high_water_mark():
+    """
+    Return the last publication modification date synced to the public indices
+
+    Falls back to the latest last_modified in the publication index if the high water mark has not been persisted
+    """
+    high_water_mark = cache.get(SYNC_HIGH_WATER_MARK_CACHE_KEY)
+    if high_water_mark is None and PublicationDoc._index.exists():
+        search = PublicationDoc.search()[:0]
+        search.aggs.metric('last_modified', 'max', field='last_modified')
+        value = search.execute().aggregations.last_modified.value
+        if value is not None:
+            high_water_mark = datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+    return high_water_mark
+
+
+def set_sync_high_water_mark(high_water_mark, recent_changes=frozenset()):
+    """
+    Persist the high water mark and the (pk, date_modified) changes synced within SYNC_OVERLAP of it
+
+    Syncs look back SYNC_OVERLAP from the high water mark and skip recent_changes
+    """
+    cache.set_many({SYNC_HIGH_WATER_MARK_CACHE_KEY: high_water_mark,
+                    SYNC_RECENT_CHANGES_CACHE_KEY: recent_changes}, timeout=None)
+
+
+def get_recent_changes(changes, high_water_mark):
+    """(pk, date_modified) changes within SYNC_OVERLAP of the high water mark"""
+    return frozenset(change for change in changes if change[1] > high_water_mark - SYNC_OVERLAP)
+
+
+def _get_indexed_state(publication_ids):
+    """
+    Related ids and publication years of the currently indexed versions of publications
+
+    They are needed when relations are removed or publication dates change
+    """
+    related_ids = {name: set() for name in RELATED_DOC_FIELD_NAMES}
+    related_ids['container'] = set()
+    years = set()
+    if not publication_ids:
+        return related_ids, years
+    includes = ['{}.id'.format(field_name) for field_name, relation_name in RELATED_DOC_FIELD_NAMES.values()]
+    includes.extend(['container.id', 'date_published'])
+    docs = PublicationDoc.mget(list(publication_ids), missing='skip', _source=includes)
+    for doc in docs:
+        for name, (field_name, relation_name) in RELATED_DOC_FIELD_NAMES.items():
+            related_ids[name].update(related.id for related in getattr(doc, field_name, []))
+        if 'container' in doc:
+            related_ids['container'].add(doc.container.id)
+        if getattr(doc, 'date_published', None) is not None:
+            years.add(doc.date_published.year)
+    return related_ids, years
+
+
+def _get_related_ids_from_db(publication_ids):
+    related_ids = {}
+    publications = Publication.objects.filter(pk__in=publication_ids)
+    for name, (field_name, relation_name) in RELATED_DOC_FIELD_NAMES.items():
+        related_ids[name] = set(pk for pk in publications.values_list(relation_name, flat=True) if pk is not None)
+    return related_ids
+
+
+def _delete_action(source, pk):
+    return {'_op_type': 'delete', '_index': source.name, '_type': source.doc_type._doc_type.name, '_id': pk}
+
+
+def _index_actions(source, pks):
+    """Index actions for the public instances among pks and delete actions for the rest"""
+    public_pks = set(source.get_queryset().filter(pk__in=pks).values_list('pk', flat=True))
+    yield from source.documents(public_pks)
+    for pk in set(pks) - public_pks:
+        yield _delete_action(source, pk)
+
+
+def _bulk_sync(actions):
+    n_ok = 0
+    client = connections.get_connection()
+    for ok, info in streaming_bulk(client=client, actions=deduplicate_actions(actions), raise_on_error=False):
+        if ok:
+            n_ok += 1
+        else:
+            op_type, result = info.popitem()
+            # deleting documents that were never indexed is expected
+            if not (op_type == 'delete' and result.get('status') == 404):
+                logger.error('failed to sync document: %s', result)
+    return n_ok
+
+
+def sync_publications(publication_ids, on_synced=None):
+    """
+    Re-render the documents of publications and of everything related to them before or after their changes
+
+    :param on_synced: called with the publication ids, the ids of the entities they were related to keyed by
+        relation and the years they were published in before their changes once they are synced
+    """
+    sources = get_bulk_index_sources()
+    related_ids, previous_years = _get_indexed_state(publication_ids)
+    for name, ids in _get_related_ids_from_db(publication_ids).items():
+        related_ids[name].update(ids)
+    n_synced = _bulk_sync(_index_actions(sources[PublicationDoc._index._name], publication_ids))
+    for name in RELATED_DOC_FIELD_NAMES:
+        n_synced += _bulk_sync(_index_actions(sources[name], related_ids[name]))
+    if n_synced:
+        bump_search_index_generation()
+    if on_synced is not None:
+        previous_related_ids = {field_name: related_ids[name]
+                                for name, (field_name, _) in RELATED_DOC_FIELD_NAMES.items()}
+        previous_related_ids['container'] = related_ids['container']
+        on_synced(publication_ids, previous_related_ids, previous_years)
+    return n_synced
+
+
+def sync_public_indices(batch_size=500, on_synced=None):
+    """
+    Sync publications modified since the high water mark to the public indices in batches
+
+    Changes already synced by an earlier call are skipped so polling only syncs (and invalidates cached search
+    results) when publications actually changed. Without a high water mark or a publication index nothing has been
+    synced yet so the indices are rebuilt in bulk instead.
+
+    :param on_synced: called after each batch as described in sync_publications, and with None as the publication
+        ids after a bulk rebuild
+    :return: number of publications synced
+    """
+    high_water_mark = get_sync_high_water_mark()
+    if high_water_mark is None:
+        logger.info('no high water mark found, rebuilding the public indices')
+        stats = bulk_index_public()
+        if on_synced is not None:
+            on_synced(None, {}, set())
+        return stats[PublicationDoc._index._name]['count']
+    changed_publications = Publication.objects.filter(date_modified__gt=high_water_mark - SYNC_OVERLAP)
+    recent_changes = cache.get(SYNC_RECENT_CHANGES_CACHE_KEY, frozenset())
+    changes = [change for change in
+               changed_publications.order_by('date_modified', 'pk').values_list('pk', 'date_modified')
+               if change not in recent_changes]
+    for i in range(0, len(changes), batch_size):
+        batch = changes[i:i + batch_size]
+        sync_publications([pk for pk, date_modified in batch], on_synced=on_synced)
+        if batch[-1][1] > high_water_mark:
+            high_water_mark = batch[-1][1]
+        recent_changes = get_recent_changes(recent_changes.union(batch), high_water_mark)
+        set_sync_high_water_mark(high_water_mark, recent_changes)
+    if changes:
+        logger.info('synced %d publications modified up to %s', len(changes), high_water_mark)
+    return len(changes)
+
+
+def reconcile_deleted_publications(batch_size=500, on_synced=None):
+    """
+    Sync publications that are indexed but no longer exist in the database
+
+    Deletions leave no date_modified behind so they are found by comparing the ids in the index with the database
+
+    :param on_synced: called after each batch as described in sync_publications
+    """
+    indexed_ids = set(int(hit.meta.id) for hit in PublicationDoc.search().source(False).scan())
+    existing_ids = set(Publication.objects.filter(pk__in=indexed_ids).values_list('pk', flat=True))
+    deleted_ids = sorted(indexed_ids - existing_ids)
+    for i in range(0, len(deleted_ids), batch_size):
+        sync_publications(deleted_ids[i:i + batch_size], on_synced=on_synced)
+    if deleted_ids:
+        logger.info('removed %d deleted publications from the public indices', len(deleted_ids))
+    return len(deleted_ids)
@@ -0,0 +1,195 @@
+import logging
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Case, CharField, F, Q, Sum, Value as V, When
+from django.db.models.functions import Concat
+
+from catalog.core.models import PublicationYearStatistics
+from citation.models import Publication, Author, Container, ModelDocumentation, Platform, Sponsor, Tag
+
+logger = logging.getLogger(__name__)
+
+TOTAL_RELATION = 'publication'
+TOTAL_RELATED_ID = 0
+
+# publication lookups of the related entities statistics are kept for
+RELATION_LOOKUPS = OrderedDict([
+    ('authors', 'creators'),
+    ('container', 'container'),
+    ('model_documentation', 'model_documentation'),
+    ('platforms', 'platforms'),
+    ('sponsors', 'sponsors'),
+    ('tags', 'tags'),
+])
+
+RELATION_MODELS = {
+    'authors': Author,
+    'container': Container,
+    'model_documentation': ModelDocumentation,
+    'platforms': Platform,
+    'sponsors': Sponsor,
+    'tags': Tag,
+}
+
+STATISTIC_NAMES = ['publication_count', 'code_availability_count', 'odd_count', 'formal_description_count',
+                   'visual_documentation_count']
+
+ODD_DOCUMENTATION = 'ODD'
+FORMAL_DESCRIPTION_DOCUMENTATION = {'Source code', 'Pseudocode', 'Mathematical description'}
+VISUAL_DOCUMENTATION = {'UML', 'Flow Charts', 'AORML', 'Ontologies'}
+
+
+def get_public_publications():
+    return Publication.api.primary().filter(status='REVIEWED')
+
+
+def _get_publication_statistics(publications):
+    """
+    Year and statistic values (ordered as STATISTIC_NAMES) of every publication with a publication date
+
+    Code is available when the publication has a code archive url, as in the code_availability search field
+    """
+    statistics = {}
+    for pk, date_published, code_archive_url in publications.values_list('pk', 'date_published',
+                                                                          'code_archive_url'):
+        if date_published is not None:
+            statistics[pk] = (date_published.year, [1, int(bool(code_archive_url)), 0, 0, 0])
+    for pk, name in publications.filter(model_documentation__isnull=False) \
+            .values_list('pk', 'model_documentation__name'):
+        if pk in statistics:
+            values = statistics[pk][1]
+            values[2] |= name == ODD_DOCUMENTATION
+            values[3] |= name in FORMAL_DESCRIPTION_DOCUMENTATION
+            values[4] |= name in VISUAL_DOCUMENTATION
+    return statistics
+
+
+def _get_memberships(publications, relation, related_ids=None):
+    """Publication and related entity id pairs of a relation"""
+    if relation == TOTAL_RELATION:
+        return [(pk, TOTAL_RELATED_ID) for pk in publications.values_list('pk', flat=True)]
+    lookup = RELATION_LOOKUPS[relation]
+    if related_ids is not None:
+        publications = publications.filter(**{'{}__in'.format(lookup): related_ids})
+    return [(pk, related_id) for pk, related_id in publications.values_list('pk', lookup)
+            if related_id is not None and (related_ids is None or related_id in related_ids)]
+
+
+def _aggregate(memberships, publication_statistics):
+    rows = {}
+    for pk, related_id in memberships:
+        if pk not in publication_statistics:
+            continue
+        year, values = publication_statistics[pk]
+        counts = rows.setdefault((related_id, year), [0] * len(STATISTIC_NAMES))
+        for i, value in enumerate(values):
+            counts[i] += value
+    return rows
+
+
+def refresh_statistics(related_ids=None, years=None):
+    """
+    Recompute the yearly statistics of related entities
+
+    :param related_ids: ids of the entities to refresh keyed by relation. Everything is rebuilt when None
+    :param years: years to refresh, every year when None
+    :return: number of statistics rows written
+    """
+    publications = get_public_publications()
+    if years is not None:
+        publications = publications.filter(date_published__year__in=years)
+    if related_ids is None:
+        relations = [TOTAL_RELATION] + list(RELATION_LOOKUPS)
+    else:
+        relations = list(related_ids)
+    publication_statistics = _get_publication_statistics(publications)
+    n_rows = 0
+    with transaction.atomic():
+        for relation in relations:
+            ids = None if related_ids is None else set(related_ids[relation])
+            rows = _aggregate(_get_memberships(publications, relation, ids), publication_statistics)
+            stale = PublicationYearStatistics.objects.filter(relation=relation)
+            if ids is not None:
+                stale = stale.filter(related_id__in=ids)
+            if years is not None:
+                stale = stale.filter(year__in=years)
+            stale.delete()
+            PublicationYearStatistics.objects.bulk_create(
+                (PublicationYearStatistics(relation=relation, related_id=related_id, year=year,
+                                           **dict(zip(STATISTIC_NAMES, counts)))
+                 for (related_id, year), counts in rows.items()),
+                batch_size=1000)
+            n_rows += len(rows)
+    return n_rows
+
+
+def refresh_publication_statistics(publication_ids, previous_related_ids=None, previous_years=()):
+    """
+    Refresh the statistics of the entities related to publications before or after their changes
+
+    Only the years the publications were published in before or after their changes are refreshed. Totals and model
+    documentation (a handful of entities) are refreshed for those years since they can not be narrowed down from
+    previous versions of the publications.
+
+    :param previous_related_ids: ids of the entities the publications were related to keyed by relation
+    :param previous_years: years the publications were published in before their changes
+    """
+    previous_related_ids = previous_related_ids or {}
+    publications = Publication.objects.filter(pk__in=publication_ids)
+    years = set(previous_years)
+    years.update(date_published.year for date_published in publications.values_list('date_published', flat=True)
+                 if date_published is not None)
+    if not years:
+        return 0
+    related_ids = {}
+    for relation, lookup in RELATION_LOOKUPS.items():
+        related_ids[relation] = set(pk for pk in publications.values_list(lookup, flat=True) if pk is not None)
+        related_ids[relation].update(previous_related_ids.get(relation, ()))
+    related_ids['model_documentation'] = set(ModelDocumentation.objects.values_list('pk', flat=True))
+    related_ids[TOTAL_RELATION] = {TOTAL_RELATED_ID}
+    return refresh_statistics(related_ids, years=years)
+
+
+def author_full_name():
+    """Database expression of the full name of an author built like search_indexes.author_name"""
+    given_name_missing = Q(given_name__isnull=True) | Q(given_name='')
+    family_name_missing = Q(family_name__isnull=True) | Q(family_name='')
+    return Case(When(given_name_missing, then=F('family_name')),
+                When(family_name_missing, then=F('given_name')),
+                default=Concat('given_name', V(' '), 'family_name'), output_field=CharField())
+
+
+def get_related_ids(relation, name):
+    """Ids of the entities of a relation with a name"""
+    if relation == TOTAL_RELATION:
+        return [TOTAL_RELATED_ID]
+    model = RELATION_MODELS[relation]
+    if model is Author:
+        entities = Author.objects.annotate(full_name=author_full_name()).filter(full_name=name)
+    else:
+        entities = model.objects.filter(name=name)
+    return list(entities.values_list('pk', flat=True))
+
+
+def get_year_statistics(relation, related_ids, start_year=None, end_year=None):
+    """
+    Statistics summed over related entities for every year from start_year to end_year
+
+    Years default to the first and last years with publications
+
+    :return: list of dictionaries with a year and the STATISTIC_NAMES counts ordered by year
+    """
+    rows = PublicationYearStatistics.objects.filter(relation=relation, related_id__in=related_ids)
+    if start_year is not None:
+        rows = rows.filter(year__gte=start_year)
+    if end_year is not None:
+        rows = rows.filter(year__lte=end_year)
+    rows = rows.values('year').annotate(**{name + '_sum': Sum(name) for name in STATISTIC_NAMES}).order_by('year')
+    by_year = {row['year']: {name: row[name + '_sum'] for name in STATISTIC_NAMES} for row in rows}
+    if not by_year:
+        return []
+    start_year = min(by_year) if start_year is None else start_year
+    end_year = max(by_year) if end_year is None else end_year
+    empty = dict.fromkeys(STATISTIC_NAMES, 0)
+    return [dict(by_year.get(year, empty), year=year) for year in range(start_year, end_year + 1)]
@@ -0,0 +1,296 @@
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from citation.models import ModelDocumentation, Publication, PublicationTags, Tag
+from .common import BaseTest
+
+BOKEH_APP_DIR = os.path.join(settings.BASE_DIR, 'visualization', 'bokeh_example', 'visualization')
+
+
+def setUpModule():
+    # the app imports its modules as top level modules
+    sys.path.insert(0, BOKEH_APP_DIR)
+    global PublicationCountsOverTimeChart
+    from components.publication_counts_over_time import PublicationCountsOverTimeChart
+    global DataCache, VersionedDataCache, YearAxis, YearRelatedTensor, get_source_fingerprints
+    from data_access import DataCache, VersionedDataCache, YearAxis, YearRelatedTensor, get_source_fingerprints
+    global Query
+    from query import Query
+    global LRUCache, create_session_cache, drop_session_cache, session_caches
+    from query_cache import LRUCache, create_session_cache, drop_session_cache, session_caches
+    global MappedStringArray, save_frame, load_frame, save_snapshot, load_snapshot, prune_snapshots
+    from snapshot import MappedStringArray, save_frame, load_frame, save_snapshot, load_snapshot, prune_snapshots
+
+
+def tearDownModule():
+    sys.path.remove(BOKEH_APP_DIR)
+
+
+def create_data_cache():
+    publications = pd.DataFrame({
+        'container': pd.Categorical([1, 1, None, 2]),
+        'year_published': [2001.0, 2003.0, np.nan, 2003.0],
+        'is_archived': [True, False, True, True],
+        'has_odd': [True, True, False, False],
+        'has_visual_documentation': [False, True, False, False],
+        'has_formal_description': [False, False, False, True],
+    }, index=pd.Index([10, 20, 30, 40], name='publication__id'))
+    publication_tags = pd.DataFrame({'related__id': [1, 1, 2, 2, 2], 'name': ['abm', 'abm', 'ibm', 'ibm', 'ibm']},
+                                    index=pd.Index([10, 20, 20, 30, 40], name='publication__id'))
+    tags = pd.DataFrame({'name': ['abm', 'ibm']}, index=pd.Index([1, 2], name='id'))
+    return DataCache(tables={'publications': publications, 'publication_tags': publication_tags, 'tags': tags})
+
+
+class LoadPublicationsTest(BaseTest):
+    def test_load_publications(self):
+        container = self.create_container(name='Econometrica')
+        container.save()
+        documented = self.create_publication(title='A', added_by=self.user, container=container, status='REVIEWED',
+                                             is_primary=True, date_published=date(2010, 3, 1), is_archived=True)
+        documented.save()
+        for name in ['ODD', 'UML']:
+            Publication.model_documentation.through.objects.create(
+                publication=documented, model_documentation=ModelDocumentation.objects.create(name=name))
+        undated = self.create_publication(title='B', added_by=self.user, container=None, status='REVIEWED',
+                                          is_primary=True)
+        undated.save()
+        self.create_publication(title='C', added_by=self.user, container=container, status='UNREVIEWED',
+                                is_primary=True).save()
+
+        publications = DataCache().publications
+        self.assertEqual(sorted(publications.index), [documented.id, undated.id])
+        row = publications.loc[documented.id]
+        self.assertEqual((row.container, row.year_published, row.title), (container.id, 2010, 'A'))
+        self.assertEqual((row.is_archived, row.has_odd, row.has_visual_documentation, row.has_formal_description),
+                         (True, True, True, False))
+        row = publications.loc[undated.id]
+        self.assertTrue(np.isnan(row.year_published))
+        self.assertFalse(row.has_odd)
+
+
+class SnapshotTest(SimpleTestCase):
+    def setUp(self):
+        self.snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.snapshot_dir)
+
+    def test_frame_round_trip(self):
+        df = pd.DataFrame({'title': ['Agents', None, 'Émergence'],
+                           'status': pd.Categorical(['REVIEWED', 'FLAGGED', 'REVIEWED']),
+                           'year_published': [2001.0, np.nan, 2010.0]},
+                          index=pd.Index([3, 1, 2], name='publication__id'))
+        directory = os.path.join(self.snapshot_dir, 'publications')
+        save_frame(df, directory)
+        loaded = load_frame(directory)
+        self.assertIsInstance(loaded.title.values, MappedStringArray)
+        self.assertEqual(loaded.title.tolist(), ['Agents', None, 'Émergence'])
+        self.assertEqual(loaded.loc[[2, 3], 'title'].tolist(), ['Émergence', 'Agents'])
+        self.assertEqual(loaded[loaded.status == 'REVIEWED'].index.tolist(), [3, 2])
+        self.assertEqual(loaded.title.isna().tolist(), [False, True, False])
+        pd.testing.assert_frame_equal(loaded.astype({'title': object}), df)
+
+        # frames of mapped strings are saved again when a new version shares their tables
+        save_frame(loaded, os.path.join(self.snapshot_dir, 'copy'))
+        self.assertEqual(load_frame(os.path.join(self.snapshot_dir, 'copy')).title.tolist(), df.title.tolist())
+
+    def test_snapshots(self):
+        df = pd.DataFrame({'title': ['A']}, index=pd.Index([1], name='publication__id'))
+        first = save_snapshot({'publications': df}, self.snapshot_dir)
+        second = save_snapshot({'publications': df.assign(title=['B'])}, self.snapshot_dir,
+                               fingerprints={'citation.Publication': '2'})
+        tables, fingerprints = load_snapshot(self.snapshot_dir)
+        self.assertEqual(tables['publications'].title.tolist(), ['B'])
+        self.assertEqual(fingerprints, {'citation.Publication': '2'})
+
+        # the replaced snapshot is kept until the grace period after its replacement was published ends
+        prune_snapshots(self.snapshot_dir, keep=1)
+        self.assertTrue(os.path.exists(first))
+        prune_snapshots(self.snapshot_dir, keep=1, grace_period=0)
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+
+
+class SourceFingerprintsTest(BaseTest):
+    def test_renames_are_noticed(self):
+        tag = Tag.objects.create(name='abm')
+        fingerprints = get_source_fingerprints([Tag, PublicationTags])
+        self.assertEqual(get_source_fingerprints([Tag, PublicationTags]), fingerprints)
+        tag.name = 'ibm'
+        tag.save()
+        changed = get_source_fingerprints([Tag, PublicationTags])
+        self.assertNotEqual(changed[Tag._meta.label], fingerprints[Tag._meta.label])
+        self.assertEqual(changed[PublicationTags._meta.label], fingerprints[PublicationTags._meta.label])
+
+
+class VersionedDataCacheTest(SimpleTestCase):
+    def test_changed_tables(self):
+        fingerprints = {model._meta.label: '1' for model in DataCache.get_source_models()}
+        data_cache = DataCache(fingerprints=fingerprints)
+        self.assertEqual(data_cache.get_changed_tables(fingerprints), [])
+        self.assertEqual(data_cache.get_changed_tables({**fingerprints, Tag._meta.label: '2'}),
+                         ['tags', 'publication_tags'])
+        self.assertEqual(data_cache.get_changed_tables({**fingerprints, ModelDocumentation._meta.label: '2'}),
+                         ['publications'])
+
+    @patch('data_access.DataCache.from_snapshot')
+    def test_first_version_is_loaded_on_first_use(self, from_snapshot):
+        data_cache = VersionedDataCache('snapshots')
+        from_snapshot.assert_not_called()
+        self.assertIs(data_cache.publications, from_snapshot.return_value.publications)
+        self.assertIs(data_cache.current, from_snapshot.return_value)
+        from_snapshot.assert_called_once_with('snapshots')
+
+        next_version = DataCache()
+        data_cache.swap(next_version)
+        self.assertIs(data_cache.current, next_version)
+        self.assertEqual(data_cache.version, 1)
+
+    def test_related_name(self):
+        tags = pd.DataFrame({'name': ['abm']}, index=pd.Index([1], name='id'))
+        api = DataCache(tables={'tags': tags}).get_model_data_access_api('tags')
+        self.assertEqual(api.get_related_name(1), 'abm')
+        # entities of sessions started before a refresh can be missing from the current version
+        self.assertEqual(api.get_related_name(2), '2')
+
+    def test_search_options(self):
+        data_cache = create_data_cache()
+        api = data_cache.get_model_data_access_api('tags')
+        # ibm has more publications than abm
+        self.assertEqual(api.search_options(''), [{'label': 'ibm', 'value': 2}, {'label': 'abm', 'value': 1}])
+        self.assertEqual(api.search_options('ab'), [{'label': 'abm', 'value': 1}])
+        container = pd.DataFrame({'name': ['Econometrica', 'JASSS'], 'issn': ['0012-9682', None]},
+                                 index=pd.Index([1, 2], name='id'))
+        data_cache = DataCache(tables={'publications': data_cache.publications, 'container': container})
+        api = data_cache.get_model_data_access_api('container')
+        self.assertEqual(api.search_options('00129682'), [{'label': 'Econometrica', 'value': 1}])
+        self.assertEqual([option['value'] for option in api.search_options('')], [1, 2])
+
+
+class YearRelatedTensorTest(SimpleTestCase):
+    def test_from_memberships(self):
+        # publication 2 has no year and is left out
+        tensor = YearRelatedTensor.from_memberships(
+            publication_positions=np.array([0, 1, 1, 2]), related_ids=np.array([1, 1, 2, 3]),
+            year_codes=np.array([0, 2, YearAxis.MISSING]), statistics=np.array([[1, 1], [1, 0], [1, 1]], dtype=float),
+            year_axis=YearAxis(2001, 2004))
+        self.assertEqual(tensor.related_ids.tolist(), [1, 2])
+        self.assertEqual(tensor.values.tolist(), [[[1, 1], [0, 0], [1, 0]], [[0, 0], [0, 0], [1, 0]]])
+        # unknown entities have no publications
+        self.assertEqual(tensor.gather([2, 5]).tolist(), [[[0, 0], [0, 0]], [[0, 0], [0, 0]], [[1, 0], [0, 0]]])
+
+    def test_year_related_counts(self):
+        api = create_data_cache().get_model_data_access_api('tags')
+        counts = api.get_year_related_counts(None, [2, 1])
+        self.assertEqual(counts.loc[(2003, 2)].tolist(), [2, 1, 1, 1, 1])
+        self.assertEqual(counts.loc[(2001, 1)].tolist(), [1, 1, 1, 0, 0])
+        self.assertEqual(counts.loc[(2002, 1)].tolist(), [0, 0, 0, 0, 0])
+        self.assertEqual(counts['count'].sum(), 4)
+
+
+class MatchMaskTest(SimpleTestCase):
+    @patch('data_access.PublicationDocSearch')
+    def test_match_masks_are_memoized(self, publication_doc_search):
+        find = publication_doc_search.return_value.find
+        # publication 99 is not part of the cached publications
+        find.return_value.source.return_value.scan.return_value = [SimpleNamespace(id=40), SimpleNamespace(id=99),
+                                                                    SimpleNamespace(id=20)]
+        data_cache = create_data_cache()
+        query = Query(content_type='tags', search='abm', filters={})
+        self.assertEqual(data_cache.get_match_mask(query).tolist(), [False, True, False, True])
+        self.assertIs(data_cache.get_match_mask(Query(content_type='sponsors', search='abm', filters={})),
+                      data_cache.get_match_mask(query))
+        find.assert_called_once_with(q='abm', facet_filters={})
+
+        self.assertEqual(data_cache.get_match_mask(Query(content_type='tags', search='', filters={})).tolist(),
+                         [True] * 4)
+        counts = data_cache.get_year_counts(data_cache.get_match_mask(query))
+        self.assertEqual(counts['count'].to_dict(), {2001: 0, 2002: 0, 2003: 2})
+
+
+class LRUCacheTest(SimpleTestCase):
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache('test', 2)
+        self.assertEqual(cache.get_or_create('a', lambda: 1), 1)
+        self.assertEqual(cache.get_or_create('b', lambda: 2), 2)
+        self.assertEqual(cache.get_or_create('a', lambda: 3), 1)
+        cache.get_or_create('c', lambda: 4)
+        self.assertEqual(cache.get_or_create('a', lambda: 5), 1)
+        self.assertEqual(cache.get_or_create('b', lambda: 6), 6)
+        self.assertEqual(cache.stats(), {'name': 'test', 'size': 2, 'maxsize': 2, 'hits': 2, 'misses': 4,
+                                         'evictions': 2})
+
+    def test_session_caches(self):
+        cache = create_session_cache('abc')
+        self.assertIs(session_caches['abc'], cache)
+        with self.assertLogs('query_cache', 'INFO') as logs:
+            drop_session_cache('abc')
+        self.assertIn('session abc cache', logs.output[0])
+        self.assertNotIn('abc', session_caches)
+        create_session_cache()
+        self.assertNotIn(None, session_caches)
+
+
+class PublicationCountsOverTimeChartTest(SimpleTestCase):
+    @patch('components.publication_counts_over_time.data_cache', new_callable=create_data_cache)
+    def test_update_data_in_place(self, data_cache):
+        api = data_cache.get_model_data_access_api('tags')
+        chart = PublicationCountsOverTimeChart(Query(content_type='tags', search='', filters={}), statistic_indices=[],
+                                               publication_count_df=api.get_year_related_counts(None, [1, 2]))
+        figure = chart.figure
+        n_renderers = len(figure.renderers)
+        self.assertEqual([r.visible for r in chart.count_renderers[:3]], [True, True, False])
+        self.assertEqual(list(chart.sources[0].data['count']), [1, 0, 1])
+        self.assertEqual(list(chart.sources[1].data['count']), [0, 0, 2])
+        self.assertEqual(len(chart.name_legend.items), 2)
+
+        data = chart.sources[0].data
+        chart.update_data(api.get_year_related_counts(None, [2]))
+        self.assertIs(chart.figure, figure)
+        self.assertEqual(len(figure.renderers), n_renderers)
+        self.assertEqual([r.visible for r in chart.count_renderers[:2]], [True, False])
+        # the years of the first slot are unchanged so its counts are patched in place
+        self.assertIs(chart.sources[0].data, data)
+        self.assertEqual(list(chart.sources[0].data['count']), [0, 0, 2])
+        self.assertEqual(list(chart.sources[1].data['count']), [])
+        self.assertEqual(len(chart.name_legend.items), 1)
+        name_legend_items = chart.name_legend.items
+        chart.update_data(api.get_year_related_counts(None, [2]))
+        self.assertIs(chart.name_legend.items, name_legend_items)
+
+        chart.update_statistics([0])
+        self.assertEqual([r.visible for r in chart.statistic_renderers[0]], [True, False, False, False])
+        self.assertEqual([r.visible for r in chart.statistic_renderers[1]], [False] * 4)
+
+
+class YearAxisTest(SimpleTestCase):
+    def test_from_years(self):
+        year_axis = YearAxis.from_years([2003.0, np.nan, 1998.0])
+        self.assertEqual((year_axis.start, year_axis.stop, len(year_axis)), (1998, 2004, 6))
+        self.assertEqual(len(YearAxis.from_years([np.nan])), 0)
+
+    def test_buckets(self):
+        year_axis = YearAxis(1998, 2012)
+        self.assertIs(year_axis.bucketed(1), year_axis)
+        five_years = year_axis.bucketed(5)
+        self.assertEqual(list(five_years.years), [1995, 2000, 2005, 2010])
+        self.assertEqual(five_years.codes([1998, 2004, 2005, 2011, np.nan, 2012]).tolist(), [0, 1, 2, 3, -1, -1])
+        ten_years = year_axis.bucketed(10)
+        self.assertEqual(ten_years.index().tolist(), [1990, 2000, 2010])
+        self.assertEqual(ten_years.codes([1998, 2005, 2011, 1989]).tolist(), [0, 1, 2, -1])
+
+    def test_bucketed_year_counts(self):
+        data_cache = create_data_cache()
+        self.assertEqual(data_cache.get_year_counts(bucket_size=5)['count'].to_dict(), {2000: 3})
+        counts = data_cache.get_model_data_access_api('tags').get_year_related_counts(None, [1, 2], bucket_size=10)
+        self.assertEqual(counts['count'].to_dict(), {(2000, 1): 2, (2000, 2): 2})
+        with self.assertRaises(ValueError):
+            data_cache.get_year_axis(bucket_size=3)
@@ -0,0 +1,43 @@
+from django.test import SimpleTestCase
+
+from catalog.core.citation_graph import CitationGraph
+
+
+class CitationGraphTest(SimpleTestCase):
+    def setUp(self):
+        # 1 -> 2 -> 3 -> 1 is a citation cycle
+        self.graph = CitationGraph.from_pairs([1, 1, 2, 3, 3, 3], [2, 3, 3, 1, 4, 4])
+
+    def test_citations(self):
+        self.assertEqual(self.graph.citations(3).tolist(), [1, 4])
+        self.assertEqual(self.graph.citations(5).tolist(), [])
+
+    def test_tree_visits_publications_once(self):
+        tree = self.graph.tree(1)
+        self.assertEqual([c['name'] for c in tree['children']], [2, 3])
+        self.assertEqual(tree['children'][0]['children'], [])
+        self.assertEqual([c['name'] for c in tree['children'][1]['children']], [4])
+
+    def test_tree_limits(self):
+        tree = self.graph.tree(1, max_depth=1)
+        self.assertEqual([(c['name'], c['has_children']) for c in tree['children']], [(2, False), (3, True)])
+
+    def test_tree_more_children(self):
+        tree = self.graph.tree(1, max_children=1)
+        self.assertEqual([c['name'] for c in tree['children']], [2, '1 more'])
+        more = tree['children'][1]
+        self.assertTrue(more['more'])
+
+        tree = self.graph.tree(1, max_children=1, offset=more['offset'])
+        self.assertEqual([c['name'] for c in tree['children']], [3])
+        self.assertEqual([c['name'] for c in tree['children'][0]['children']], [4])
+
+    def test_tree_more_children_exclude_shown(self):
+        # 3 is cited by 1 and 2, 5 only by 1
+        graph = CitationGraph.from_pairs([1, 1, 1, 2], [2, 3, 5, 3])
+        tree = graph.tree(1, max_children=1)
+        self.assertEqual([c['name'] for c in tree['children']], [2, '2 more'])
+        self.assertEqual([c['name'] for c in tree['children'][0]['children']], [3])
+
+        more = graph.tree(1, max_children=1, offset=tree['children'][1]['offset'], exclude=[1, 2, 3])
+        self.assertEqual([c['name'] for c in more['children']], [5])
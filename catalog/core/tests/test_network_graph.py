@@ -0,0 +1,61 @@
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from catalog.core import network_graph
+from catalog.core.network_graph import NetworkGraphStore, get_network_graph_store, normalize_filter_criteria
+
+
+class NetworkGraphStoreTest(SimpleTestCase):
+    def setUp(self):
+        pks = np.array([1, 2, 3, 4, 5])
+        dates = np.array([date(year, 6, 1).toordinal() for year in [2000, 2001, 2002, 2003, 2004]])
+        # 1 -> 2 -> 3 and 4 -> 5
+        self.store = NetworkGraphStore(version='1', pks=pks, dates=dates, titles=['A', 'B', 'C', 'D', 'E'],
+                                       authors=[''] * 5, tags=[''] * 5, sponsors=[''] * 5,
+                                       tag_nodes={'abm': np.array([0, 1, 2, 3, 4]), 'ecology': np.array([3, 4])},
+                                       sponsor_nodes={}, sources=np.array([0, 1, 3]), targets=np.array([1, 2, 4]))
+
+    def get_names(self, filter_criteria):
+        graph, _ = self.store.filter(filter_criteria)
+        return [node['name'] for node in graph['nodes']]
+
+    def test_filter_keeps_largest_component(self):
+        graph, group = self.store.filter({'tags__name__in': ['abm']})
+        self.assertEqual([node['name'] for node in graph['nodes']], [1, 2, 3])
+        self.assertEqual(graph['links'], [{'source': 0, 'target': 1}, {'source': 1, 'target': 2}])
+        self.assertEqual(group, ['abm'])
+        self.assertEqual(self.get_names({'tags__name__in': ['ecology']}), [4, 5])
+
+    def test_filter_by_date(self):
+        self.assertEqual(self.get_names({'tags__name__in': ['abm'], 'date_published__gte': '2001-01-01T00:00:00Z'}),
+                         [2, 3])
+
+    def test_normalize_filter_criteria(self):
+        self.assertEqual(normalize_filter_criteria({'is_primary': True, 'tags__name__in': ['b', 'a']}),
+                         normalize_filter_criteria({'tags__name__in': ['a', 'b', 'a']}))
+        with self.assertRaises(ValueError):
+            normalize_filter_criteria({'container__name': 'Nature'})
+
+
+@patch.object(network_graph, '_store', None)
+@patch.object(network_graph, '_version_checked_at', None)
+class NetworkGraphStoreVersionTest(SimpleTestCase):
+    @patch('catalog.core.network_graph.time.monotonic')
+    @patch.object(NetworkGraphStore, 'build', side_effect=lambda version: SimpleNamespace(version=version))
+    @patch.object(NetworkGraphStore, 'get_version')
+    def test_version_is_checked_once_per_interval(self, get_version, build, monotonic):
+        get_version.return_value = '1'
+        monotonic.return_value = 100
+        store = get_network_graph_store()
+        monotonic.return_value = 100 + network_graph.NETWORK_GRAPH_VERSION_CHECK_INTERVAL - 1
+        get_version.return_value = '2'
+        self.assertIs(get_network_graph_store(), store)
+        self.assertEqual(get_version.call_count, 1)
+
+        monotonic.return_value = 100 + network_graph.NETWORK_GRAPH_VERSION_CHECK_INTERVAL
+        self.assertEqual(get_network_graph_store().version, '2')
+        self.assertEqual(build.call_count, 2)
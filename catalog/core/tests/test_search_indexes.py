@@ -0,0 +1,314 @@
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from elasticsearch_dsl import Search
+from elasticsearch_dsl.response import Response
+
+from catalog.core.search_indexes import split_pk_ranges, deduplicate_actions, facet_value, parse_facet_value, \
+    PublicationDoc, SearchResultSequence, visualization_filter_search, check_memory_ceiling, get_recent_changes, \
+    SYNC_OVERLAP, author_name, swap_index_aliases, prune_index_generations, sync_public_indices, \
+    SYNC_HIGH_WATER_MARK_CACHE_KEY, CachedPublicationDocSearch, create_index_generation, RelatedBulkIndexSource, \
+    TagDoc, RelationAggregationSequence
+from citation.models import Author, ModelDocumentation, Platform, Publication, PublicationAuthors, \
+    PublicationPlatforms, PublicationSponsors, PublicationTags, Sponsor, Tag
+from .common import BaseTest
+
+
+class BulkIndexTest(SimpleTestCase):
+    def test_split_pk_ranges(self):
+        self.assertEqual(list(split_pk_ranges([1, 2, 5, 9, 10], 2)), [(1, 2), (5, 9), (10, 10)])
+        self.assertEqual(list(split_pk_ranges(iter([3, 4]), 5)), [(3, 4)])
+        self.assertEqual(list(split_pk_ranges([], 5)), [])
+
+    def test_deduplicate_actions(self):
+        actions = [{'_index': 'author', '_id': 1}, {'_index': 'author', '_id': 2},
+                   {'_index': 'author', '_id': 1}, {'_index': 'tag', '_id': 1}]
+        self.assertEqual(list(deduplicate_actions(actions)), [actions[0], actions[1], actions[3]])
+
+    @patch('catalog.core.search_indexes.get_resident_memory_mb')
+    def test_check_memory_ceiling(self, get_resident_memory_mb):
+        self.assertFalse(check_memory_ceiling(None))
+        get_resident_memory_mb.side_effect = [100, 100]
+        self.assertFalse(check_memory_ceiling(200))
+        get_resident_memory_mb.side_effect = [300, 150]
+        self.assertFalse(check_memory_ceiling(200))
+        get_resident_memory_mb.side_effect = [300, 300]
+        self.assertTrue(check_memory_ceiling(200))
+
+
+class RelatedBulkIndexSourceTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.source = RelatedBulkIndexSource(TagDoc, Tag)
+        self.tag = Tag.objects.create(name='abm')
+        self.unpublished_tag = Tag.objects.create(name='ibm')
+        for title, status in [('A', 'REVIEWED'), ('B', 'REVIEWED'), ('C', 'UNREVIEWED')]:
+            p = self.create_publication(title=title, added_by=self.user, container=None, status=status,
+                                        is_primary=True)
+            p.save()
+            PublicationTags.objects.create(publication=p, tag=self.tag)
+            if status == 'UNREVIEWED':
+                PublicationTags.objects.create(publication=p, tag=self.unpublished_tag)
+
+    def test_publication_count_only_counts_public_publications(self):
+        instances = self.source.hydrate([self.tag.id, self.unpublished_tag.id])
+        self.assertEqual([(tag.id, tag.publication_count) for tag in instances], [(self.tag.id, 2)])
+
+    def test_duplicate_actions_are_dropped(self):
+        action = TagDoc.from_instance(self.tag)
+        with patch.object(self.source, 'documents', return_value=[action, dict(action)]):
+            actions = list(self.source.actions(self.tag.id, self.tag.id, chunk_size=10))
+        self.assertEqual(actions, [action])
+
+
+def create_indices_client(generations, aliases, concrete_indices=()):
+    """Elasticsearch client mock with the given index generations, aliased generations and concrete indices"""
+    client = MagicMock()
+    client.indices.get.side_effect = lambda index: {name: {} for name in generations
+                                                    if name.startswith(index.rstrip('*'))}
+    client.indices.exists_alias.side_effect = lambda name: name in aliases
+    client.indices.get_alias.side_effect = lambda name: {index_name: {} for index_name in aliases[name]}
+    client.indices.exists.side_effect = lambda index: index in concrete_indices
+    return client
+
+
+@patch('catalog.core.search_indexes.bump_search_index_generation')
+@patch('catalog.core.search_indexes.connections')
+class IndexGenerationTest(SimpleTestCase):
+    def test_swap_index_aliases(self, connections, bump_search_index_generation):
+        client = create_indices_client(generations=[], aliases={'publication': ['publication-20180101000000']},
+                                       concrete_indices=['tag'])
+        connections.get_connection.return_value = client
+        swap_index_aliases({'publication': 'publication-20180201000000', 'tag': 'tag-20180201000000'})
+        client.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'remove': {'index': 'publication-20180101000000', 'alias': 'publication'}},
+            {'add': {'index': 'publication-20180201000000', 'alias': 'publication'}},
+            {'remove_index': {'index': 'tag'}},
+            {'add': {'index': 'tag-20180201000000', 'alias': 'tag'}},
+        ]})
+        client.indices.delete.assert_not_called()
+        bump_search_index_generation.assert_called_once_with()
+
+    def test_prune_index_generations_keeps_aliased_generation(self, connections, bump_search_index_generation):
+        generations = ['tag-2018010{}000000'.format(i) for i in range(1, 5)]
+        # rolled back to the oldest generation
+        client = create_indices_client(generations=generations, aliases={'tag': generations[:1]})
+        connections.get_connection.return_value = client
+        prune_index_generations('tag', keep=2)
+        client.indices.delete.assert_called_once_with(index=generations[1])
+
+    @patch('catalog.core.search_indexes.timezone.now', return_value=datetime(2018, 1, 1, 12))
+    def test_index_generation_names_are_unique(self, now, connections, bump_search_index_generation):
+        doc_type = MagicMock()
+        doc_type._index._name = 'tag'
+        first = create_index_generation(doc_type)
+        second = create_index_generation(doc_type)
+        self.assertNotEqual(first, second)
+        self.assertTrue(first.startswith('tag-20180101120000000000-'))
+        self.assertEqual(doc_type._index.clone.return_value.create.call_count, 2)
+
+    def test_hits_match_index_generations(self, connections, bump_search_index_generation):
+        alias = PublicationDoc._index._name
+        doc_type = PublicationDoc._doc_type.name
+        self.assertTrue(PublicationDoc._matches({'_index': alias, '_type': doc_type}))
+        self.assertTrue(PublicationDoc._matches({'_index': alias + '-20180101000000', '_type': doc_type}))
+        self.assertFalse(PublicationDoc._matches({'_index': alias + 's', '_type': doc_type}))
+
+
+class SyncTest(SimpleTestCase):
+    def test_get_recent_changes(self):
+        high_water_mark = datetime(2018, 1, 1, 12)
+        changes = [(1, high_water_mark - SYNC_OVERLAP - timedelta(seconds=1)),
+                   (2, high_water_mark - SYNC_OVERLAP / 2), (3, high_water_mark)]
+        self.assertEqual(get_recent_changes(changes, high_water_mark), frozenset(changes[1:]))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@patch('catalog.core.search_indexes.sync_publications')
+class SyncPublicIndicesTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        cache.set(SYNC_HIGH_WATER_MARK_CACHE_KEY, timezone.now() - timedelta(days=1))
+
+    def test_polling_only_syncs_new_changes(self, sync_publications):
+        publications = []
+        for title in ['A', 'B']:
+            p = self.create_publication(title=title, added_by=self.user, container=None)
+            p.save()
+            publications.append(p)
+
+        self.assertEqual(sync_public_indices(), 2)
+        sync_publications.assert_called_once_with([p.id for p in publications], on_synced=None)
+
+        sync_publications.reset_mock()
+        self.assertEqual(sync_public_indices(), 0)
+        sync_publications.assert_not_called()
+
+        publications[0].title = 'C'
+        publications[0].save()
+        self.assertEqual(sync_public_indices(), 1)
+        sync_publications.assert_called_once_with([publications[0].id], on_synced=None)
+
+    @patch('catalog.core.search_indexes.bulk_index_public')
+    def test_first_sync_rebuilds_in_bulk(self, bulk_index_public, sync_publications):
+        cache.clear()
+        bulk_index_public.return_value = {PublicationDoc._index._name: {'count': 2, 'docs_per_second': 1.0}}
+        with patch.object(PublicationDoc._index, 'exists', return_value=False):
+            self.assertEqual(sync_public_indices(), 2)
+        bulk_index_public.assert_called_once_with()
+        sync_publications.assert_not_called()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@patch('catalog.core.search_indexes.get_search_index_generation', return_value='1')
+class CachedPublicationDocSearchTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_keys_are_normalized(self, get_search_index_generation):
+        def make_key(search, facet_filters):
+            return CachedPublicationDocSearch(search, facet_filters)._make_key('hits', 0, 10, None)
+
+        key = make_key(' abm ', {'tags': {2, 1}, 'sponsors': set()})
+        self.assertEqual(key, make_key('abm', {'tags': {1, 2}}))
+        self.assertNotEqual(key, make_key('abm', {'tags': {1}}))
+        get_search_index_generation.return_value = '2'
+        self.assertNotEqual(key, make_key('abm', {'tags': {1, 2}}))
+
+    def test_facets_are_cached(self, get_search_index_generation):
+        with patch.object(CachedPublicationDocSearch, '_find') as find:
+            publication_query = find.return_value.__getitem__.return_value.agg_by_count.return_value
+            publication_query.cache = {'tags': [(1, 'abm', 3)]}
+            for _ in range(2):
+                facets = CachedPublicationDocSearch('abm', {}).get_facets()
+                self.assertEqual(facets, {'tags': [(1, 'abm', 3)]})
+            publication_query.execute.assert_called_once_with(facet_filters={})
+
+
+class FacetAggTest(SimpleTestCase):
+    def test_facet_value_round_trip(self):
+        self.assertEqual(parse_facet_value(facet_value(12, 'Smith | Jones')), (12, 'Smith | Jones'))
+
+
+class RangeSequence(SearchResultSequence):
+    def __init__(self, total, **kwargs):
+        super().__init__(**kwargs)
+        self.total = total
+        self.fetches = []
+
+    def fetch(self, start, stop):
+        self.fetches.append((start, stop))
+        return self.total, list(range(start, min(stop, self.total)))
+
+
+class VisualizationSearchTest(SimpleTestCase):
+    def test_filter_criteria(self):
+        search = visualization_filter_search({'is_primary': True, 'status': 'REVIEWED',
+                                              'tags__name__in': ['abm'], 'container__name': 'Econometrica',
+                                              'date_published__gte': '2001-01-01T00:00:00Z'})
+        self.assertEqual(search.to_dict()['query']['bool']['filter'], [
+            {'nested': {'path': 'tags', 'query': {'terms': {'tags.name.raw': ['abm']}}}},
+            {'term': {'container.name.raw': 'Econometrica'}},
+            {'range': {'date_published': {'gte': '2001-01-01T00:00:00Z'}}}
+        ])
+        with self.assertRaises(ValueError):
+            visualization_filter_search({'title__icontains': 'abm'})
+
+    def test_sequence_fetches_page_window_once(self):
+        sequence = RangeSequence(25, start=20, stop=30)
+        self.assertEqual(len(sequence), 25)
+        self.assertEqual(sequence[20:30], [20, 21, 22, 23, 24])
+        self.assertEqual(sequence.fetches, [(20, 30)])
+        self.assertEqual(sequence[0:2], [0, 1])
+        self.assertEqual(sequence.fetches, [(20, 30), (0, 2)])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@patch('catalog.core.search_indexes.get_search_index_generation', return_value='1')
+class RelationAggregationSequenceTest(SimpleTestCase):
+    keys = [facet_value(1, 'abm'), facet_value(2, 'ibm'), facet_value(3, 'netlogo')]
+
+    def setUp(self):
+        cache.clear()
+        self.afters = []
+
+    def execute(self, search):
+        """Composite aggregation response over keys"""
+        composite = search.to_dict()['aggs']['relations']['composite']
+        after = composite.get('after')
+        self.afters.append(after)
+        keys = [key for key in self.keys if after is None or key > after['relation']][:composite['size']]
+        relations = {'buckets': [{'key': {'relation': key}, 'doc_count': 2, 'code_availability_count': {'value': 1.0}}
+                                 for key in keys]}
+        if keys:
+            relations['after_key'] = {'relation': keys[-1]}
+        return Response(search, {'hits': {'total': 0, 'hits': []},
+                                 'aggregations': {'relations': relations, 'relation_count': {'value': len(self.keys)}}})
+
+    def test_windows_resume_from_cached_after_key(self, get_search_index_generation):
+        with patch.object(Search, 'execute', autospec=True, side_effect=self.execute):
+            first = RelationAggregationSequence(PublicationDoc.search(), 'tags', start=0, stop=2)
+            self.assertEqual([relation['name'] for relation in first[0:2]], ['abm', 'ibm'])
+            second = RelationAggregationSequence(PublicationDoc.search(), 'tags', start=2, stop=4)
+            self.assertEqual(len(second), 3)
+            self.assertEqual(second[2:4], [{'id': 3, 'name': 'netlogo', 'published_count': 2,
+                                            'code_availability_count': 1}])
+            self.assertFalse(second.is_count_approximate())
+        self.assertEqual(self.afters, [None, {'relation': self.keys[1]}])
+
+    def test_windows_seek_without_cached_after_key(self, get_search_index_generation):
+        with patch.object(Search, 'execute', autospec=True, side_effect=self.execute):
+            sequence = RelationAggregationSequence(PublicationDoc.search(), 'tags', start=2, stop=4)
+            self.assertEqual([relation['id'] for relation in sequence[2:4]], [3])
+        self.assertEqual(self.afters, [None, {'relation': self.keys[1]}])
+
+
+class PublicationDocTest(BaseTest):
+    def test_author_name(self):
+        self.assertEqual(author_name('Ada', 'Lovelace'), 'Ada Lovelace')
+        self.assertEqual(author_name(None, 'Lovelace'), 'Lovelace')
+        self.assertEqual(author_name('Ada', ''), 'Ada')
+
+    def test_bulk_from_ids_matches_from_instance(self):
+        container = self.create_container(name='Econometrica', issn='0012-9682')
+        container.save()
+        # created in reverse name order so that relations ordered by name and by id differ
+        tags = [Tag.objects.create(name=name) for name in ['c', 'b', 'a']]
+        platforms = [Platform.objects.create(name=name) for name in ['NetLogo', 'Mason']]
+        sponsors = [Sponsor.objects.create(name=name) for name in ['NSF', 'NIH']]
+        documentation = [ModelDocumentation.objects.create(name=name) for name in ['ODD', 'Flow charts']]
+        authors = [Author.objects.create(given_name='Ada', family_name='Lovelace', orcid='0000-0001'),
+                   Author.objects.create(given_name='', family_name='Babbage'),
+                   Author.objects.create(family_name='Turing', email='turing@example.com')]
+        publications = []
+        for i, title in enumerate(['A', 'B', 'C']):
+            p = self.create_publication(title=title, added_by=self.user, container=container)
+            p.save()
+            for tag in tags[i:]:
+                PublicationTags.objects.create(publication=p, tag=tag)
+            for platform in platforms[:i]:
+                PublicationPlatforms.objects.create(publication=p, platform=platform)
+            for sponsor in sponsors[i % 2:]:
+                PublicationSponsors.objects.create(publication=p, sponsor=sponsor)
+            for md in documentation[i % 2:]:
+                Publication.model_documentation.through.objects.create(publication=p, model_documentation=md)
+            for author in reversed(authors[:i + 1]):
+                PublicationAuthors.objects.create(publication=p, author=author)
+            publications.append(p)
+
+        with self.assertNumQueries(6):
+            actions = PublicationDoc.bulk_from_ids([p.id for p in publications])
+        actions = sorted(actions, key=lambda a: a['_id'])
+        self.assertEqual(actions, [PublicationDoc.from_instance(p) for p in publications])
+
+    def test_publication_without_container(self):
+        p = self.create_publication(title='No container', added_by=self.user, container=None)
+        p.save()
+        action = PublicationDoc.from_instance(p)
+        self.assertNotIn('container', action['_source'])
+        self.assertNotIn('container_facet', action['_source'])
+        self.assertEqual(PublicationDoc.bulk_from_ids([p.id]), [action])
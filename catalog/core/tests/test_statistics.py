@@ -0,0 +1,61 @@
+from datetime import date
+
+from catalog.core.statistics import refresh_statistics, refresh_publication_statistics, get_year_statistics, \
+    get_related_ids, TOTAL_RELATION, TOTAL_RELATED_ID
+from citation.models import Author
+from .common import BaseTest
+
+
+class PublicationYearStatisticsTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.container = self.create_container(name='Econometrica')
+        self.container.save()
+        self.publications = []
+        # is_archived disagrees with the code archive url to check which one code availability follows
+        for title, year, code_archive_url in [('A', 2010, 'https://www.comses.net/codebases/1/'), ('B', 2012, '')]:
+            p = self.create_publication(title=title, added_by=self.user, container=self.container,
+                                        status='REVIEWED', is_primary=True, date_published=date(year, 1, 1),
+                                        code_archive_url=code_archive_url, is_archived=not code_archive_url)
+            p.save()
+            self.publications.append(p)
+
+    def get_counts(self, relation, related_id):
+        return [(row['year'], row['publication_count'], row['code_availability_count'])
+                for row in get_year_statistics(relation, [related_id])]
+
+    def test_refresh_statistics(self):
+        refresh_statistics()
+        expected = [(2010, 1, 1), (2011, 0, 0), (2012, 1, 0)]
+        self.assertEqual(self.get_counts('container', self.container.id), expected)
+        self.assertEqual(self.get_counts(TOTAL_RELATION, TOTAL_RELATED_ID), expected)
+
+    def test_refresh_publication_statistics(self):
+        refresh_statistics()
+        other_container = self.create_container(name='Ecological Modelling')
+        other_container.save()
+        moved = self.publications[1]
+        moved.container = other_container
+        moved.save()
+
+        refresh_publication_statistics([moved.id], previous_related_ids={'container': {self.container.id}})
+        self.assertEqual(self.get_counts('container', self.container.id), [(2010, 1, 1)])
+        self.assertEqual(self.get_counts('container', other_container.id), [(2012, 1, 0)])
+
+    def test_refresh_publication_statistics_of_changed_years(self):
+        refresh_statistics()
+        moved = self.publications[1]
+        moved.date_published = date(2011, 6, 1)
+        moved.save()
+
+        refresh_publication_statistics([moved.id], previous_years={2012})
+        self.assertEqual(self.get_counts('container', self.container.id), [(2010, 1, 1), (2011, 1, 0)])
+        self.assertEqual(self.get_counts(TOTAL_RELATION, TOTAL_RELATED_ID), [(2010, 1, 1), (2011, 1, 0)])
+
+    def test_author_names_match_indexed_names(self):
+        authors = [Author.objects.create(given_name='Ada', family_name='Lovelace'),
+                   Author.objects.create(given_name='', family_name='Babbage'),
+                   Author.objects.create(given_name='Alan', family_name='')]
+        self.assertEqual(get_related_ids('authors', 'Ada Lovelace'), [authors[0].id])
+        self.assertEqual(get_related_ids('authors', 'Babbage'), [authors[1].id])
+        self.assertEqual(get_related_ids('authors', 'Alan'), [authors[2].id])
@@ -1,10 +1,17 @@
 import json
 from unittest import mock
 from unittest.mock import patch
+from urllib.parse import unquote
 
 from django.contrib.auth.models import User
+from django.http import QueryDict
+from django.test import SimpleTestCase
 from haystack.query import SearchQuerySet
+from rest_framework.exceptions import ParseError
 
+from catalog.core.views import create_paginator, dump_search_cursor, load_search_cursor, get_visualization_search, \
+    get_statistics_query
+from citation.graphviz.globals import RelationClassifier
 from citation.models import Publication, ModelDocumentation
 from .common import BaseTest
 
@@ -271,3 +278,55 @@ class EmailPreviewTest(BaseTest):
                            query_parameters={'invitation_subject': 'foo', 'invitation_text': 'bar'})
         response = self.get(url)
         self.assertEqual(200, response.status_code)
+
+
+class PublicSearchPaginatorTest(SimpleTestCase):
+    def test_pages_past_max_depth_are_not_linked(self):
+        paginator = create_paginator(current_page=1, query_dict=QueryDict(), total_hits=10000, max_page_depth=50)
+        self.assertEqual(paginator['max']['page'], 50)
+        self.assertEqual(paginator['next'], '?page=2')
+
+    def test_next_page_uses_cursor(self):
+        cursor = dump_search_cursor(61, ['2015-01-01', 10])
+        paginator = create_paginator(current_page=60, query_dict=QueryDict(), total_hits=10000, max_page_depth=50,
+                                     next_cursor=cursor)
+        self.assertNotIn('previous', paginator)
+        self.assertNotIn('max', paginator)
+        self.assertEqual(paginator['range'], [])
+        self.assertEqual(load_search_cursor(unquote(paginator['next'][len('?after='):])),
+                         (61, ['2015-01-01', 10]))
+        self.assertIsNone(load_search_cursor('tampered'))
+
+    def test_shallow_pages_use_page_numbers(self):
+        cursor = dump_search_cursor(3, ['2015-01-01', 10])
+        paginator = create_paginator(current_page=2, query_dict=QueryDict('search=abm'), total_hits=10000,
+                                     max_page_depth=50, next_cursor=cursor)
+        self.assertEqual(paginator['next'], '?page=3&search=abm')
+        paginator = create_paginator(current_page=50, query_dict=QueryDict(), total_hits=10000, max_page_depth=50,
+                                     next_cursor=cursor)
+        self.assertTrue(paginator['next'].startswith('?after='))
+
+
+class VisualizationFilterTest(SimpleTestCase):
+    def test_unsupported_filter_criteria_are_a_bad_request(self):
+        with self.assertRaises(ParseError):
+            get_visualization_search({'title__icontains': 'abm'})
+        get_visualization_search({'is_primary': True, 'tags__name__in': ['abm']})
+
+
+class StatisticsQueryTest(SimpleTestCase):
+    def test_only_public_criteria_with_whole_years_use_statistics(self):
+        public = {'is_primary': True, 'status': 'REVIEWED'}
+        general = RelationClassifier.GENERAL.value
+        sponsor = RelationClassifier.SPONSOR.value
+        self.assertEqual(get_statistics_query(dict(public, sponsors__name='NSF'), sponsor),
+                         ('sponsors', 'NSF', None, None))
+        self.assertEqual(get_statistics_query(dict(public, date_published__gte='2001-01-01T00:00:00Z',
+                                                   date_published__lte='2010-12-31T00:00:00Z'), general),
+                         ('publication', None, 2001, 2010))
+        # the statistics only count public publications
+        self.assertIsNone(get_statistics_query({}, general))
+        self.assertIsNone(get_statistics_query({'sponsors__name': 'NSF'}, sponsor))
+        self.assertIsNone(get_statistics_query(dict(public, tags__name__in=['abm']), general))
+        self.assertIsNone(get_statistics_query(dict(public, date_published__lte='2010-01-01T00:00:00Z'), general))
+        self.assertIsNone(get_statistics_query(public, sponsor))
@@ -0,0 +1,145 @@
+import os
+import sys
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from catalog.core.prefix_index import PrefixIndex
+
+UTIL_DIR = os.path.join(settings.BASE_DIR, 'visualization', 'util')
+
+
+def setUpModule():
+    # the app imports its modules as top level modules
+    sys.path.insert(0, UTIL_DIR)
+    global CitationNetwork, force_directed_layout, _repulsion_dense, _repulsion_grid
+    from citation_network import CitationNetwork, force_directed_layout, _repulsion_dense, _repulsion_grid
+    global RelationMap, RelationIndex, PublicationQueries
+    from data_wrangling import RelationMap, RelationIndex, PublicationQueries
+
+
+def tearDownModule():
+    sys.path.remove(UTIL_DIR)
+
+
+class CitationNetworkTest(SimpleTestCase):
+    def test_grid_repulsion(self):
+        positions = np.random.RandomState(0).uniform(-1, 1, size=(300, 2))
+        dense = _repulsion_dense(positions, 0.1)
+        # every cell neighbours every other cell of a 2 by 2 grid so all pairs are exact
+        np.testing.assert_allclose(_repulsion_grid(positions, 0.1, grid_size=2), dense)
+        error = np.linalg.norm(_repulsion_grid(positions, 0.1, grid_size=16) - dense) / np.linalg.norm(dense)
+        self.assertLess(error, 0.01)
+
+    def test_layout(self):
+        layout = force_directed_layout(4, np.array([0, 1, 2]), np.array([1, 2, 0]), iterations=10)
+        self.assertEqual(layout.shape, (4, 2))
+        self.assertLessEqual(np.abs(layout).max(), 1)
+        np.testing.assert_array_equal(layout, force_directed_layout(4, np.array([0, 1, 2]), np.array([1, 2, 0]),
+                                                                    iterations=10))
+
+    @patch('citation_network.cache')
+    def test_subgraph(self, cache):
+        cache.get.return_value = None
+        # self citations and citations of publications outside of the index are dropped
+        network = CitationNetwork.from_pairs([10, 10, 20, 20, 30], [20, 20, 30, 99, 30], pd.Index([10, 20, 30]))
+        self.assertEqual(list(zip(network.sources, network.targets)), [(0, 1), (1, 2)])
+        nodes, sources, targets = network.subgraph([2, 1])
+        layout = network.layout
+        np.testing.assert_array_equal(nodes, layout[[2, 1]])
+        np.testing.assert_array_equal(sources, layout[[1]])
+        np.testing.assert_array_equal(targets, layout[[2]])
+        cache.set.assert_called_once()
+
+
+class RelationMapTest(SimpleTestCase):
+    def setUp(self):
+        # related entity and publication id pairs with a duplicate membership
+        self.relation_map = RelationMap.from_pairs([3, 1, 3, 1, 3], [20, 10, 10, 30, 20])
+
+    def test_round_trip(self):
+        self.assertEqual(self.relation_map.related_ids.tolist(), [1, 3])
+        self.assertEqual(self.relation_map.get(1).tolist(), [10, 30])
+        self.assertEqual(self.relation_map.get(3).tolist(), [10, 20])
+        self.assertEqual(self.relation_map.get(2).tolist(), [])
+        self.assertEqual(self.relation_map.get_counts([3, 2, 1]).tolist(), [2, 0, 2])
+        self.assertIn(3, self.relation_map)
+        self.assertNotIn(4, self.relation_map)
+        self.assertEqual(len(self.relation_map), 2)
+
+    def test_relation_index_from_relation_map(self):
+        index = RelationIndex.from_relation_map(self.relation_map, pd.Index([30, 20, 10]))
+        self.assertEqual(index.get_positions(1).tolist(), [0, 2])
+        self.assertEqual(index.get_positions(3).tolist(), [1, 2])
+
+
+class PrefixIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.options = [{'label': 'Econometrica', 'value': 1},
+                        {'label': 'Journal of Artificial Societies and Social Simulation', 'value': 2},
+                        {'label': 'Ecological Modelling', 'value': 3}]
+        self.index = PrefixIndex.from_options(self.options, [5, 8, 3],
+                                              aliases=[('0012-9682', '00129682'), (), ()])
+
+    def labels(self, q, limit=20):
+        return [option['label'] for option in self.index.search(q, limit=limit)]
+
+    def test_word_prefixes(self):
+        self.assertEqual(self.labels('ec'), ['Econometrica', 'Ecological Modelling'])
+        self.assertEqual(self.labels('SOC'), ['Journal of Artificial Societies and Social Simulation'])
+        self.assertEqual(self.labels('modelling'), ['Ecological Modelling'])
+        self.assertEqual(self.labels('xyz'), [])
+
+    def test_aliases(self):
+        self.assertEqual(self.labels('0012-96'), ['Econometrica'])
+        self.assertEqual(self.labels('001296'), ['Econometrica'])
+
+    def test_ranked_by_weight(self):
+        self.assertEqual(self.labels('', limit=2),
+                         ['Journal of Artificial Societies and Social Simulation', 'Econometrica'])
+
+
+def create_publication_queries():
+    df = pd.DataFrame({
+        'year_published': pd.Categorical([2001, 2005, 2005, 2011]),
+        'title': ['A', 'B', 'C', 'D'],
+        'is_archived': [True, False, True, True],
+        'has_model_documentation': [False, True, True, False],
+    }, index=pd.Index([10, 20, 30, 40], name='id'))
+    # publication 99 is not in the DataFrame
+    tags = RelationIndex.from_pairs([10, 20, 20, 30, 99, 20], [1, 1, 2, 2, 1, 1], df.index)
+    return PublicationQueries(df, relation_indices={'tag': tags},
+                              fulltext_search=lambda text: np.array([1, 2, 3]))
+
+
+class PublicationQueriesTest(SimpleTestCase):
+    def setUp(self):
+        self.pq = create_publication_queries()
+
+    def test_relation_index(self):
+        tags = self.pq.relation_indices['tag']
+        self.assertEqual(tags.get_positions(1).tolist(), [0, 1])
+        self.assertEqual(tags.get_positions(2).tolist(), [1, 2])
+        self.assertEqual(tags.get_positions(3).tolist(), [])
+
+    def test_filter_by_pks(self):
+        self.assertEqual(self.pq.filter_by_pks('tag', [1, 2]).positions.tolist(), [0, 1, 2])
+        self.assertEqual(self.pq.filter_by_pks('tag', [1, 2], match=PublicationQueries.MATCH_ALL).positions.tolist(),
+                         [1])
+        self.assertEqual(self.pq.filter_by_pks('tag', []).positions.tolist(), [])
+
+    def test_filters_narrow_down(self):
+        pq = self.pq.filter_by_fulltext_search('abm').filter_by_pks('tag', [1])
+        self.assertEqual(pq.df.index.tolist(), [20])
+        pq = self.pq.filter_by_date_published(2001, 2010)
+        self.assertEqual(pq.df.index.tolist(), [20, 30])
+
+    def test_to_related_counts(self):
+        counts = self.pq.to_related_counts('tag', [1, 2])
+        self.assertEqual(counts[['count', 'archived_count', 'model_documentation_count']].reset_index().values.tolist(),
+                         [[1, 2001, 1, 1, 0], [1, 2005, 1, 0, 1], [2, 2005, 2, 1, 2]])
+        counts = self.pq.filter_by_date_published(2004, 2010).to_related_counts('tag', [1, 2])
+        self.assertEqual(counts['count'].to_dict(), {(1, 2005): 1, (2, 2005): 2})
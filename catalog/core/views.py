@@ -5,6 +5,7 @@ from collections import Counter
 from datetime import timedelta, datetime
 from hashlib import sha1
 from json import dumps
+from urllib.parse import quote
 
 import markdown
 from bokeh.embed import server
@@ -22,9 +23,7 @@ from django.core.cache import cache
 from django.core.mail import send_mail
 from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
-from django.db import models
-from django.db.models import Count, Q, F, Value as V, Max
-from django.db.models.functions import Concat
+from django.db.models import Count, Max
 from django.http import JsonResponse, HttpResponseRedirect, StreamingHttpResponse, QueryDict
 from django.shortcuts import get_object_or_404, resolve_url, render, redirect
 from django.urls import reverse
@@ -39,19 +38,24 @@ from django.views.generic import TemplateView, FormView, DetailView, CreateView,
 from haystack.generic_views import SearchView
 from haystack.query import SearchQuerySet
 from rest_framework import status, renderers, generics, serializers
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from catalog.core.forms import PublicSearchForm, SuggestedPublicationForm, \
     SubmitterForm
-from catalog.core.search_indexes import PublicationDoc, PublicationDocSearch, normalize_search_querydict, \
-    get_search_index
+from catalog.core.search_indexes import PublicationDoc, CachedPublicationDocSearch, normalize_search_querydict, \
+    get_search_index, visualization_filter_search, PublicationIdSequence, RelationAggregationSequence, \
+    PUBLIC_PUBLICATION_CRITERIA
+from catalog.core.citation_graph import MAX_TREE_DEPTH, get_citation_graph
+from catalog.core.network_graph import get_network_graph
+from catalog.core.statistics import TOTAL_RELATION, get_related_ids, get_year_statistics
 from citation.export_data import PublicationCSVExporter
 from citation.graphviz.data import (generate_aggregated_code_archived_platform_data,
                                     generate_aggregated_distribution_data, generate_network_graph)
 from citation.graphviz.globals import RelationClassifier, CacheNames
-from citation.models import (Publication, InvitationEmail, Platform, Sponsor, ModelDocumentation, Tag, Container,
-                             URLStatusLog, SuggestedMerge, Submitter)
+from citation.models import (Author, Publication, InvitationEmail, Platform, Sponsor, ModelDocumentation, Tag,
+                             Container, URLStatusLog, SuggestedMerge, Submitter)
 from citation.ping_urls import categorize_url
 from citation.serializers import (InvitationSerializer, CatalogPagination, PublicationListSerializer,
                                   UpdateModelUrlSerializer, ContactFormSerializer, UserProfileSerializer,
@@ -70,9 +74,38 @@ def export_data(self):
     return response
 
 
-def queryset_gen(search_qs):
-    for item in search_qs:
-        yield item.pk
+def get_page_window(paginator, request):
+    """Start and stop offsets of the page the paginator is going to display"""
+    page_size = paginator.get_page_size(request)
+    try:
+        page_number = max(int(request.query_params.get(paginator.page_query_param, 1)), 1)
+    except ValueError:
+        page_number = 1
+    start = (page_number - 1) * page_size
+    return start, start + page_size
+
+
+def get_visualization_search(filter_criteria):
+    """Public publication search matching visualization filter criteria, unsupported criteria are a bad request"""
+    try:
+        return visualization_filter_search(filter_criteria)
+    except ValueError as e:
+        raise ParseError(str(e))
+
+
+def paginate_relation_counts(request, field_name):
+    """
+    Page of the publication and code availability counts of the entities related to the filtered publications
+
+    Counts come from a single aggregation over the public publication index
+
+    :return: the paginator, the page and whether the entity count of the paginator is approximate
+    """
+    search = get_visualization_search(visualization_query_filter(request))
+    paginator = CatalogPagination()
+    start, stop = get_page_window(paginator, request)
+    relations = RelationAggregationSequence(search, field_name, start=start, stop=stop)
+    return paginator, paginator.paginate_queryset(relations, request), relations.is_count_approximate()
 
 
 def visualization_query_filter(request):
@@ -396,14 +429,10 @@ class AggregatedJournalRelationList(LoginRequiredMixin, generics.GenericAPIView)
     renderer_classes = (renderers.TemplateHTMLRenderer, renderers.JSONRenderer)
 
     def get(self, request):
-        sqs = SearchQuerySet()
-        sqs = sqs.filter(**visualization_query_filter(request))
-        pub_pk = queryset_gen(sqs)
-        pubs = Publication.api.aggregated_list(pk__in=pub_pk, identifier='container')
-        paginator = CatalogPagination()
-        result_page = paginator.paginate_queryset(pubs, request)
+        paginator, result_page, count_is_approximate = paginate_relation_counts(request, 'container')
         serializer = PublicationAggregationSerializer(result_page, many=True)
         response = paginator.get_paginated_response(serializer.data)
+        response['count_is_approximate'] = count_is_approximate
         response['relation'] = RelationClassifier.JOURNAL.value
         return Response({'json': dumps(response)}, template_name="visualization/publication_relationlist.html")
 
@@ -416,14 +445,10 @@ class AggregatedSponsorRelationList(LoginRequiredMixin, generics.GenericAPIView)
     renderer_classes = (renderers.TemplateHTMLRenderer, renderers.JSONRenderer)
 
     def get(self, request):
-        sqs = SearchQuerySet()
-        sqs = sqs.filter(**visualization_query_filter(request))
-        pub_pk = queryset_gen(sqs)
-        pubs = Publication.api.aggregated_list(pk__in=pub_pk, identifier='sponsors')
-        paginator = CatalogPagination()
-        result_page = paginator.paginate_queryset(pubs, request)
+        paginator, result_page, count_is_approximate = paginate_relation_counts(request, 'sponsors')
         serializer = PublicationAggregationSerializer(result_page, many=True)
         response = paginator.get_paginated_response(serializer.data)
+        response['count_is_approximate'] = count_is_approximate
         response['relation'] = RelationClassifier.SPONSOR.value
         return Response({'json': dumps(response)}, template_name="visualization/publication_relationlist.html")
 
@@ -436,14 +461,10 @@ class AggregatedPlatformRelationList(LoginRequiredMixin, generics.GenericAPIView
     renderer_classes = (renderers.TemplateHTMLRenderer, renderers.JSONRenderer)
 
     def get(self, request):
-        sqs = SearchQuerySet()
-        sqs = sqs.filter(**visualization_query_filter(request)).models(Publication)
-        pub_pk = queryset_gen(sqs)
-        pubs = Publication.api.aggregated_list(pk__in=pub_pk, identifier='platforms')
-        paginator = CatalogPagination()
-        result_page = paginator.paginate_queryset(pubs, request)
+        paginator, result_page, count_is_approximate = paginate_relation_counts(request, 'platforms')
         serializer = PublicationAggregationSerializer(result_page, many=True)
         response = paginator.get_paginated_response(serializer.data)
+        response['count_is_approximate'] = count_is_approximate
         response['relation'] = RelationClassifier.PLATFORM.value
         return Response({'json': dumps(response)}, template_name="visualization/publication_relationlist.html")
 
@@ -456,26 +477,16 @@ class AggregatedAuthorRelationList(LoginRequiredMixin, generics.GenericAPIView):
     renderer_classes = (renderers.TemplateHTMLRenderer, renderers.JSONRenderer)
 
     def get(self, request):
-        sqs = SearchQuerySet()
-        sqs = sqs.filter(**visualization_query_filter(request)).models(Publication)
-        pub_pk = queryset_gen(sqs)
-        pubs = Publication.api.primary(pk__in=pub_pk). \
-            annotate(given_name=F('creators__given_name'), family_name=F('creators__family_name')). \
-            values('given_name', 'family_name'). \
-            order_by('given_name', 'family_name'). \
-            annotate(published_count=Count('given_name'),
-                     code_availability_count=models.Sum(models.Case(
-                         models.When(~Q(code_archive_url=''), then=1),
-                         default=0,
-                         output_field=models.IntegerField())),
-                     name=Concat('given_name', V(' '), 'family_name')). \
-            values('name', 'published_count', 'code_availability_count', 'given_name', 'family_name'). \
-            order_by('-published_count')
-
-        paginator = CatalogPagination()
-        result_page = paginator.paginate_queryset(pubs, request)
+        paginator, result_page, count_is_approximate = paginate_relation_counts(request, 'authors')
+        # the index only stores full names, read the name parts of the displayed authors
+        names = Author.objects.filter(pk__in=[author['id'] for author in result_page]) \
+            .values_list('pk', 'given_name', 'family_name')
+        names = {pk: (given_name, family_name) for pk, given_name, family_name in names}
+        for author in result_page:
+            author['given_name'], author['family_name'] = names.get(author['id'], (author['name'], ''))
         serializer = AuthorAggregrationSerializer(result_page, many=True)
         response = paginator.get_paginated_response(serializer.data)
+        response['count_is_approximate'] = count_is_approximate
         response['relation'] = RelationClassifier.AUTHOR.value
         return Response({'json': dumps(response)}, template_name="visualization/publication_relationlist.html")
 
@@ -530,14 +541,14 @@ class AggregatedCodeArchivedURLView(LoginRequiredMixin, generics.GenericAPIView)
                     years.append(date_published)
                     all_records[(date_published, category)] += 1
         else:
-            sqs = SearchQuerySet()
-            sqs = sqs.filter(**visualization_query_filter(request))
-            filtered_pubs = queryset_gen(sqs)
-            pubs = Publication.api.primary(pk__in=filtered_pubs)
-            for pub in pubs:
-                if pub.code_archive_url is not '' and pub.year_published is not None:
-                    years.append(pub.year_published)
-                    all_records[(pub.year_published, categorize_url(pub.code_archive_url))] += 1
+            search = get_visualization_search(visualization_query_filter(request)) \
+                .filter('term', code_availability=1) \
+                .source(['code_archive_url', 'date_published'])
+            for pub in search.scan():
+                date_published = getattr(pub, 'date_published', None)
+                if date_published is not None:
+                    years.append(date_published.year)
+                    all_records[(date_published.year, categorize_url(pub.code_archive_url))] += 1
 
         group = []
         data = [['x']]
@@ -556,6 +567,81 @@ class AggregatedCodeArchivedURLView(LoginRequiredMixin, generics.GenericAPIView)
                         template_name="visualization/code_archived_url_staged_bar.html")
 
 
+# statistics relation and name filter lookup of the visualization relations
+STATISTICS_RELATIONS = {
+    RelationClassifier.GENERAL.value: (TOTAL_RELATION, None),
+    RelationClassifier.JOURNAL.value: ('container', 'container__name'),
+    RelationClassifier.SPONSOR.value: ('sponsors', 'sponsors__name'),
+    RelationClassifier.PLATFORM.value: ('platforms', 'platforms__name'),
+    RelationClassifier.MODELDOCUMENDTATION.value: ('model_documentation', 'model_documentation__name'),
+    RelationClassifier.AUTHOR.value: ('authors', 'authors__name__exact'),
+}
+
+
+def get_statistics_query(filter_criteria, relation):
+    """
+    Relation, entity name and year range of the materialized statistics answering filter_criteria
+
+    The statistics are kept per year for the public publications so they only answer criteria made of exactly the
+    public publication criteria, the name of a single entity of the relation and publication dates covering whole
+    years.
+
+    :return: None if the criteria can not be answered from the statistics
+    """
+    statistics_relation, name_lookup = STATISTICS_RELATIONS.get(relation, (None, None))
+    if statistics_relation is None or (name_lookup is not None and name_lookup not in filter_criteria):
+        return None
+    date_lookups = {'date_published__gte': (1, 1), 'date_published__lte': (12, 31)}
+    lookups = set(filter_criteria) - {name_lookup} - set(date_lookups)
+    if {lookup: filter_criteria[lookup] for lookup in lookups} != PUBLIC_PUBLICATION_CRITERIA:
+        return None
+    years = []
+    for lookup, month_day in date_lookups.items():
+        value = filter_criteria.get(lookup)
+        if value is None:
+            years.append(None)
+            continue
+        try:
+            value = datetime_parse(value) if isinstance(value, str) else value
+        except (ValueError, OverflowError):
+            return None
+        if (value.month, value.day) != month_day:
+            return None
+        years.append(value.year)
+    start_year, end_year = years
+    return statistics_relation, filter_criteria.get(name_lookup), start_year, end_year
+
+
+def get_distribution_data(filter_criteria, relation, name):
+    """
+    Yearly code availability distribution of the filtered publications
+
+    Filters on a single relation entity and on whole publication years are answered from the materialized
+    statistics. Any other filter falls back to aggregating the publications.
+    """
+    statistics_query = get_statistics_query(filter_criteria, relation)
+    if statistics_query is None:
+        return generate_aggregated_distribution_data(filter_criteria, relation, name)
+
+    statistics_relation, related_name, start_year, end_year = statistics_query
+    related_ids = get_related_ids(statistics_relation, related_name)
+    statistics = get_year_statistics(statistics_relation, related_ids, start_year=start_year, end_year=end_year)
+    distribution_data = []
+    for row in statistics:
+        total = row['publication_count']
+        available = row['code_availability_count']
+        distribution_data.append({
+            'relation': relation,
+            'name': name,
+            'date': row['year'],
+            'Code Available': available,
+            'Code Not Available': total - available,
+            'Code Available Per': available * 100 / total if total else 0,
+            'Code Not Available Per': (total - available) * 100 / total if total else 0
+        })
+    return distribution_data
+
+
 class AggregatedStagedVisualizationView(LoginRequiredMixin, generics.GenericAPIView):
     """
         Generates the aggregated staged distribution of code availability and non-availability against year
@@ -589,7 +675,7 @@ class AggregatedStagedVisualizationView(LoginRequiredMixin, generics.GenericAPIV
                 return Response(
                     {"aggregated_data": json.dumps(distribution_data), "code_platform": json.dumps([platform])},
                     template_name="visualization/pubvsyear.html")
-        distribution_data = generate_aggregated_distribution_data(filter_criteria, relation, name)
+        distribution_data = get_distribution_data(filter_criteria, relation, name)
         platform = generate_aggregated_code_archived_platform_data(filter_criteria)
         return Response({"aggregated_data": json.dumps(distribution_data), "code_platform": json.dumps([platform])},
                         template_name="visualization/pubvsyear.html")
@@ -618,12 +704,12 @@ class PublicationListDetail(LoginRequiredMixin, generics.GenericAPIView):
         elif relation == RelationClassifier.AUTHOR.value:
             filter_criteria.update(authors__name__exact=name.replace("/", " "))
 
-        sqs = SearchQuerySet()
-        sqs = sqs.filter(**filter_criteria).models(Publication)
-        pubs_pk = queryset_gen(sqs)
-        pubs = Publication.api.primary(pk__in=pubs_pk)
+        search = get_visualization_search(filter_criteria).sort('-date_published', 'id')
         paginator = CatalogPagination()
-        result_page = paginator.paginate_queryset(pubs, request)
+        start, stop = get_page_window(paginator, request)
+        pub_ids = paginator.paginate_queryset(PublicationIdSequence(search, start=start, stop=stop), request)
+        pubs = Publication.api.primary(pk__in=pub_ids).in_bulk()
+        result_page = [pubs[pk] for pk in pub_ids if pk in pubs]
         serializer = PublicationListSerializer(result_page, many=True)
         response = paginator.get_paginated_response(serializer.data)
         return Response({'json': dumps(response)}, template_name="publication/list.html")
@@ -634,38 +720,25 @@ class NetworkRelationDetail(LoginRequiredMixin, generics.GenericAPIView):
 
     def get(self, request, pk=None):
         filter_criteria = request.session.get("filter_criteria", {})
-        # fetching only filtered publication
-        primary_publications = Publication.api.primary(**filter_criteria)
-
-        # fetches links that satisfies the given filter
-        links_candidates = Publication.api.primary(**filter_criteria,
-                                                   citations__in=primary_publications).values_list('pk', 'citations')
-        data = {}
-        for source, target in links_candidates:
-            target_list = data.get(str(source))
-            if target_list and str(target) not in target_list:
-                target_list.append(str(target))
-                data[str(source)] = target_list
-            else:
-                data[str(source)] = [str(target)]
-
-        res = self.generate_tree(pk, data)
+        try:
+            depth = min(int(request.query_params.get('depth', MAX_TREE_DEPTH)), MAX_TREE_DEPTH)
+        except ValueError:
+            depth = MAX_TREE_DEPTH
+        try:
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            offset = 0
+        # publications the client already shows are left out of subtrees so that expanding never duplicates them
+        exclude = [int(shown_pk) for shown_pk in request.query_params.get('exclude', '').split(',')
+                   if shown_pk.isdigit()]
+        res = get_citation_graph(filter_criteria).tree(int(pk), max_depth=depth, offset=offset, exclude=exclude)
+        if request.accepted_renderer.format == 'json':
+            # subtree of a node expanded in the collapsible tree
+            return Response(res)
         message = Publication.objects.get(pk=pk).get_message()
         return Response({'result': dumps(res), 'description': dumps(message)},
                         template_name="visualization/collapsible-tree.html")
 
-    def generate_tree(self, root, data):
-        nodes = data.get(str(root))
-        if nodes is None:
-            return {'name': root, 'children': []}
-
-        children = []
-        for node in nodes:
-            if node != root:
-                children.append(self.generate_tree(node, data))
-
-        return {'name': root, 'children': children}
-
 
 class NetworkRelation(LoginRequiredMixin, generics.GenericAPIView):
     renderer_classes = (renderers.TemplateHTMLRenderer, renderers.JSONRenderer)
@@ -680,9 +753,12 @@ class NetworkRelation(LoginRequiredMixin, generics.GenericAPIView):
                 not network and not filter_group:
             if 'tags__name__in' not in filter_criteria:
                 filter_criteria.update(tags__name__in=Publication.api.get_top_records('tags__name', 5))
-            network_data = generate_network_graph(filter_criteria)
-            network = network_data.graph
-            filter_group = network_data.filter_value
+            try:
+                network, filter_group = get_network_graph(filter_criteria)
+            except ValueError:
+                network_data = generate_network_graph(filter_criteria)
+                network = network_data.graph
+                filter_group = network_data.filter_value
 
         return Response({"data": json.dumps(network), "group": json.dumps(filter_group)},
                         template_name="visualization/network-graph.html")
@@ -695,37 +771,86 @@ def create_paginator_url(page: int, query_dict: QueryDict):
     return url
 
 
-def create_paginator(current_page: int, query_dict: QueryDict, total_hits, page_size=10):
+def create_cursor_paginator_url(cursor: str, query_dict: QueryDict):
+    url = '?after={}'.format(quote(cursor))
+    if query_dict:
+        url += '&{}'.format(query_dict.urlencode())
+    return url
+
+
+def dump_search_cursor(page: int, sort_values):
+    return signing.dumps({'page': page, 'after': list(sort_values)}, salt='public-search', compress=True)
+
+
+def load_search_cursor(cursor):
+    """Return the page number and search_after sort values of an opaque page token, or None if it is invalid"""
+    if not cursor:
+        return None
+    try:
+        data = signing.loads(cursor, salt='public-search')
+        return int(data['page']), data['after']
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+
+def create_paginator(current_page: int, query_dict: QueryDict, total_hits, page_size=10, max_page_depth=None,
+                     next_cursor=None):
+    """
+    Links to pages around the current page
+
+    Pages past max_page_depth cannot be reached with from/size pagination so they are only linked to
+    sequentially with the next_cursor page token, shallower pages keep their page number links
+    """
     n_pages = -(-total_hits // page_size)
+    last_page = n_pages if max_page_depth is None else min(n_pages, max_page_depth)
     paginator = {}
-    if current_page - 1 > 0:
+    if 0 < current_page - 1 <= last_page:
         paginator['previous'] = create_paginator_url(current_page - 1, query_dict)
     if current_page + 1 <= n_pages:
-        paginator['next'] = create_paginator_url(current_page + 1, query_dict)
+        if current_page + 1 <= last_page:
+            paginator['next'] = create_paginator_url(current_page + 1, query_dict)
+        elif next_cursor is not None:
+            paginator['next'] = create_cursor_paginator_url(next_cursor, query_dict)
     paginator['range'] = [{'page': page, 'url': create_paginator_url(page, query_dict)} for page in
-                          range(max(current_page - 5, 1), min(current_page + 5, n_pages + 1))]
+                          range(max(current_page - 5, 1), min(current_page + 5, last_page + 1))]
     if current_page - 5 > 1:
         paginator['min'] = {'page': 1, 'url': create_paginator_url(1, query_dict)}
         paginator['min_exact'] = current_page - 5 == 2
-    if current_page + 5 <= n_pages:
-        paginator['max'] = {'page': n_pages, 'url': create_paginator_url(n_pages, query_dict)}
-        paginator['max_exact'] = current_page + 5 == n_pages
+    if current_page + 5 <= last_page:
+        paginator['max'] = {'page': last_page, 'url': create_paginator_url(last_page, query_dict)}
+        paginator['max_exact'] = current_page + 5 == last_page
     return paginator
 
 
 def public_search_view(request):
     search, filters = normalize_search_querydict(request.GET)
     query_dict = request.GET.copy()
-    current_page = int(query_dict.pop('page', [1])[0])
-
-    from_qs = (current_page - 1) * 10
-    to_qs = from_qs + 10
-    publication_query = PublicationDocSearch().find(q=search, facet_filters=filters)[from_qs:to_qs].agg_by_count()
-    publications = publication_query.execute(facet_filters=filters)
-    facets = publication_query.cache
+    try:
+        current_page = int(query_dict.pop('page', [1])[0])
+    except ValueError:
+        current_page = 1
+    cursor = load_search_cursor(query_dict.pop('after', [None])[0])
+    page_size = 10
+    max_page_depth = settings.PUBLIC_SEARCH_MAX_PAGE_DEPTH
+
+    publication_search = CachedPublicationDocSearch(search=search, facet_filters=filters)
+    if cursor is not None:
+        current_page, search_after = cursor
+        publications, facets = publication_search.execute(0, page_size, search_after=search_after)
+    else:
+        current_page = max(min(current_page, max_page_depth), 1)
+        start = (current_page - 1) * page_size
+        publications, facets = publication_search.execute(start, start + page_size)
+    from_qs = (current_page - 1) * page_size
+    to_qs = from_qs + page_size
 
     total_hits = publications.hits.total
-    paginator = create_paginator(current_page=current_page, query_dict=query_dict, total_hits=total_hits)
+    hits = publications.hits
+    next_cursor = None
+    if current_page >= max_page_depth and len(hits) == page_size:
+        next_cursor = dump_search_cursor(current_page + 1, hits[-1].meta.sort)
+    paginator = create_paginator(current_page=current_page, query_dict=query_dict, total_hits=total_hits,
+                                 page_size=page_size, max_page_depth=max_page_depth, next_cursor=next_cursor)
     form = PublicSearchForm(initial={'search': search})
 
     visualization_url = reverse('core:public-visualization')
@@ -760,9 +885,7 @@ def public_visualization_view(request):
 
     content_type = request.GET.get('content_type', 'sponsors')
     search, filters = normalize_search_querydict(request.GET)
-    publication_query = PublicationDocSearch().find(q=search, facet_filters=filters)[:0].agg_by_count()
-    publication_query.execute(facet_filters=filters)
-    facets = publication_query.cache
+    facets = CachedPublicationDocSearch(search=search, facet_filters=filters).get_facets()
     arguments = request.GET.copy()
     arguments.pop('page', None)
 
@@ -865,7 +988,10 @@ def autocomplete(request):
     content_type = ContentType.objects.get(model=model_name)
     model = content_type.model_class()
     model_doc = get_search_index(model)
-    response = model_doc.search().query('match', name=search).execute()
+    # rank names used by more publications higher among similar matches
+    response = model_doc.search().query('function_score', query={'match': {'name': search}},
+                                        field_value_factor={'field': 'publication_count', 'modifier': 'log1p',
+                                                            'missing': 0}).execute()
     return JsonResponse({'matches': [{'id': h.id, 'name': h.name} for h in response.hits]})
 
 
@@ -35,6 +35,10 @@ ADMINS = (
 MANAGERS = ADMINS
 
 DATA_DIR = 'data'
+# memory mapped snapshots of the tables shared by the bokeh visualization server processes
+VISUALIZATION_SNAPSHOT_DIR = os.path.join(BASE_DIR, DATA_DIR, 'visualization')
+# seconds between checks for database changes by the bokeh visualization server
+VISUALIZATION_REFRESH_INTERVAL = 60 * 60
 
 HAYSTACK_CONNECTIONS = {
     'default': {
@@ -60,6 +64,11 @@ ELASTICSEARCH = {
     }
 }
 
+# seconds public search result pages and facet counts are cached for
+PUBLIC_SEARCH_CACHE_TIMEOUT = 60 * 5
+# deepest public search page that can be jumped to directly, later pages are only reachable with next page links
+PUBLIC_SEARCH_MAX_PAGE_DEPTH = 100
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql_psycopg2',
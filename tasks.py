@@ -162,7 +162,8 @@ def zotero_import(ctx, group=None, collection=None):
 
 
 @task(aliases=['ri'])
-def rebuild_index(ctx, noinput=False):
+def rebuild_index(ctx, noinput=False, processes=0, threads=2, chunk_size=500, queue_size=4, max_memory=0,
+                  in_place=False):
     import django
     django.setup()
     from catalog.core.search_indexes import bulk_index_public
@@ -170,7 +171,22 @@ def rebuild_index(ctx, noinput=False):
     if noinput:
         cmd += ' --noinput'
     ctx.run(cmd.format(**env))
-    bulk_index_public()
+    bulk_index_public(processes=processes or None, thread_count=threads, chunk_size=chunk_size,
+                      queue_size=queue_size, max_memory_mb=max_memory or None, in_place=in_place)
+
+
+@task
+def rollback_index(ctx):
+    import django
+    django.setup()
+    from catalog.core.search_indexes import rollback_public_indices
+    for alias, name in rollback_public_indices().items():
+        print('{} -> {}'.format(alias, name))
+
+
+@task(aliases=['rs'])
+def refresh_statistics(ctx):
+    dj(ctx, 'refresh_statistics')
 
 
 @task
@@ -188,7 +204,7 @@ def setup_postgres(ctx):
     print("Postgres user {db_user} and db {db_name} created.".format(**env))
 
 
-@task(setup_postgres, initialize_database_schema, zotero_import, rebuild_index)
+@task(setup_postgres, initialize_database_schema, zotero_import, rebuild_index, refresh_statistics)
 def setup(ctx):
     print("Omnibus setup invoked.")
 
@@ -7,43 +7,36 @@ import django
 from bokeh.command.util import build_single_handler_application
 from bokeh.embed import server_document
 from bokeh.server.server import Server
-from django.apps import apps
-from django.db.models import Q
 from flask import Flask, abort, render_template, request, jsonify
 from tornado.ioloop import IOLoop
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "catalog.settings")
 sys.path.insert(2, '/code')
-sys.path.insert(3, '/code/visualization/util')
+# the bokeh app imports its modules as top level modules, share its data cache with the autocomplete
+sys.path.insert(3, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'visualization'))
 pprint.pprint(sys.path)
 django.setup()
 
-from haystack.query import SearchQuerySet
-from citation.models import Author, Container, Platform, Sponsor, Tag, Publication
+from data_access import data_cache
+
+AUTOCOMPLETE_LIMIT = 20
+# related tables of the data cache keyed by the model names the autocomplete is queried with
+AUTOCOMPLETE_RELATED_NAMES = {'author': 'authors', 'container': 'container', 'platform': 'platforms',
+                              'sponsor': 'sponsors', 'tag': 'tags'}
 
 app = Flask(__name__)
 
 
 @app.route('/autocomplete/<string:model_name>')
 def autocomplete(model_name):
-    model_names = [m._meta.model_name for m in [Author, Container, Platform, Sponsor, Tag]]
-    if model_name not in model_names:
+    if model_name not in AUTOCOMPLETE_RELATED_NAMES:
         abort(404)
-    model = apps.get_model('citation', model_name)
-
-    q = request.args.get('q')
-    if model == Container:
-        containers = Container.objects.filter(id__in=Publication.api.primary().values_list('container', flat=True))
-        if q:
-            containers = containers.filter(Q(name__iregex=q) | Q(issn__iexact=q))
-        return jsonify([dict(value=c.pk, label=c.name) for c in containers[:20]])
-
-    search_results = SearchQuerySet().models(model).order_by('name')
-    if q:
-        search_results = search_results.autocomplete(name=q)
-    pks = [int(pk) for pk in search_results.values_list('pk', flat=True)]
-    results = model.objects.filter(pk__in=pks)[:20]
-    return jsonify([dict(value=r.pk, label=r.name) for r in results])
+    try:
+        limit = max(1, min(int(request.args.get('limit', AUTOCOMPLETE_LIMIT)), AUTOCOMPLETE_LIMIT))
+    except ValueError:
+        abort(400)
+    api = data_cache.get_model_data_access_api(AUTOCOMPLETE_RELATED_NAMES[model_name])
+    return jsonify(api.search_options(request.args.get('q'), limit=limit))
 
 
 @app.route('/', methods=['GET'])
@@ -1,70 +1,77 @@
-from bokeh.models import Legend
+from bokeh.models import ColumnDataSource, Legend, LegendItem
 from bokeh.palettes import Spectral10
 from bokeh.plotting import figure
 
-from data_access import data_cache, IncludedStatistics
-
-
-def create_chart(statistic_indices, publication_count_df):
-    p = figure(
-        tools='pan,wheel_zoom,save',
-        title='Publication Counts Over Time',
-        plot_width=800)
-    p.outline_line_color = None
-    p.grid.grid_line_color = None
-    p.xaxis.axis_label = 'Year'
-    p.yaxis.axis_label = 'Publication Added Count'
-    color_mapper = Spectral10
-
-    name_legend_items = []
-
-    all_publication_df = publication_count_df[publication_count_df.group == 'all']
-    all_publications_line = p.line(
-        x=all_publication_df.index.get_level_values('year_published'),
-        y=all_publication_df['count'],
-        line_width=2,
-        color=color_mapper[0])
-    name_legend_items.append(('All publications', [all_publications_line]))
-
-    matched_publication_df = publication_count_df[publication_count_df.group == 'matched']
-    matched_publications_line = p.line(
-        x=matched_publication_df.index.get_level_values('year_published'),
-        y=matched_publication_df['count'],
-        line_width=2,
-        color=color_mapper[1])
-    name_legend_items.append(('Matching publications', [matched_publications_line]))
-
-    name_legend = Legend(items=name_legend_items, location='top_left')
-
-    line_style_legend_items = []
-    for statistic_index in statistic_indices:
-        statistic_name = IncludedStatistics.names()[statistic_index]
-        statistic_style = IncludedStatistics.styles()[statistic_index]
-        p.line(
-            x=all_publication_df.index.get_level_values('year_published'),
-            y=all_publication_df[statistic_name],
-            line_width=2,
-            color=color_mapper[0],
-            line_dash=statistic_style)
-
-    for statistic_index in statistic_indices:
-        statistic_name = IncludedStatistics.names()[statistic_index]
-        statistic_style = IncludedStatistics.styles()[statistic_index]
-        p.line(
-            x=matched_publication_df.index.get_level_values('year_published'),
-            y=matched_publication_df[statistic_name],
-            line_width=2,
-            color=color_mapper[1],
-            line_dash=statistic_style)
-
-    for statistic_index in statistic_indices:
-        statistic_label = IncludedStatistics.labels()[statistic_index]
-        statistic_style = IncludedStatistics.styles()[statistic_index]
-        r = p.line(x=[], y=[], line_width=2, color='black',
-                   line_dash=statistic_style)  # Fake glyphs for rendering styles
-        line_style_legend_items.append((statistic_label, [r]))
-    line_style_legend = Legend(items=line_style_legend_items, location='top_right')
-
-    p.add_layout(name_legend)
-    p.add_layout(line_style_legend)
-    return p
+from data_access import IncludedStatistics
+
+GROUPS = [('all', 'All publications'), ('matched', 'Matching publications')]
+
+
+def create_source_data(df):
+    data = {name: df[name].values for name in ['count'] + IncludedStatistics.names()}
+    data['year_published'] = df.index.get_level_values('year_published').values
+    return data
+
+
+def create_style_legend_items(style_renderers, statistic_indices):
+    return [LegendItem(label=IncludedStatistics.labels()[statistic_index],
+                       renderers=[style_renderers[statistic_index]])
+            for statistic_index in statistic_indices]
+
+
+def create_style_renderers(p):
+    # Fake glyphs for rendering styles
+    return [p.line(x=[], y=[], line_width=2, color='black', line_dash=statistic_style)
+            for statistic_style in IncludedStatistics.styles()]
+
+
+class PublicationCountsChart:
+    """
+    Publication counts of all and matching publications over time
+
+    Every line is created once. Interactions toggle the visibility of the statistic lines so only those
+    properties are synced to the browser.
+    """
+
+    def __init__(self, statistic_indices, publication_count_df):
+        p = figure(
+            tools='pan,wheel_zoom,save',
+            title='Publication Counts Over Time',
+            plot_width=800)
+        p.outline_line_color = None
+        p.grid.grid_line_color = None
+        p.xaxis.axis_label = 'Year'
+        p.yaxis.axis_label = 'Publication Added Count'
+        color_mapper = Spectral10
+
+        self.sources = {}
+        self.statistic_renderers = [[] for _ in IncludedStatistics.names()]
+        name_legend_items = []
+        for i, (group, label) in enumerate(GROUPS):
+            source = ColumnDataSource(create_source_data(publication_count_df[publication_count_df.group == group]))
+            self.sources[group] = source
+            r = p.line(x='year_published', y='count', source=source, line_width=2, color=color_mapper[i])
+            name_legend_items.append((label, [r]))
+            for statistic_index, statistic_name in enumerate(IncludedStatistics.names()):
+                self.statistic_renderers[statistic_index].append(p.line(
+                    x='year_published',
+                    y=statistic_name,
+                    source=source,
+                    line_width=2,
+                    color=color_mapper[i],
+                    line_dash=IncludedStatistics.styles()[statistic_index],
+                    visible=statistic_index in statistic_indices))
+        self.style_renderers = create_style_renderers(p)
+        self.line_style_legend = Legend(items=create_style_legend_items(self.style_renderers, statistic_indices),
+                                        location='top_right')
+
+        p.add_layout(Legend(items=name_legend_items, location='top_left'))
+        p.add_layout(self.line_style_legend)
+        self.figure = p
+
+    def update_statistics(self, statistic_indices):
+        for statistic_index, renderers in enumerate(self.statistic_renderers):
+            for r in renderers:
+                r.visible = statistic_index in statistic_indices
+        self.line_style_legend.items = create_style_legend_items(self.style_renderers, statistic_indices)
+
@@ -1,51 +1,113 @@
-from bokeh.models import Legend
+import numpy as np
+from bokeh.models import ColumnDataSource, Legend, LegendItem
 from bokeh.palettes import Spectral10
 from bokeh.plotting import figure
 
+from components.publication_counts import create_source_data, create_style_legend_items, create_style_renderers
 from data_access import data_cache, IncludedStatistics
 
 
-def create_chart(query, statistic_indices, publication_count_df):
-    p = figure(
-        tools='pan,wheel_zoom,save',
-        title='Publication Counts By {} Over Time'.format(query.content_type.title()),
-        plot_width=800)
-    p.outline_line_color = None
-    p.grid.grid_line_color = None
-    p.xaxis.axis_label = 'Year'
-    p.yaxis.axis_label = 'Publication Added Count'
-    color_mapper = Spectral10
-    api = data_cache.get_model_data_access_api(query.content_type)
-
-    name_legend_items = []
-    for i, (related_id, dfg) in enumerate(publication_count_df.groupby('related__id')):
-        name = api.get_related_names(related_id)['name']
-        r = p.line(
-            x=dfg.index.get_level_values('year_published'),
-            y=dfg['count'],
-            line_width=2,
-            color=color_mapper[i])
-        name_legend_items.append((name, [r]))
-        for statistic_index in statistic_indices:
-            statistic_name = IncludedStatistics.names()[statistic_index]
-            statistic_style = IncludedStatistics.styles()[statistic_index]
-            p.line(
-                x=dfg.index.get_level_values('year_published'),
-                y=dfg[statistic_name],
-                line_width=2,
-                color=color_mapper[i],
-                line_dash=statistic_style)
-    name_legend = Legend(items=name_legend_items, location='top_left')
-
-    line_style_legend_items = []
-    for statistic_index in statistic_indices:
-        statistic_label = IncludedStatistics.labels()[statistic_index]
-        statistic_style = IncludedStatistics.styles()[statistic_index]
-        r = p.line(x=[], y=[], line_width=2, color='black',
-                   line_dash=statistic_style)  # Fake glyphs for rendering styles
-        line_style_legend_items.append((statistic_label, [r]))
-    line_style_legend = Legend(items=line_style_legend_items, location='top_right')
-
-    p.add_layout(name_legend)
-    p.add_layout(line_style_legend)
-    return p
+def empty_source_data():
+    return {name: [] for name in ['year_published', 'count'] + IncludedStatistics.names()}
+
+
+class PublicationCountsOverTimeChart:
+    """
+    Publication counts of the selected related entities over time
+
+    Lines are created up front for as many entities as there are colors. Changing the selection patches the data
+    of the sources and hides the lines of unused slots instead of building a new figure.
+    """
+
+    def __init__(self, query, statistic_indices, publication_count_df):
+        p = figure(
+            tools='pan,wheel_zoom,save',
+            title='Publication Counts By {} Over Time'.format(query.content_type.title()),
+            plot_width=800)
+        p.outline_line_color = None
+        p.grid.grid_line_color = None
+        p.xaxis.axis_label = 'Year'
+        p.yaxis.axis_label = 'Publication Added Count'
+        color_mapper = Spectral10
+        self.content_type = query.content_type
+        self.statistic_indices = list(statistic_indices)
+
+        self.sources = []
+        self.count_renderers = []
+        self.statistic_renderers = []
+        for color in color_mapper:
+            source = ColumnDataSource(empty_source_data())
+            self.sources.append(source)
+            self.count_renderers.append(p.line(x='year_published', y='count', source=source, line_width=2,
+                                               color=color, visible=False))
+            self.statistic_renderers.append([
+                p.line(x='year_published', y=statistic_name, source=source, line_width=2, color=color,
+                       line_dash=statistic_style, visible=False)
+                for statistic_name, statistic_style in zip(IncludedStatistics.names(), IncludedStatistics.styles())])
+        self.name_legend = Legend(items=[], location='top_left')
+
+        self.style_renderers = create_style_renderers(p)
+        self.line_style_legend = Legend(items=create_style_legend_items(self.style_renderers, statistic_indices),
+                                        location='top_right')
+
+        p.add_layout(self.name_legend)
+        p.add_layout(self.line_style_legend)
+        self.figure = p
+        self.n_related = 0
+        self.name_legend_labels = []
+        self.update_data(publication_count_df)
+
+    def _update_visibility(self):
+        for slot, (count_renderer, statistic_renderers) in enumerate(zip(self.count_renderers,
+                                                                         self.statistic_renderers)):
+            in_use = slot < self.n_related
+            count_renderer.visible = in_use
+            for statistic_index, r in enumerate(statistic_renderers):
+                r.visible = in_use and statistic_index in self.statistic_indices
+
+    def update_statistics(self, statistic_indices):
+        if list(statistic_indices) == self.statistic_indices:
+            return
+        self.statistic_indices = list(statistic_indices)
+        self._update_visibility()
+        self.line_style_legend.items = create_style_legend_items(self.style_renderers, statistic_indices)
+
+    @staticmethod
+    def _update_source(source, data):
+        """
+        Replace the data of a source
+
+        Only the range of changed values of each column is sent to the browser when the columns keep their length
+        """
+        current = source.data
+        if set(current) != set(data) or any(len(current[name]) != len(values) for name, values in data.items()):
+            source.data = data
+            return
+        patches = {}
+        for name, values in data.items():
+            values = np.asarray(values)
+            changed = np.flatnonzero(np.asarray(current[name]) != values)
+            if len(changed):
+                start, stop = int(changed[0]), int(changed[-1]) + 1
+                patches[name] = [(slice(start, stop), values[start:stop].tolist())]
+        if patches:
+            source.patch(patches)
+
+    def update_data(self, publication_count_df):
+        # names are looked up in the current version which may have been swapped in since the chart was created
+        api = data_cache.get_model_data_access_api(self.content_type)
+        groups = list(publication_count_df.groupby('related__id'))[:len(self.sources)]
+        name_legend_labels = []
+        for slot, source in enumerate(self.sources):
+            if slot < len(groups):
+                related_id, dfg = groups[slot]
+                self._update_source(source, create_source_data(dfg))
+                name_legend_labels.append(api.get_related_name(related_id))
+            elif slot < self.n_related:
+                source.data = empty_source_data()
+        self.n_related = len(groups)
+        self._update_visibility()
+        if name_legend_labels != self.name_legend_labels:
+            self.name_legend_labels = name_legend_labels
+            self.name_legend.items = [LegendItem(label=label, renderers=[self.count_renderers[slot]])
+                                      for slot, label in enumerate(name_legend_labels)]
@@ -1,14 +1,26 @@
 import enum
 import logging
+import os
+import threading
+import time
 from pprint import pformat
 
+import numpy as np
 import pandas as pd
-from django.db.models import QuerySet
+from django import db
+from django.conf import settings
+from django.db.models import QuerySet, Count, Max
 from django_pandas.io import read_frame
 
+import snapshot
+from query_cache import LRUCache
+from query import Query
+from catalog.core.prefix_index import PrefixIndex
 from catalog.core.search_indexes import PublicationDocSearch
+from catalog.core.statistics import get_public_publications, ODD_DOCUMENTATION, FORMAL_DESCRIPTION_DOCUMENTATION, \
+    VISUAL_DOCUMENTATION
 from citation.models import Publication, Author, PublicationAuthors, Platform, PublicationPlatforms, Sponsor, \
-    PublicationSponsors, Tag, PublicationTags, Container
+    PublicationSponsors, Tag, PublicationTags, Container, ModelDocumentation
 
 logger = logging.getLogger('data_access')
 
@@ -46,66 +58,227 @@ class IncludedStatistics(enum.Enum):
 
 
 class SearchMixin:
-    def get_full_text_matches(self, query, facet_filters):
-        publication_ids = [p.id for p in
-                           PublicationDocSearch().find(q=query, facet_filters=facet_filters).source(['id']).scan()]
-        publication_matches = self.data_cache.publications.loc[publication_ids]
-        return publication_matches
+    def get_full_text_match_mask(self, query: Query):
+        return self.data_cache.get_match_mask(query)
 
     def get_related_names(self, related_ids):
         related_table = getattr(self.data_cache, self.related_name)
         return related_table.loc[related_ids]
 
+    def get_related_name(self, related_id):
+        """Name of a related entity or its id if the entity is not part of this version"""
+        related_table = getattr(self.data_cache, self.related_name)
+        if related_id in related_table.index:
+            return related_table.at[related_id, 'name']
+        return str(related_id)
+
+    def get_option_aliases(self, related_table):
+        """Other names than their name every related entity is found by"""
+        return None
+
+    def search_options(self, q, limit=20):
+        """Options of the related entities with a word of their name starting with q ranked by publication count"""
+        return self.data_cache.get_prefix_index(self.related_name, self.get_memberships,
+                                                self.get_option_aliases).search(q, limit=limit)
+
+
+class YearRelatedCountsMixin:
+    def get_memberships(self):
+        """Publication ids and related entity ids of every publication membership of the related entities"""
+        raise NotImplementedError
 
-class ManyToManyModelDataAccess(SearchMixin):
+    def get_year_related_counts(self, query: Query, related_ids, bucket_size=1):
+        """Year related counts of the publications matching query by buckets of bucket_size years"""
+        return self.data_cache.get_year_related_counts(self.related_name, self.get_memberships, related_ids,
+                                                       query=query, bucket_size=bucket_size)
+
+
+class ManyToManyModelDataAccess(YearRelatedCountsMixin, SearchMixin):
     def __init__(self, data_cache: 'DataCache', related_name, related_through_name):
         self.data_cache = data_cache
         self.related_name = related_name
         self.related_through_name = related_through_name
 
-    def get_year_related_counts(self, df: pd.DataFrame, related_ids):
+    def get_memberships(self):
         related_through_table = getattr(self.data_cache, self.related_through_name)
-        related = related_through_table[related_through_table.related__id.isin(related_ids)]
-        _counts_df = df.join(related, how='inner').groupby(['year_published', 'related__id']).agg(
-            dict(title='count', is_archived='sum',
-                 has_formal_description='sum', has_odd='sum', has_visual_documentation='sum'))
-        mi = self.data_cache.get_all_year_related_combinations(related_ids)
-        counts_df = _counts_df.reindex(mi, fill_value=0)
-        return counts_df.rename(columns={
-            'title': 'count',
-            'is_archived': IncludedStatistics.code_availability_count.name,
-            'has_formal_description': IncludedStatistics.formal_description_count.name,
-            'has_odd': IncludedStatistics.odd_count.name,
-            'has_visual_documentation': IncludedStatistics.visual_documentation_count.name
-        })
-
-
-class JournalDataAccess(SearchMixin):
+        return related_through_table.index.values, related_through_table.related__id.values
+
+
+class JournalDataAccess(YearRelatedCountsMixin, SearchMixin):
     related_name = 'container'
 
     def __init__(self, data_cache: 'DataCache'):
         self.data_cache = data_cache
 
-    def get_year_related_counts(self, df: pd.DataFrame, related_ids):
-        renames = {
-            'title': 'count',
-            'is_archived': IncludedStatistics.code_availability_count.name,
-            'has_formal_description': IncludedStatistics.formal_description_count.name,
-            'has_odd': IncludedStatistics.odd_count.name,
-            'has_visual_documentation': IncludedStatistics.visual_documentation_count.name
-        }
-        counts_df = df[df.container.isin(related_ids)] \
-            .rename(columns={'container': 'related__id'}) \
-            .groupby(['year_published', 'related__id']) \
-            .agg(dict(title='count', is_archived='sum',
-                      has_formal_description='sum', has_odd='sum', has_visual_documentation='sum'))
-        counts_df = counts_df.rename(columns=renames)
-        mi = self.data_cache.get_all_year_related_combinations(related_ids)
-        return counts_df.reindex(mi, fill_value=0)
+    def get_memberships(self):
+        publications = self.data_cache.publications
+        container_ids = publications.container.astype(float).values
+        has_container = ~np.isnan(container_ids)
+        return publications.index.values[has_container], container_ids[has_container].astype(np.int64)
+
+    def get_option_aliases(self, related_table):
+        # journals are found by ISSN with or without the hyphen
+        return [(issn, issn.replace('-', '')) if issn else () for issn in related_table.issn]
+
+
+class YearAxis:
+    """
+    Publication years from start up to stop grouped into buckets of bucket_size years
+
+    Buckets are labelled by their first year. A year code is the position of the bucket of a year on the axis and
+    -1 for missing years or years outside of the axis.
+    """
+    MISSING = -1
+
+    def __init__(self, start: int, stop: int, bucket_size: int = 1):
+        self.start = start
+        self.stop = stop
+        self.bucket_size = bucket_size
+
+    @classmethod
+    def from_years(cls, years):
+        """Yearly axis spanning the years present in years, missing years are NaN"""
+        years = np.asarray(years, dtype=np.float64)
+        years = years[~np.isnan(years)]
+        if not len(years):
+            return cls(0, 0)
+        return cls(int(years.min()), int(years.max()) + 1)
+
+    def bucketed(self, bucket_size):
+        """Axis of the same years in buckets of bucket_size years aligned to multiples of bucket_size"""
+        if bucket_size == self.bucket_size:
+            return self
+        return YearAxis(self.start - self.start % bucket_size, self.stop, bucket_size)
+
+    @property
+    def years(self):
+        return range(self.start, self.stop, self.bucket_size)
+
+    def __len__(self):
+        return len(self.years)
+
+    def codes(self, years):
+        """Compact integer year codes of years"""
+        years = np.asarray(years, dtype=np.float64)
+        in_axis = (years >= self.start) & (years < self.stop)
+        codes = np.full(len(years), self.MISSING, dtype=np.int32)
+        codes[in_axis] = (years[in_axis].astype(np.int64) - self.start) // self.bucket_size
+        return codes
+
+    def index(self, name='year_published'):
+        return pd.RangeIndex(self.start, self.start + len(self) * self.bucket_size, self.bucket_size, name=name)
+
+
+class YearRelatedTensor:
+    """
+    Statistics of publications by related entity and year
+
+    values[i, j] holds the publication count followed by the IncludedStatistics counts of the entity
+    related_ids[i] in the j-th year bucket of year_axis. Entities are the leading axis so selecting entities is a
+    row gather.
+    """
+
+    def __init__(self, related_ids: np.ndarray, year_axis: YearAxis, values: np.ndarray):
+        self.related_ids = related_ids
+        self.year_axis = year_axis
+        self.values = values
+
+    @classmethod
+    def from_memberships(cls, publication_positions, related_ids, year_codes, statistics, year_axis: YearAxis):
+        """
+        Sum the statistics of publications over their memberships
+
+        :param publication_positions: positions of the member publications in year_codes and statistics
+        :param year_codes: year_axis code of every publication
+        :param statistics: publication by statistic matrix
+        """
+        year_codes = year_codes[publication_positions]
+        in_years = year_codes != YearAxis.MISSING
+        publication_positions = publication_positions[in_years]
+        year_codes = year_codes[in_years]
+        n_years = len(year_axis)
+        entity_ids, entity_positions = np.unique(related_ids[in_years], return_inverse=True)
+        cells = entity_positions * n_years + year_codes
+        n_cells = len(entity_ids) * n_years
+        values = np.column_stack([np.bincount(cells, weights=statistics[publication_positions, i], minlength=n_cells)
+                                  for i in range(statistics.shape[1])]).astype(np.int64)
+        return cls(entity_ids, year_axis, values.reshape(len(entity_ids), n_years, statistics.shape[1]))
+
+    def gather(self, related_ids):
+        """Statistics of related_ids (zero for unknown entities) as a year by entity by statistic array"""
+        related_ids = np.asarray(related_ids, dtype=np.int64)
+        positions = np.searchsorted(self.related_ids, related_ids).clip(max=max(len(self.related_ids) - 1, 0))
+        found = self.related_ids[positions] == related_ids if len(self.related_ids) else \
+            np.zeros(len(related_ids), dtype=bool)
+        values = np.zeros((len(related_ids),) + self.values.shape[1:], dtype=np.int64)
+        values[found] = self.values[positions[found]]
+        return values.transpose(1, 0, 2)
+
+
+def get_table_checksum(model):
+    """Checksum of the rows of the table of a model, computed by the database"""
+    table = db.connection.ops.quote_name(model._meta.db_table)
+    pk = db.connection.ops.quote_name(model._meta.pk.column)
+    with db.connection.cursor() as cursor:
+        cursor.execute("SELECT md5(string_agg(md5(t::text), '' ORDER BY t.{pk})) FROM {table} t".format(
+            table=table, pk=pk))
+        return cursor.fetchone()[0]
+
+
+def get_source_fingerprints(models):
+    """
+    State of the tables of models, keyed by model label
+
+    Every table is fingerprinted by its row count and largest primary key, which change when rows are added or
+    removed. Tables with a date_modified column add their latest modification. Other tables of entities add a
+    checksum of their rows so that renaming a tag or a sponsor is noticed as well. Publication relation tables are
+    never updated in place so they are not checksummed.
+    """
+    fingerprints = {}
+    for model in models:
+        field_names = [field.attname for field in model._meta.concrete_fields]
+        if 'date_modified' in field_names:
+            values = model.objects.aggregate(count=Count('pk'), max_pk=Max('pk'), latest=Max('date_modified'))
+            fingerprint = '{count}:{max_pk}:{latest}'.format(**values)
+        else:
+            values = model.objects.aggregate(count=Count('pk'), max_pk=Max('pk'))
+            fingerprint = '{count}:{max_pk}'.format(**values)
+            if not any(field.related_model is Publication for field in model._meta.concrete_fields):
+                fingerprint += ':{}'.format(get_table_checksum(model))
+        fingerprints[model._meta.label] = fingerprint
+    return fingerprints
 
 
 class DataCache:
-    def __init__(self):
+    """
+    One version of the tables shared by the bokeh sessions
+
+    Tables are built lazily and never change once built. Refreshing creates a new version instead.
+    """
+    # tables persisted to and memory mapped from on disk snapshots
+    snapshot_table_names = ['publications', 'publication_authors', 'publication_platforms', 'publication_sponsors',
+                            'publication_tags']
+
+    # models whose tables each table is built from
+    table_sources = {
+        'publications': (Publication, ModelDocumentation, Publication.model_documentation.through),
+        'authors': (Publication, Author, PublicationAuthors),
+        'publication_authors': (Publication, Author, PublicationAuthors),
+        'container': (Publication, Container),
+        'platforms': (Publication, Platform, PublicationPlatforms),
+        'publication_platforms': (Publication, Platform, PublicationPlatforms),
+        'sponsors': (Publication, Sponsor, PublicationSponsors),
+        'publication_sponsors': (Publication, Sponsor, PublicationSponsors),
+        'tags': (Publication, Tag, PublicationTags),
+        'publication_tags': (Publication, Tag, PublicationTags),
+    }
+
+    # year bucket sizes supported by the year related counts
+    year_bucket_sizes = (1, 5, 10)
+    # match masks and year related tensors of queries kept per version, least recently used first
+    queries_kept = 16
+
+    def __init__(self, tables=None, fingerprints=None):
         logger.info('creating shared data cache')
         self._publication_queryset = None
         self._publications = None
@@ -113,7 +286,7 @@ class DataCache:
         self._authors = None
         self._publication_authors = None
 
-        self._containers = None
+        self._container = None
 
         self._platforms = None
         self._publication_platforms = None
@@ -124,21 +297,59 @@ class DataCache:
         self._tags = None
         self._publication_tags = None
 
-    def _publication_as_dict(self, p: Publication):
-        model_documentation = set(d.name for d in p.model_documentation.all())
-        return {'id': p.id,
-                'container': p.container.id,
-                'date_published': p.date_published,
-                'year_published':
-                    p.date_published.year if p.date_published is not None else None,
-                'is_archived': p.is_archived,
-                'has_odd': 'ODD' in model_documentation,
-                'has_visual_documentation': any(
-                    d in model_documentation for d in ['UML', 'Flow Charts', 'AORML', 'Ontologies']),
-                'has_formal_description': any(
-                    d in model_documentation for d in ['Source code', 'Pseudocode', 'Mathematical description']),
-                'status': p.status,
-                'title': p.title}
+        self._publication_statistics = None
+        self._year_axis = None
+        self._year_codes = {}
+        self._match_masks = LRUCache('match masks', self.queries_kept)
+        self._year_related_tensors = LRUCache('year related tensors', self.queries_kept)
+        self._prefix_indices = {}
+
+        for name, df in (tables or {}).items():
+            setattr(self, '_{}'.format(name), df)
+        self.fingerprints = fingerprints or {}
+
+    @classmethod
+    def get_source_models(cls):
+        return set(model for models in cls.table_sources.values() for model in models)
+
+    @classmethod
+    def from_database(cls):
+        # fingerprints are read first so that changes made while the tables load are picked up by the next refresh
+        data_cache = cls(fingerprints=get_source_fingerprints(cls.get_source_models()))
+        data_cache.load()
+        return data_cache
+
+    @classmethod
+    def from_snapshot(cls, snapshot_dir):
+        """Version memory mapping the current snapshot or None if there is no snapshot"""
+        loaded = snapshot.load_snapshot(snapshot_dir)
+        if loaded is None:
+            return None
+        tables, fingerprints = loaded
+        return cls(tables=tables, fingerprints=fingerprints)
+
+    def load(self):
+        for name in self.table_sources:
+            getattr(self, name)
+
+    def get_changed_tables(self, fingerprints):
+        changed_models = set(label for label, fingerprint in fingerprints.items()
+                             if self.fingerprints.get(label) != fingerprint)
+        return [name for name, models in self.table_sources.items()
+                if any(model._meta.label in changed_models for model in models)]
+
+    def refreshed(self, fingerprints):
+        """
+        Next version of the cache for the given source fingerprints
+
+        Tables whose sources did not change are shared with this version and the others are rebuilt
+        """
+        changed_tables = self.get_changed_tables(fingerprints)
+        tables = {name: getattr(self, '_{}'.format(name)) for name in self.table_sources if name not in changed_tables}
+        logger.info('rebuilding tables %s', changed_tables)
+        data_cache = DataCache(tables=tables, fingerprints=fingerprints)
+        data_cache.load()
+        return data_cache
 
     def _author_as_dict(self, a: Author):
         return {
@@ -149,7 +360,8 @@ class DataCache:
     def _container_as_dict(self, c: Container):
         return {
             'id': c.id,
-            'name': c.name
+            'name': c.name,
+            'issn': c.issn
         }
 
     def _publication_author_as_dict(self, pa: PublicationAuthors):
@@ -162,17 +374,45 @@ class DataCache:
     @property
     def publication_queryset(self) -> QuerySet:
         if self._publication_queryset is None:
-            self._publication_queryset = Publication.api.primary().filter(status='REVIEWED') \
-                .select_related('container') \
-                .prefetch_related('model_documentation')
+            self._publication_queryset = get_public_publications()
         return self._publication_queryset
 
+    def _load_publications(self):
+        """
+        Build the publication table column by column from values_list tuples
+
+        Documentation flags come from a single query of the model documentation names of the publications
+        """
+        rows = list(self.publication_queryset.values_list(
+            'id', 'container_id', 'date_published', 'is_archived', 'status', 'title'))
+        ids, container_ids, dates_published, is_archived, statuses, titles = zip(*rows) if rows else [()] * 6
+        ids = np.array(ids, dtype=np.int64)
+        dates_published = pd.to_datetime(pd.Series(dates_published, dtype=object))
+
+        documentation = list(self.publication_queryset.filter(model_documentation__isnull=False)
+                             .values_list('id', 'model_documentation__name'))
+        documented_ids = np.array([pk for pk, _ in documentation], dtype=np.int64)
+        documentation_names = np.array([name for _, name in documentation], dtype=object)
+
+        def has_documentation(names):
+            return np.isin(ids, documented_ids[np.isin(documentation_names, list(names))])
+
+        return pd.DataFrame({
+            'container': pd.Categorical(container_ids),
+            'date_published': dates_published.values,
+            'year_published': dates_published.dt.year.values,
+            'is_archived': np.array(is_archived, dtype=bool),
+            'has_odd': has_documentation([ODD_DOCUMENTATION]),
+            'has_visual_documentation': has_documentation(VISUAL_DOCUMENTATION),
+            'has_formal_description': has_documentation(FORMAL_DESCRIPTION_DOCUMENTATION),
+            'status': pd.Categorical(statuses),
+            'title': np.array(titles, dtype=object)
+        }, index=pd.Index(ids, name='publication__id'))
+
     @property
     def publications(self):
         if self._publications is None:
-            self._publications = pd.DataFrame.from_records(
-                (self._publication_as_dict(p) for p in self.publication_queryset), index='id')
-            self._publications.index.rename(name='publication__id', inplace=True)
+            self._publications = self._load_publications()
         return self._publications
 
     @property
@@ -195,13 +435,13 @@ class DataCache:
 
     @property
     def container(self):
-        if self._containers is None:
-            self._containers = pd.DataFrame.from_records(
+        if self._container is None:
+            self._container = pd.DataFrame.from_records(
                 (self._container_as_dict(c) for c in
                 Container.objects.filter(publications__in=self.publication_queryset).distinct()),
                 index='id'
             )
-        return self._containers
+        return self._container
 
     @property
     def platforms(self):
@@ -254,6 +494,14 @@ class DataCache:
                 columns={'tag__name': 'name', 'tag__id': 'related__id'}, inplace=True)
         return self._publication_tags
 
+    def save_snapshot(self, snapshot_dir):
+        directory = snapshot.save_snapshot({name: getattr(self, name) for name in self.snapshot_table_names},
+                                           snapshot_dir, fingerprints=self.fingerprints)
+        # map the tables just written so that this process shares them instead of keeping private copies
+        for name in self.snapshot_table_names:
+            setattr(self, '_{}'.format(name), snapshot.load_frame(os.path.join(directory, name)))
+        return directory
+
     def get_model_data_access_api(self, related_name, related_through_name=None):
         if related_name == JournalDataAccess.related_name:
             return JournalDataAccess(data_cache=self)
@@ -262,8 +510,201 @@ class DataCache:
         return ManyToManyModelDataAccess(data_cache=self, related_name=related_name,
                                          related_through_name=related_through_name)
 
-    def get_all_year_related_combinations(self, related_ids):
-        return pd.MultiIndex.from_product([range(1995, 2018), related_ids], names=['year_published', 'related__id'])
+    @property
+    def year_axis(self):
+        """Yearly axis spanning the publication years of the publications"""
+        if self._year_axis is None:
+            self._year_axis = YearAxis.from_years(self.publications.year_published.values)
+        return self._year_axis
+
+    def get_year_axis(self, bucket_size=1):
+        if bucket_size not in self.year_bucket_sizes:
+            raise ValueError('unsupported year bucket size {}'.format(bucket_size))
+        return self.year_axis.bucketed(bucket_size)
+
+    def get_year_codes(self, bucket_size=1):
+        """Year code of every publication on the year axis with buckets of bucket_size years"""
+        if bucket_size not in self._year_codes:
+            year_axis = self.get_year_axis(bucket_size)
+            self._year_codes[bucket_size] = year_axis.codes(self.publications.year_published.values)
+        return self._year_codes[bucket_size]
 
+    @property
+    def publication_statistics(self):
+        """Publication by statistic matrix of the publication count and IncludedStatistics flags"""
+        if self._publication_statistics is None:
+            publications = self.publications
+            self._publication_statistics = np.column_stack([
+                np.ones(len(publications)),
+                publications.is_archived.values,
+                publications.has_odd.values,
+                publications.has_formal_description.values,
+                publications.has_visual_documentation.values,
+            ]).astype(np.float64)
+        return self._publication_statistics
+
+    def _build_match_mask(self, query: Query):
+        publication_ids = np.fromiter(
+            (p.id for p in PublicationDocSearch().find(q=query.search, facet_filters=query.filters)
+             .source(['id']).scan()), dtype=np.int64)
+        positions = self.publications.index.get_indexer(publication_ids)
+        mask = np.zeros(len(self.publications), dtype=bool)
+        mask[positions[positions >= 0]] = True
+        return mask
+
+    def get_match_mask(self, query: Query):
+        """
+        Boolean mask over the publications matching a full text search query
+
+        The search is scanned once per query and the mask is memoized by the query key
+        """
+        if query.matches_all():
+            return np.ones(len(self.publications), dtype=bool)
+        return self._match_masks.get_or_create(query.key, lambda: self._build_match_mask(query))
+
+    def get_year_counts(self, mask=None, bucket_size=1):
+        """Publication count and IncludedStatistics counts by year bucket of the publications in mask"""
+        year_axis = self.get_year_axis(bucket_size)
+        year_codes = self.get_year_codes(bucket_size)
+        statistics = self.publication_statistics
+        included = year_codes != YearAxis.MISSING
+        if mask is not None:
+            included &= mask
+        values = np.column_stack([np.bincount(year_codes[included], weights=statistics[included, i],
+                                              minlength=len(year_axis))
+                                  for i in range(statistics.shape[1])]).astype(np.int64)
+        return pd.DataFrame(values, index=year_axis.index(), columns=['count'] + IncludedStatistics.names())
+
+    def _build_year_related_tensor(self, get_memberships, bucket_size, mask=None):
+        publication_ids, related_ids = get_memberships()
+        publication_positions = self.publications.index.get_indexer(publication_ids)
+        included = publication_positions >= 0
+        if mask is not None:
+            included[included] = mask[publication_positions[included]]
+        return YearRelatedTensor.from_memberships(publication_positions[included],
+                                                  np.asarray(related_ids, dtype=np.int64)[included],
+                                                  self.get_year_codes(bucket_size), self.publication_statistics,
+                                                  self.get_year_axis(bucket_size))
+
+    def get_year_related_tensor(self, related_name, get_memberships, query: Query = None, bucket_size=1):
+        """
+        Year related tensor of all publications or of the publications matching query
+
+        The tensor of all publications is built once per version. Tensors of queries are memoized by query key so
+        that changing the selected entities only gathers rows.
+        """
+        if query is None or query.matches_all():
+            key = (related_name, None, bucket_size)
+            build = lambda: self._build_year_related_tensor(get_memberships, bucket_size)
+        else:
+            key = (related_name, query.key, bucket_size)
+            build = lambda: self._build_year_related_tensor(get_memberships, bucket_size, self.get_match_mask(query))
+        return self._year_related_tensors.get_or_create(key, build)
+
+    def get_year_related_counts(self, related_name, get_memberships, related_ids, query: Query = None,
+                                bucket_size=1):
+        tensor = self.get_year_related_tensor(related_name, get_memberships, query=query, bucket_size=bucket_size)
+        related_ids = [int(related_id) for related_id in related_ids]
+        values = tensor.gather(related_ids).reshape(-1, tensor.values.shape[2])
+        return pd.DataFrame(values, index=self.get_all_year_related_combinations(related_ids, bucket_size),
+                            columns=['count'] + IncludedStatistics.names())
+
+    def get_prefix_index(self, related_name, get_memberships, get_option_aliases):
+        """Typeahead index over the names of the related entities, built once per version"""
+        if related_name not in self._prefix_indices:
+            related_table = getattr(self, related_name)
+            _, related_ids = get_memberships()
+            publication_counts = pd.Series(np.asarray(related_ids, dtype=np.int64)).value_counts()
+            options = [{'label': name, 'value': int(related_id)}
+                       for related_id, name in zip(related_table.index, related_table['name'])]
+            self._prefix_indices[related_name] = PrefixIndex.from_options(
+                options, publication_counts.reindex(related_table.index, fill_value=0).values,
+                aliases=get_option_aliases(related_table))
+        return self._prefix_indices[related_name]
+
+    def get_all_year_related_combinations(self, related_ids, bucket_size=1):
+        return pd.MultiIndex.from_product([self.get_year_axis(bucket_size).index(), related_ids],
+                                          names=['year_published', 'related__id'])
+
+
+class VersionedDataCache:
+    """
+    Current version of the DataCache, swapped as a whole when the database changes
+
+    Attribute lookups are delegated to the current version. Data access objects are bound to the version they were
+    created from so sessions keep reading consistent tables while a newer version is swapped in. The first version
+    is only loaded when it is first used so importing the module does not touch the snapshot or the database.
+    """
+
+    def __init__(self, snapshot_dir):
+        self.snapshot_dir = snapshot_dir
+        self.version = 0
+        self._current = None
+        self._lock = threading.Lock()
 
-data_cache = DataCache()
+    @property
+    def current(self):
+        if self._current is None:
+            with self._lock:
+                if self._current is None:
+                    self._current = self._load_first_version()
+        return self._current
+
+    def _load_first_version(self):
+        data_cache = DataCache.from_snapshot(self.snapshot_dir)
+        if data_cache is None:
+            logger.info('no snapshot in %s, loading tables from the database', self.snapshot_dir)
+            data_cache = DataCache.from_database()
+            data_cache.save_snapshot(self.snapshot_dir)
+        return data_cache
+
+    def __getattr__(self, name):
+        return getattr(self.current, name)
+
+    def build_next_version(self):
+        """
+        Build the version of the cache matching the database or return None if the current version is up to date
+
+        Another process may already have published a snapshot of the database, in which case it is mapped instead
+        of being rebuilt
+        """
+        fingerprints = get_source_fingerprints(DataCache.get_source_models())
+        if not self.current.get_changed_tables(fingerprints):
+            return None
+        data_cache = DataCache.from_snapshot(self.snapshot_dir)
+        if data_cache is not None and not data_cache.get_changed_tables(fingerprints):
+            return data_cache
+        data_cache = self.current.refreshed(fingerprints)
+        data_cache.save_snapshot(self.snapshot_dir)
+        return data_cache
+
+    def swap(self, data_cache):
+        self._current = data_cache
+        self.version += 1
+        logger.info('swapped in data cache version %s', self.version)
+
+    def start_refresher(self, loop, interval):
+        """
+        Build new versions in a background thread every interval seconds
+
+        New versions are swapped in on the server's IOLoop so that a session callback never sees two versions
+        """
+
+        def refresh():
+            while True:
+                time.sleep(interval)
+                try:
+                    data_cache = self.build_next_version()
+                    if data_cache is not None:
+                        loop.add_callback(self.swap, data_cache)
+                except Exception:
+                    logger.exception('data cache refresh failed')
+                finally:
+                    db.close_old_connections()
+
+        thread = threading.Thread(target=refresh, name='data-cache-refresher', daemon=True)
+        thread.start()
+        return thread
+
+
+data_cache = VersionedDataCache(settings.VISUALIZATION_SNAPSHOT_DIR)
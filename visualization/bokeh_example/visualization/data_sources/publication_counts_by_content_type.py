@@ -12,5 +12,4 @@ def create_dataset(query, top_matches_df, top_matches_selected_indices):
     logger.info(indices)
     related_ids = df.id.iloc[indices].values
     api = data_cache.get_model_data_access_api(query.content_type)
-    df = api.get_full_text_matches(query.search, facet_filters=query.filters)
-    return api.get_year_related_counts(df=df, related_ids=related_ids)
+    return api.get_year_related_counts(query=query, related_ids=related_ids)
@@ -2,6 +2,8 @@ import pandas as pd
 from bokeh.models import ColumnDataSource
 
 from catalog.core.search_indexes import PublicationDocSearch
+from data_access import data_cache
+from query_cache import top_matches_cache
 
 
 def _retrieve_matches(query):
@@ -11,6 +13,7 @@ def _retrieve_matches(query):
 
 
 def create_data_source(query):
-    matches = _retrieve_matches(query)
+    # aggregations of a query are shared by every session until the data cache is refreshed
+    matches = top_matches_cache.get_or_create((data_cache.version, query), lambda: _retrieve_matches(query))
     return ColumnDataSource(
         pd.DataFrame.from_records(matches, columns=['id', 'name', 'publication_count']))
\ No newline at end of file
@@ -13,8 +13,9 @@ import data_sources.top_matches_by_content_type
 import data_sources.publication_counts
 
 from catalog.core.search_indexes import PublicationDocSearch, normalize_search_querydict
-from data_access import IncludedStatistics
+from data_access import IncludedStatistics, data_cache
 from query import Query
+from query_cache import create_session_cache
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +42,9 @@ def extract_query():
 
 
 query = extract_query()
+# count frames of the selections made in this session
+session_context = curdoc().session_context
+session_cache = create_session_cache(session_context.id if session_context else None)
 
 logger.info('extracted query: {}'.format(query.content_type))
 
@@ -52,13 +56,12 @@ included_statistics_checkbox = CheckboxGroup(labels=IncludedStatistics.labels(),
 #
 
 publication_counts_df = data_sources.publication_counts.create_publication_counts_dataset(query)
-publication_count_graph = components.publication_counts.create_chart(
+publication_count_chart = components.publication_counts.PublicationCountsChart(
     statistic_indices=included_statistics_checkbox.active, publication_count_df=publication_counts_df)
 
 
 def update_chart():
-    page.children[1] = components.publication_counts.create_chart(
-        statistic_indices=included_statistics_checkbox.active, publication_count_df=publication_counts_df)
+    publication_count_chart.update_statistics(included_statistics_checkbox.active)
 
 
 included_statistics_checkbox.on_change('active', lambda attr, old, new: update_chart())
@@ -84,30 +87,36 @@ top_matches_data_source.selected.indices = [0, 1]
 
 match_table = create_search_match_table(top_matches_data_source)
 
-publication_counts_by_content_type_over_time_df = data_sources.publication_counts_by_content_type.create_dataset(
-    query,
-    top_matches_df=match_table.source.to_df(),
-    top_matches_selected_indices=match_table.source.selected.indices)
 
-publication_count_by_content_type_graph = components.publication_counts_over_time.create_chart(
+def create_content_type_dataset(data_source):
+    selected_indices = tuple(data_source.selected.indices)
+    return session_cache.get_or_create(
+        (data_cache.version, selected_indices),
+        lambda: data_sources.publication_counts_by_content_type.create_dataset(
+            query,
+            top_matches_df=data_source.to_df(),
+            top_matches_selected_indices=selected_indices))
+
+
+publication_counts_by_content_type_over_time_df = create_content_type_dataset(match_table.source)
+
+publication_count_by_content_type_chart = components.publication_counts_over_time.PublicationCountsOverTimeChart(
     query,
     publication_count_df=publication_counts_by_content_type_over_time_df,
     statistic_indices=[])
 
 
-def update_content_type_chart():
+def update_content_type_statistics():
     logger.info('statistic_indices: %s', included_statistics_checkbox.active)
-    publication_counts_over_time_df = data_sources.publication_counts_by_content_type.create_dataset(
-        query,
-        top_matches_df=top_matches_data_source.to_df(),
-        top_matches_selected_indices=top_matches_data_source.selected.indices)
-    page.children[2] = components.publication_counts_over_time.create_chart(
-        query,
-        publication_count_df=publication_counts_over_time_df,
-        statistic_indices=included_statistics_checkbox.active)
+    publication_count_by_content_type_chart.update_statistics(included_statistics_checkbox.active)
+
+
+def update_content_type_chart():
+    publication_counts_over_time_df = create_content_type_dataset(top_matches_data_source)
+    publication_count_by_content_type_chart.update_data(publication_counts_over_time_df)
 
 
-included_statistics_checkbox.on_change('active', lambda attr, old, new: update_content_type_chart())
+included_statistics_checkbox.on_change('active', lambda attr, old, new: update_content_type_statistics())
 top_matches_data_source.selected.on_change('indices', lambda attr, old, new: update_content_type_chart())
 
 #
@@ -116,10 +125,10 @@ top_matches_data_source.selected.on_change('indices', lambda attr, old, new: upd
 
 page = column(
     row(column(Div(text='<b>Available Statistics</b>'), included_statistics_checkbox), widgetbox(match_table)),
-    row(publication_count_graph),
+    row(publication_count_chart.figure),
     # Plot publication creation count over time (overall and for search results only)
     # Table of summary statistics
-    row(publication_count_by_content_type_graph))
+    row(publication_count_by_content_type_chart.figure))
 
 curdoc().add_root(page)
 curdoc().title = 'Visualization of {} for search {}'.format(query.content_type, query.search)
@@ -1,3 +1,5 @@
+import json
+
 from django.http import QueryDict
 
 from catalog.core.search_indexes import normalize_search_querydict
@@ -9,6 +11,20 @@ class Query:
         self.filters = filters
         self.search = search
 
+    @property
+    def key(self):
+        """Normalized search and filters identifying the publications the query matches"""
+        return json.dumps([self.search, {name: sorted(ids) for name, ids in self.filters.items()}], sort_keys=True)
+
+    def __eq__(self, other):
+        return isinstance(other, Query) and (self.content_type, self.key) == (other.content_type, other.key)
+
+    def __hash__(self):
+        return hash((self.content_type, self.key))
+
+    def matches_all(self):
+        return not self.search and not any(self.filters.values())
+
     @classmethod
     def empty(cls, content_type='sponsors'):
         search, filters = normalize_search_querydict(QueryDict())
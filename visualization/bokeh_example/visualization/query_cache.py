@@ -0,0 +1,75 @@
+"""
+Least recently used caches of query derived results
+
+Results that only depend on the query and the data cache version (matches, count frames) are kept in process wide
+caches shared by every session. Each session keeps its own smaller cache for results that depend on its widgets.
+"""
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+TOP_MATCHES_CACHE_SIZE = 64
+PUBLICATION_COUNTS_CACHE_SIZE = 64
+SESSION_CACHE_SIZE = 32
+
+
+class LRUCache:
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.maxsize = maxsize
+        self._values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_create(self, key, create):
+        """Cached value of key, creating and caching it with create() if it is missing"""
+        if key in self._values:
+            self.hits += 1
+            self._values.move_to_end(key)
+            return self._values[key]
+        self.misses += 1
+        value = create()
+        self._values[key] = value
+        while len(self._values) > self.maxsize:
+            self._values.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def clear(self):
+        self._values.clear()
+
+    def __len__(self):
+        return len(self._values)
+
+    def stats(self):
+        return {'name': self.name, 'size': len(self), 'maxsize': self.maxsize, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+
+top_matches_cache = LRUCache('top matches', TOP_MATCHES_CACHE_SIZE)
+publication_counts_cache = LRUCache('publication counts', PUBLICATION_COUNTS_CACHE_SIZE)
+# caches of the open sessions keyed by session id, dropped when their session is destroyed
+session_caches = {}
+
+
+def log_stats(caches=(top_matches_cache, publication_counts_cache)):
+    for cache in caches:
+        logger.info('%(name)s cache: %(size)s/%(maxsize)s entries, %(hits)s hits, %(misses)s misses, '
+                    '%(evictions)s evictions', cache.stats())
+
+
+def create_session_cache(session_id=None):
+    """Cache of a session, kept until the session is destroyed if the session has an id"""
+    cache = LRUCache('session {}'.format(session_id), SESSION_CACHE_SIZE)
+    if session_id is not None:
+        session_caches[session_id] = cache
+    return cache
+
+
+def drop_session_cache(session_id):
+    """Log the stats of the cache of a destroyed session and release it"""
+    cache = session_caches.pop(session_id, None)
+    if cache is not None:
+        log_stats(caches=[cache])
@@ -2,6 +2,7 @@ import os
 import sys
 
 import django
+from tornado.ioloop import IOLoop
 
 
 def on_server_loaded(server_context):
@@ -9,4 +10,12 @@ def on_server_loaded(server_context):
     sys.path.insert(2, '/code')
     sys.path.insert(3, os.path.dirname(os.path.abspath(__file__)))
     django.setup()
+    from django.conf import settings
     import data_access
+    data_access.data_cache.start_refresher(IOLoop.current(), settings.VISUALIZATION_REFRESH_INTERVAL)
+
+
+def on_session_destroyed(session_context):
+    import query_cache
+    query_cache.log_stats()
+    query_cache.drop_session_cache(session_context.id)
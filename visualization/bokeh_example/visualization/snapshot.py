@@ -0,0 +1,274 @@
+"""
+On disk columnar snapshots of the DataCache tables
+
+Every column is stored as its own .npy file so that bokeh processes can memory map them read only and share one
+physical copy through the page cache. String columns are stored as the UTF-8 bytes of all their values with an
+array of value offsets and are only decoded when a value is read. Snapshots are written to a new directory and
+published by swapping a symlink so readers never see a partial snapshot.
+"""
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import ExtensionArray, ExtensionDtype, register_extension_dtype, take
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 2
+SNAPSHOTS_KEPT = 2
+# seconds a replaced snapshot is kept after the snapshot replacing it was published, long enough for every process
+# that resolved the previous current link to finish mapping it
+SNAPSHOT_GRACE_PERIOD = 10 * 60
+SNAPSHOT_LOAD_ATTEMPTS = 3
+CURRENT_LINK_NAME = 'current'
+METADATA_FILE_NAME = 'metadata.json'
+
+
+@register_extension_dtype
+class MappedStringDtype(ExtensionDtype):
+    name = 'mapped_string'
+    type = str
+    na_value = None
+
+    @classmethod
+    def construct_array_type(cls):
+        return MappedStringArray
+
+
+class MappedStringArray(ExtensionArray):
+    """
+    Read only strings stored as UTF-8 bytes and offsets
+
+    The value at position i is data[offsets[i]:offsets[i + 1]] or None where missing[i] is set. The arrays can be
+    memory mapped so that the strings are shared between processes and only decoded when read.
+    """
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray, missing: np.ndarray):
+        self.offsets = offsets
+        self.data = data
+        self.missing = missing
+
+    @classmethod
+    def _from_sequence(cls, scalars, dtype=None, copy=False):
+        missing = np.array([value is None or pd.isna(value) for value in scalars], dtype=bool)
+        encoded = [b'' if is_missing else str(value).encode('utf-8') for value, is_missing in zip(scalars, missing)]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8), missing)
+
+    @classmethod
+    def _from_factorized(cls, values, original):
+        return cls._from_sequence(values)
+
+    @classmethod
+    def _concat_same_type(cls, to_concat):
+        offsets = [np.zeros(1, dtype=np.int64)]
+        end = 0
+        for array in to_concat:
+            offsets.append(array.offsets[1:] - array.offsets[0] + end)
+            end = offsets[-1][-1] if len(offsets[-1]) else end
+        return cls(np.concatenate(offsets),
+                   np.concatenate([array.data[array.offsets[0]:array.offsets[-1]] for array in to_concat]),
+                   np.concatenate([array.missing for array in to_concat]))
+
+    @property
+    def dtype(self):
+        return MappedStringDtype()
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.data.nbytes + self.missing.nbytes
+
+    def __len__(self):
+        return len(self.missing)
+
+    def _value(self, i):
+        if self.missing[i]:
+            return None
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            return self._value(item if item >= 0 else len(self) + item)
+        return self._take_positions(np.arange(len(self))[item])
+
+    def _take_positions(self, positions):
+        """Copy of the values at positions, -1 positions are missing"""
+        positions = np.asarray(positions, dtype=np.int64)
+        present = positions >= 0
+        starts = np.where(present, self.offsets[:-1][positions], 0)
+        lengths = np.where(present, self.offsets[1:][positions] - starts, 0)
+        offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        byte_positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        missing = ~present
+        missing[present] = self.missing[positions[present]]
+        return MappedStringArray(offsets, self.data[byte_positions], missing)
+
+    def take(self, indices, allow_fill=False, fill_value=None):
+        positions = take(np.arange(len(self)), indices, allow_fill=allow_fill, fill_value=-1)
+        return self._take_positions(positions)
+
+    def isna(self):
+        return np.array(self.missing, dtype=bool)
+
+    def copy(self):
+        return MappedStringArray(self.offsets, self.data, self.missing)
+
+    def __array__(self, dtype=None):
+        return np.array([self._value(i) for i in range(len(self))], dtype=object)
+
+    def __eq__(self, other):
+        return np.asarray(self) == other
+
+
+def _save_array(directory, name, values):
+    file_name = '{}.npy'.format(name)
+    np.save(os.path.join(directory, file_name), np.ascontiguousarray(values))
+    return file_name
+
+
+def _save_column(directory, name, series: pd.Series):
+    if series.dtype == object or isinstance(series.dtype, MappedStringDtype):
+        values = series.values
+        if not isinstance(values, MappedStringArray):
+            values = MappedStringArray._from_sequence(values)
+        return {'kind': 'string',
+                'offsets': _save_array(directory, name + '.offsets', values.offsets - values.offsets[0]),
+                'data': _save_array(directory, name + '.data', values.data[values.offsets[0]:values.offsets[-1]]),
+                'missing': _save_array(directory, name + '.missing', values.missing)}
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        column = {'kind': 'categorical', 'codes': _save_array(directory, name + '.codes', series.cat.codes.values)}
+        if categories.dtype == object:
+            column['categories'] = categories.tolist()
+        else:
+            column['categories_file'] = _save_array(directory, name + '.categories', categories.values)
+        return column
+    return {'kind': 'array', 'file': _save_array(directory, name, series.values)}
+
+
+def _load_column(directory, column):
+    def load(file_name):
+        return np.load(os.path.join(directory, file_name), mmap_mode='r')
+
+    if column['kind'] == 'string':
+        return MappedStringArray(load(column['offsets']), load(column['data']), load(column['missing']))
+    if column['kind'] == 'categorical':
+        categories = column['categories'] if 'categories' in column else load(column['categories_file'])
+        return pd.Categorical.from_codes(load(column['codes']), categories=categories)
+    return load(column['file'])
+
+
+def save_frame(df: pd.DataFrame, directory):
+    os.makedirs(directory)
+    index = df.index.to_series()
+    metadata = {
+        'index_name': df.index.name,
+        'index': _save_column(directory, 'index', index),
+        'columns': [[name, _save_column(directory, 'column{}'.format(i), df[name])]
+                    for i, name in enumerate(df.columns)]
+    }
+    with open(os.path.join(directory, METADATA_FILE_NAME), 'w') as f:
+        json.dump(metadata, f)
+
+
+def load_frame(directory):
+    with open(os.path.join(directory, METADATA_FILE_NAME)) as f:
+        metadata = json.load(f)
+    index = pd.Index(_load_column(directory, metadata['index']), name=metadata['index_name'])
+    # copy=False keeps the memory mapped arrays as the column data instead of consolidating them into new blocks
+    return pd.DataFrame({name: _load_column(directory, column) for name, column in metadata['columns']},
+                        index=index, copy=False)
+
+
+def save_snapshot(tables, snapshot_dir, fingerprints=None):
+    """
+    Write a snapshot of the tables and make it the current snapshot
+
+    :param tables: DataFrames keyed by table name
+    :param fingerprints: state of the database tables the snapshot was built from
+    :return: directory of the new snapshot
+    """
+    directory = os.path.join(snapshot_dir, 'snapshot-{}-{}'.format(int(time.time() * 1e6), os.getpid()))
+    os.makedirs(directory)
+    for name, df in tables.items():
+        save_frame(df, os.path.join(directory, name))
+    with open(os.path.join(directory, METADATA_FILE_NAME), 'w') as f:
+        json.dump({'version': SNAPSHOT_FORMAT_VERSION, 'tables': list(tables), 'fingerprints': fingerprints or {}}, f)
+
+    link = os.path.join(snapshot_dir, CURRENT_LINK_NAME)
+    tmp_link = '{}.{}'.format(link, os.getpid())
+    os.symlink(os.path.basename(directory), tmp_link)
+    os.replace(tmp_link, link)
+    logger.info('published snapshot %s', directory)
+    prune_snapshots(snapshot_dir)
+    return directory
+
+
+def _get_published_time(name):
+    """Seconds since the epoch a snapshot directory was published at"""
+    return int(name.split('-')[1]) / 1e6
+
+
+def prune_snapshots(snapshot_dir, keep=SNAPSHOTS_KEPT, grace_period=SNAPSHOT_GRACE_PERIOD):
+    """
+    Remove old snapshots
+
+    A snapshot is only removed once the snapshot that replaced it has been current for grace_period seconds, so
+    processes that resolved the current link before it moved can finish loading. Processes that already mapped the
+    files of a removed snapshot keep reading them until they unmap them.
+    """
+    current = os.path.realpath(os.path.join(snapshot_dir, CURRENT_LINK_NAME))
+    snapshots = sorted(name for name in os.listdir(snapshot_dir) if name.startswith('snapshot-'))
+    now = time.time()
+    for name, replaced_by in zip(snapshots[:-keep], snapshots[1:]):
+        path = os.path.join(snapshot_dir, name)
+        if path != current and now - _get_published_time(replaced_by) > grace_period:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def load_snapshot(snapshot_dir):
+    """
+    Memory map the tables of the current snapshot
+
+    :return: DataFrames keyed by table name and the fingerprints of the snapshot or None if there is no usable
+             snapshot
+    """
+    for attempt in range(SNAPSHOT_LOAD_ATTEMPTS):
+        directory = os.path.realpath(os.path.join(snapshot_dir, CURRENT_LINK_NAME))
+        try:
+            with open(os.path.join(directory, METADATA_FILE_NAME)) as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if metadata.get('version') != SNAPSHOT_FORMAT_VERSION:
+            logger.info('ignoring snapshot %s with format version %s', directory, metadata.get('version'))
+            return None
+        try:
+            tables = {name: load_frame(os.path.join(directory, name)) for name in metadata['tables']}
+        except OSError:
+            # the snapshot was pruned while it was loading, load the snapshot the current link moved to
+            logger.warning('snapshot %s disappeared while loading', directory, exc_info=True)
+            continue
+        logger.info('loaded snapshot %s', directory)
+        return tables, metadata['fingerprints']
+    return None
+
+
+if __name__ == '__main__':
+    # rebuild the snapshot outside of the bokeh server
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "catalog.settings.dev")
+    sys.path.insert(2, '/code')
+    import django
+
+    django.setup()
+    # loading the first version of the data cache publishes a snapshot if there is none yet
+    from data_access import data_cache
+
+    data_cache.build_next_version()
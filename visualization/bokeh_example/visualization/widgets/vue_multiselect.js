@@ -75,6 +75,7 @@ class VueMultiselectView extends InputWidgetView {
                 :clear-on-select="false"
                 :close-on-select="false"
                 @search-change="asyncFind"
+                @open="asyncFind('')"
                 ref="select">    
             </multiselect>`,
             data() {
@@ -102,14 +103,13 @@ class VueMultiselectView extends InputWidgetView {
                     this.$refs.select.$el.focus();
                 },
 
+                // the server returns the top ranked matches so only a page of options is ever loaded
                 asyncFind: debounce(async function(q) {
-                    if (q) {
-                        this.isLoading = true;
-                        const response = await ajax.get(`/autocomplete/${this.modelName}?q=${q}`);
-                        this.sendOptionsUpdate(response.data);
-                        this.isLoading = false;
-                    }
-                }, 500)
+                    this.isLoading = true;
+                    const response = await ajax.get(`/autocomplete/${this.modelName}`, {params: {q: q || ''}});
+                    this.sendOptionsUpdate(response.data);
+                    this.isLoading = false;
+                }, 300)
             }
         });
         this.$component = component.$mount();
@@ -1,4 +1,5 @@
 import logging
+from collections import OrderedDict
 from typing import List
 
 import dash_core_components as dcc
@@ -7,7 +8,6 @@ import pandas as pd
 import plotly.graph_objs as go
 from dash.dependencies import Output, Input, State
 
-import data_wrangling as dw
 from citation.models import Author, Sponsor, Platform, Container
 from common import app
 from data_wrangling import data_cache
@@ -23,37 +23,36 @@ SEARCH_CLEAR_BUTTON_ID = 'archival-status-search-clear-button'
 FIGURE_TYPE_DROPDOWN_ID = 'archival-status-figure-type-dropdown'
 
 
-def author_dropdown():
-    authors = data_cache.authors.options
+def instance_dropdown(placeholder):
+    # options are filled in from the typeahead index as the user types
     return dcc.Dropdown(id=INSTANCE_DROPDOWN_ID,
-                        options=authors,
+                        options=[],
                         multi=True,
-                        placeholder='Select authors')
+                        placeholder=placeholder)
+
+
+def author_dropdown():
+    return instance_dropdown('Select authors')
 
 
 def container_dropdown():
-    containers = data_cache.containers.options
-    return dcc.Dropdown(id=INSTANCE_DROPDOWN_ID,
-                        options=containers,
-                        multi=True,
-                        placeholder='Select journals, books and other media')
+    return instance_dropdown('Select journals, books and other media')
 
 
 def platform_dropdown():
-    platform_options = data_cache.platforms.options
-    return dcc.Dropdown(id=INSTANCE_DROPDOWN_ID,
-                        options=platform_options,
-                        multi=True,
-                        placeholder='Select platforms')
+    return instance_dropdown('Select platforms')
 
 
 def sponsor_dropdown():
-    qs = data_cache.sponsors.objs
-    sponsor_options = [{'label': s.name, 'value': s.id} for s in qs]
-    return dcc.Dropdown(id=INSTANCE_DROPDOWN_ID,
-                        options=sponsor_options,
-                        multi=True,
-                        placeholder='Select sponsors')
+    return instance_dropdown('Select sponsors')
+
+
+def search_instance_options(search_value: str, model_name: str, pks: List[int]):
+    if not model_name:
+        return []
+    pks = pks or []
+    selected = data_cache.get_options(model_name, pks)
+    return selected + [o for o in data_cache.search_options(model_name, search_value) if o['value'] not in pks]
 
 
 def no_dropdown():
@@ -96,33 +95,45 @@ def model_options_dropdown(model_name):
     ]
 
 
-def figure(search_clicks: int, search_text: str, model_name: str, pks: List[int]):
-    df = data_cache.publication_df
-    pq = dw.PublicationQueries(df)
+# count columns plotted for each figure type option
+FIGURE_TYPES = OrderedDict([
+    ('count', ('Population Counts', 'count')),
+    ('archival_counts', ('Archival Counts', 'archived_count')),
+    ('model_documentation_counts', ('Model Documentation Counts', 'model_documentation_count')),
+])
+
+
+def count_scatter(counts: pd.DataFrame, column: str, name: str):
+    return go.Scatter(
+        x=counts.index.get_level_values('year_published'),
+        y=counts[column],
+        mode='lines',
+        name=name,
+        hoverinfo='name',
+    )
+
+
+def figure(search_clicks: int, search_text: str, model_name: str, pks: List[int], figure_types=None):
+    pq = data_cache.publication_queries()
     if search_text:
         pq = pq.filter_by_fulltext_search(search_text)
+    if isinstance(figure_types, str):
+        figure_types = [figure_types]
+    figure_types = figure_types or ['count']
     data = []
     if pks:
-        for pk in pks:
-            df_counts = pq.filter_by_pk(model_name=model_name, pk=pk).to_is_archived()
-            print(df_counts)
-            scatter = go.Scatter(
-                x=df_counts.year_published.index,
-                y=df_counts.year_published,
-                mode='lines',
-                name=data_cache.publication_lookup(model_name, pk)['obj'].name,
-                hoverinfo='name',
-            )
-            data.append(scatter)
+        names = data_cache.related_names(model_name)
+        related_counts = pq.to_related_counts(model_name=model_name, pks=pks)
+        for pk, counts in related_counts.groupby(level='related_id'):
+            for figure_type in figure_types:
+                label, column = FIGURE_TYPES[figure_type]
+                name = names.get(pk, pk) if len(figure_types) == 1 else '{} {}'.format(names.get(pk, pk), label)
+                data.append(count_scatter(counts, column, name))
     else:
-        df = pq.to_is_archived()
-        data.append(go.Scatter(
-            x=df.year_published.index,
-            y=df.year_published,
-            mode='lines',
-            name='Count',
-            hoverinfo='name',
-        ))
+        counts = pq.to_counts()
+        for figure_type in figure_types:
+            label, column = FIGURE_TYPES[figure_type]
+            data.append(count_scatter(counts, column, label))
     return dict(
         data=data,
         layout=go.Layout(
@@ -139,13 +150,9 @@ def figure(search_clicks: int, search_text: str, model_name: str, pks: List[int]
 
 def figure_type_dropdown():
     return dcc.Dropdown(id=FIGURE_TYPE_DROPDOWN_ID,
-                        options=[
-                            {'label': 'Population Counts', 'value': 'count'},
-                            {'label': 'Archival Counts', 'value': 'archival_counts'},
-                            {'label': 'Model Documentation Counts', 'value': 'model_documentation_counts'}
-                        ],
+                        options=[{'label': label, 'value': value} for value, (label, _) in FIGURE_TYPES.items()],
                         multi=True,
-                        value='count')
+                        value=['count'])
 
 
 def graph_population_counts(df: pd.DataFrame, name: str):
@@ -172,15 +179,20 @@ def publication_archived_status(values: list):
         html.Button(id=SEARCH_BUTTON_ID, children=[
             'Search'
         ]),
-        dcc.Graph(id='publication-counts-by-year', figure=figure(0, '', '', values))])
+        dcc.Graph(id='publication-counts-by-year', figure=figure(0, '', '', values, ['count']))])
 
 
 app.callback(Output('publication-counts-by-year', 'figure'),
              [Input(SEARCH_BUTTON_ID, 'n_clicks')],
              [State(SEARCH_INPUT_ID, 'value'),
               State(MODEL_DROPDOWN_ID, 'value'),
-              State(INSTANCE_DROPDOWN_ID, 'value')])(figure)
+              State(INSTANCE_DROPDOWN_ID, 'value'),
+              State(FIGURE_TYPE_DROPDOWN_ID, 'value')])(figure)
 app.callback(Output(PARENT_INSTANCE_DROPDOWN_ID, 'children'),
              [Input(MODEL_DROPDOWN_ID, 'value')])(model_options_dropdown)
+app.callback(Output(INSTANCE_DROPDOWN_ID, 'options'),
+             [Input(INSTANCE_DROPDOWN_ID, 'search_value')],
+             [State(MODEL_DROPDOWN_ID, 'value'),
+              State(INSTANCE_DROPDOWN_ID, 'value')])(search_instance_options)
 app.callback(Output(INSTANCE_DROPDOWN_ID, 'value'),
              [Input(MODEL_DROPDOWN_ID, 'value')])(lambda v: [])
@@ -0,0 +1,178 @@
+"""
+Citation network of the publications of a DataCache
+
+The graph is built once from citation edge arrays and laid out once per graph version. Layouts are kept in the
+django cache so every process serving the visualizations shares them, and the network of a subset of the
+publications is drawn by slicing the cached coordinates instead of laying it out again.
+"""
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_CACHE_KEY = 'visualization.citation_network.layout.{}'
+LAYOUT_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+# networks with more nodes approximate long range repulsion with a grid instead of computing every node pair
+DENSE_LAYOUT_MAX_NODES = 1000
+LAYOUT_ITERATIONS = 50
+GRID_SIZE = 16
+GRID_CHUNK_SIZE = 4096
+
+
+def _repulsion_dense(positions, k):
+    delta = positions[:, np.newaxis, :] - positions[np.newaxis, :, :]
+    distance_squared = np.maximum((delta ** 2).sum(axis=2), 1e-6)
+    return np.einsum('ijk,ij->ik', delta, k ** 2 / distance_squared)
+
+
+def _repulsion_grid(positions, k, grid_size=None):
+    """
+    Barnes-Hut style repulsion with a single level of cells
+
+    Nodes in the same or a neighbouring cell repel each other exactly. Every other cell repels a node from its centre
+    of mass weighted by the number of nodes in the cell. The grid grows with the fourth root of the number of nodes
+    to balance the cost of the exact near pairs and of the approximated far cells.
+    """
+    n_nodes = len(positions)
+    if grid_size is None:
+        grid_size = max(GRID_SIZE, int(np.sqrt(3) * n_nodes ** 0.25))
+    n_cells = grid_size ** 2
+    low = positions.min(axis=0)
+    extent = np.maximum(positions.max(axis=0) - low, 1e-6)
+    cells = np.minimum(((positions - low) / extent * grid_size).astype(np.int64), grid_size - 1)
+    cell_ids = cells[:, 0] * grid_size + cells[:, 1]
+    counts = np.bincount(cell_ids, minlength=n_cells)
+    masses = counts.astype(float)
+    occupied = np.flatnonzero(counts)
+    centres = np.zeros((n_cells, 2))
+    centres[occupied] = np.column_stack([np.bincount(cell_ids, weights=positions[:, i], minlength=n_cells)[occupied]
+                                         for i in range(2)]) / masses[occupied, np.newaxis]
+
+    displacement = np.empty_like(positions)
+    # chunks of nodes keep the node by cell and node pair arrays small
+    for start in range(0, n_nodes, GRID_CHUNK_SIZE):
+        delta = positions[start:start + GRID_CHUNK_SIZE, np.newaxis, :] - centres[np.newaxis, occupied, :]
+        distance_squared = np.maximum((delta ** 2).sum(axis=2), 1e-6)
+        displacement[start:start + GRID_CHUNK_SIZE] = np.einsum('ijk,ij->ik', delta,
+                                                                masses[occupied] * k ** 2 / distance_squared)
+
+    # replace the approximation of the near cells by the exact repulsion of their nodes
+    nodes_by_cell = np.argsort(cell_ids, kind='stable')
+    cell_starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            neighbours = cells + [dx, dy]
+            in_grid = ((neighbours >= 0) & (neighbours < grid_size)).all(axis=1)
+            nodes = np.flatnonzero(in_grid)
+            neighbour_ids = neighbours[in_grid, 0] * grid_size + neighbours[in_grid, 1]
+            delta = positions[nodes] - centres[neighbour_ids]
+            distance_squared = np.maximum((delta ** 2).sum(axis=1), 1e-6)
+            displacement[nodes] -= delta * (masses[neighbour_ids] * k ** 2 / distance_squared)[:, np.newaxis]
+            for start in range(0, len(nodes), GRID_CHUNK_SIZE):
+                chunk_nodes = nodes[start:start + GRID_CHUNK_SIZE]
+                chunk_cells = neighbour_ids[start:start + GRID_CHUNK_SIZE]
+                pair_counts = counts[chunk_cells]
+                pair_offsets = np.concatenate([[0], np.cumsum(pair_counts)[:-1]])
+                first = np.repeat(cell_starts[chunk_cells] - pair_offsets, pair_counts)
+                others = nodes_by_cell[first + np.arange(pair_counts.sum())]
+                pair_nodes = np.repeat(chunk_nodes, pair_counts)
+                delta = positions[pair_nodes] - positions[others]
+                force = delta * (k ** 2 / np.maximum((delta ** 2).sum(axis=1), 1e-6))[:, np.newaxis]
+                for i in range(2):
+                    displacement[:, i] += np.bincount(pair_nodes, weights=force[:, i], minlength=n_nodes)
+    return displacement
+
+
+def force_directed_layout(n_nodes, sources, targets, iterations=LAYOUT_ITERATIONS, seed=0):
+    """
+    Vectorized Fruchterman-Reingold layout
+
+    :param sources: node positions of the edge sources
+    :param targets: node positions of the edge targets
+    :return: n_nodes by 2 array of coordinates in [-1, 1]
+    """
+    if n_nodes == 0:
+        return np.zeros((0, 2))
+    positions = np.random.RandomState(seed).uniform(-1, 1, size=(n_nodes, 2))
+    if n_nodes == 1:
+        return positions * 0
+    k = np.sqrt(4.0 / n_nodes)
+    repulsion = _repulsion_dense if n_nodes <= DENSE_LAYOUT_MAX_NODES else _repulsion_grid
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+    for _ in range(iterations):
+        displacement = repulsion(positions, k)
+        delta = positions[sources] - positions[targets]
+        distance = np.maximum(np.sqrt((delta ** 2).sum(axis=1)), 1e-6)
+        attraction = delta * (distance / k)[:, np.newaxis]
+        for i in range(2):
+            displacement[:, i] -= np.bincount(sources, weights=attraction[:, i], minlength=n_nodes)
+            displacement[:, i] += np.bincount(targets, weights=attraction[:, i], minlength=n_nodes)
+        length = np.maximum(np.sqrt((displacement ** 2).sum(axis=1)), 1e-6)
+        positions += displacement * (np.minimum(length, temperature) / length)[:, np.newaxis]
+        temperature -= cooling
+    positions -= positions.mean(axis=0)
+    return positions / max(np.abs(positions).max(), 1e-6)
+
+
+class CitationNetwork:
+    """
+    Citation graph over the rows of a publication DataFrame
+
+    Nodes are positions in the publication index and edges are arrays of source and target positions
+    """
+
+    def __init__(self, publication_index: pd.Index, sources: np.ndarray, targets: np.ndarray):
+        self.publication_index = publication_index
+        self.sources = sources
+        self.targets = targets
+
+    @classmethod
+    def from_pairs(cls, publication_pks, cited_pks, publication_index: pd.Index):
+        """Build a network from citing and cited publication id pairs, dropping publications not in the index"""
+        sources = publication_index.get_indexer(np.asarray(publication_pks, dtype=np.int64))
+        targets = publication_index.get_indexer(np.asarray(cited_pks, dtype=np.int64))
+        included = (sources >= 0) & (targets >= 0) & (sources != targets)
+        edges = np.unique(np.column_stack([sources[included], targets[included]]).reshape(-1, 2), axis=0)
+        return cls(publication_index, edges[:, 0], edges[:, 1])
+
+    @property
+    def version(self):
+        """Digest of the nodes and edges of the network"""
+        if not hasattr(self, '_version'):
+            digest = hashlib.sha1()
+            for values in [np.asarray(self.publication_index.values, dtype=np.int64), self.sources, self.targets]:
+                digest.update(np.ascontiguousarray(values).tobytes())
+            self._version = digest.hexdigest()
+        return self._version
+
+    @property
+    def layout(self):
+        """Coordinates of every node, computed once per network version"""
+        if not hasattr(self, '_layout'):
+            key = LAYOUT_CACHE_KEY.format(self.version)
+            layout = cache.get(key)
+            if layout is None:
+                logger.info('laying out citation network with %s nodes and %s edges',
+                            len(self.publication_index), len(self.sources))
+                layout = force_directed_layout(len(self.publication_index), self.sources, self.targets)
+                cache.set(key, layout, LAYOUT_CACHE_TIMEOUT)
+            self._layout = layout
+        return self._layout
+
+    def subgraph(self, positions):
+        """
+        Coordinates and edges of the network restricted to the nodes at positions
+
+        :return: node coordinates ordered as positions and the edges between them as pairs of coordinates
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        included = np.zeros(len(self.publication_index), dtype=bool)
+        included[positions] = True
+        edges = included[self.sources] & included[self.targets]
+        layout = self.layout
+        return layout[positions], layout[self.sources[edges]], layout[self.targets[edges]]
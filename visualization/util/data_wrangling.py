@@ -1,14 +1,17 @@
 import enum
+from collections import OrderedDict
+from functools import reduce
 
 import numpy as np
 import pandas as pd
-from django.db.models import Prefetch
 from django_pandas.io import read_frame
 from haystack.inputs import AutoQuery
 from haystack.query import SearchQuerySet
 
+from catalog.core.prefix_index import PrefixIndex
+from citation_network import CitationNetwork
 from citation.models import Publication, Tag, Sponsor, Platform, Author, Container, PublicationPlatforms, \
-    PublicationAuthors
+    PublicationAuthors, PublicationSponsors, PublicationTags
 
 
 class ModelNameEnum(enum.Enum):
@@ -30,22 +33,88 @@ def publication_as_dict(p: Publication):
             'year_published': p.date_published.year if p.date_published is not None else None,
             'flagged': p.flagged,
             'is_archived': p.is_archived,
+            'has_model_documentation': len(p.model_documentation.all()) > 0,
             'status': p.status,
             'title': p.title}
 
 
+class RelationMap:
+    """
+    Publication ids of related entities stored in compressed sparse row form
+
+    The values of the entity related_ids[i] are values[offsets[i]:offsets[i + 1]]. related_ids and the values of
+    every entity are sorted so lookups are binary searches.
+    """
+
+    def __init__(self, related_ids: np.ndarray, offsets: np.ndarray, values: np.ndarray):
+        self.related_ids = related_ids
+        self.offsets = offsets
+        self.values = values
+
+    @classmethod
+    def from_pairs(cls, related_pks, values):
+        """Group the distinct values of related entity id and value pairs by related entity"""
+        related_pks = np.asarray(related_pks, dtype=np.int64)
+        values = np.asarray(values, dtype=np.int64)
+        order = np.lexsort((values, related_pks))
+        related_pks = related_pks[order]
+        values = values[order]
+        distinct = np.ones(len(values), dtype=bool)
+        distinct[1:] = (values[1:] != values[:-1]) | (related_pks[1:] != related_pks[:-1])
+        related_pks = related_pks[distinct]
+        values = values[distinct]
+        related_ids, starts = np.unique(related_pks, return_index=True)
+        offsets = np.append(starts, len(related_pks))
+        return cls(related_ids, offsets, values)
+
+    @classmethod
+    def from_values_list(cls, values_list):
+        """Build a map from a queryset of related entity id and value pairs"""
+        pairs = np.array(list(values_list), dtype=np.int64).reshape(-1, 2)
+        return cls.from_pairs(pairs[:, 0], pairs[:, 1])
+
+    def get(self, pk):
+        i = np.searchsorted(self.related_ids, pk)
+        if i == len(self.related_ids) or self.related_ids[i] != pk:
+            return self.values[:0]
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    def get_counts(self, pks):
+        """Number of values of every entity in pks"""
+        pks = np.asarray(pks, dtype=np.int64)
+        i = np.searchsorted(self.related_ids, pks)
+        found = i < len(self.related_ids)
+        found[found] = self.related_ids[i[found]] == pks[found]
+        counts = np.zeros(len(pks), dtype=np.int64)
+        counts[found] = self.offsets[i[found] + 1] - self.offsets[i[found]]
+        return counts
+
+    def __contains__(self, pk):
+        i = np.searchsorted(self.related_ids, pk)
+        return i < len(self.related_ids) and self.related_ids[i] == pk
+
+    def __len__(self):
+        return len(self.related_ids)
+
+
 class AbstractCacheModel:
     pk_field_name = 'pk'
     option_label_field_name = 'name'
     option_value_field_name = 'id'
-    prefetches = None
-    related_name = 'publications'
 
     def get_queryset(self):
-        raise NotImplemented()
+        raise NotImplementedError
+
+    def get_relation_pairs(self):
+        """Related entity id and publication id pairs of every publication of the entities"""
+        raise NotImplementedError
+
+    def get_option_aliases(self, obj):
+        """Other names than the label the option of obj is found by"""
+        return ()
 
     def get_bulk_queryset(self):
-        return self.get_queryset().prefetch_related(*self.prefetches).in_bulk(field_name=self.pk_field_name)
+        return self.get_queryset().in_bulk(field_name=self.pk_field_name)
 
     @property
     def objs(self):
@@ -53,14 +122,18 @@ class AbstractCacheModel:
             self._objs = self.get_queryset()
         return self._objs
 
+    @property
+    def relation_map(self):
+        """Publication ids keyed by entity id, loaded with one query"""
+        if not hasattr(self, '_relation_map'):
+            self._relation_map = RelationMap.from_values_list(self.get_relation_pairs())
+        return self._relation_map
+
     @property
     def publication_lookup(self):
         if not hasattr(self, '_pk_lookup'):
             bulk = self.get_bulk_queryset()
-            self._pk_lookup = {}
-            for k in bulk.keys():
-                self._pk_lookup[k] = {'obj': bulk[k],
-                                      'pks': list(getattr(bulk[k], self.related_name).values_list('id', flat=True))}
+            self._pk_lookup = {k: {'obj': obj, 'pks': self.relation_map.get(k)} for k, obj in bulk.items()}
         return self._pk_lookup
 
     @property
@@ -70,52 +143,120 @@ class AbstractCacheModel:
                               'value': getattr(o, self.option_value_field_name)} for o in self.objs]
         return self._options
 
+    @property
+    def prefix_index(self):
+        """Options ranked by the number of publications of the entities"""
+        if not hasattr(self, '_prefix_index'):
+            values = [o['value'] for o in self.options]
+            self._prefix_index = PrefixIndex.from_options(self.options, self.relation_map.get_counts(values),
+                                                          aliases=[self.get_option_aliases(o) for o in self.objs])
+        return self._prefix_index
 
-class AuthorCache(AbstractCacheModel):
-    prefetches = ['publication_authors', 'publication_authors__author']
+    def search(self, q, limit=20):
+        return self.prefix_index.search(q, limit=limit)
 
+
+class AuthorCache(AbstractCacheModel):
     def get_queryset(self):
         return Author.objects.filter(id__in=Publication.api.primary().values_list('creators__id', flat=True)) \
             .order_by('family_name', 'given_name')
 
+    def get_relation_pairs(self):
+        return PublicationAuthors.objects.values_list('author_id', 'publication_id')
 
-class ContainerCache(AbstractCacheModel):
-    prefetches = ['publications']
 
+class ContainerCache(AbstractCacheModel):
     def get_queryset(self):
         return Container.objects.filter(id__in=Publication.api.primary().values_list('container_id', flat=True)) \
             .exclude(name='').order_by('name')
 
+    def get_relation_pairs(self):
+        return Publication.objects.filter(container__isnull=False).values_list('container_id', 'id')
 
-class PlatformCache(AbstractCacheModel):
-    prefetches = ['publication_platforms', 'publication_platforms__platform']
+    def get_option_aliases(self, obj):
+        # journals are found by ISSN with or without the hyphen
+        if not obj.issn:
+            return ()
+        return obj.issn, obj.issn.replace('-', '')
 
+
+class PlatformCache(AbstractCacheModel):
     def get_queryset(self):
         return Platform.objects.filter(id__in=Publication.api.primary().values_list('platforms__id', flat=True)) \
             .order_by('name')
 
+    def get_relation_pairs(self):
+        return PublicationPlatforms.objects.values_list('platform_id', 'publication_id')
 
-class SponsorCache(AbstractCacheModel):
-    prefetches = ['publication_sponsors', 'publication_sponsors__sponsor']
 
+class SponsorCache(AbstractCacheModel):
     def get_queryset(self):
         return Sponsor.objects.filter(id__in=Publication.api.primary().values_list('sponsors__id', flat=True)) \
             .order_by('name')
 
+    def get_relation_pairs(self):
+        return PublicationSponsors.objects.values_list('sponsor_id', 'publication_id')
 
-class TagCache(AbstractCacheModel):
-    prefetches = ['publication_tags', 'publication_tags__tag']
-    related_name = 'publication_set'
 
+class TagCache(AbstractCacheModel):
     def get_queryset(self):
         return Tag.objects.filter(id__in=Publication.api.primary().values_list('tags__id', flat=True)).order_by('name')
 
+    def get_relation_pairs(self):
+        return PublicationTags.objects.values_list('tag_id', 'publication_id')
+
+
+class RelationIndex(RelationMap):
+    """
+    Inverted index from related entity ids to the positions of their publications in a publication DataFrame
+
+    A relation map whose values are publication positions, so filters are sorted array intersections and unions
+    """
+
+    @property
+    def positions(self):
+        return self.values
+
+    @classmethod
+    def from_pairs(cls, publication_pks, related_pks, publication_index: pd.Index):
+        """Index publication and related entity id pairs, dropping publications not in publication_index"""
+        positions = publication_index.get_indexer(np.asarray(publication_pks, dtype=np.int64))
+        related_pks = np.asarray(related_pks, dtype=np.int64)
+        included = positions >= 0
+        return super().from_pairs(related_pks[included], positions[included])
+
+    @classmethod
+    def from_relation_map(cls, relation_map: RelationMap, publication_index: pd.Index):
+        """Index the publication ids of a relation map, dropping publications not in publication_index"""
+        related_pks = np.repeat(relation_map.related_ids, np.diff(relation_map.offsets))
+        return cls.from_pairs(relation_map.values, related_pks, publication_index)
+
+    def get_positions(self, pk):
+        return self.get(pk)
+
+    def match_all(self, pks):
+        """Positions of the publications related to every entity in pks"""
+        return reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), (self.get_positions(pk) for pk in pks))
+
+    def match_any(self, pks):
+        """Positions of the publications related to at least one entity in pks"""
+        return np.unique(np.concatenate([self.get_positions(pk) for pk in pks]))
+
+    def explode(self, pks):
+        """Publication positions and entity ids of every publication membership of the entities in pks"""
+        positions = [self.get_positions(pk) for pk in pks]
+        related_ids = np.repeat(np.asarray(pks, dtype=np.int64), [len(p) for p in positions])
+        return np.concatenate(positions) if positions else self.positions[:0], related_ids
+
 
 class DataCache:
     model_name_cache_lookup = {m._meta.verbose_name: str(m._meta.verbose_name_plural) for m in
                                [Author, Container, Platform, Sponsor, Tag]}
+    # full text search results kept, least recently used first
+    fulltext_searches_kept = 16
 
     def __init__(self):
+        self._fulltext_positions = OrderedDict()
         self.authors = AuthorCache()
         self.containers = ContainerCache()
         self.platforms = PlatformCache()
@@ -125,13 +266,7 @@ class DataCache:
     @staticmethod
     def _get_publication_df():
         df = pd.DataFrame.from_records([publication_as_dict(p) for p in
-                                        Publication.api.primary().prefetch_related(
-                                            Prefetch('citations', Publication.api.primary()),
-                                            'creators',
-                                            'model_documentation',
-                                            'platforms',
-                                            'sponsors',
-                                            'tags')
+                                        Publication.api.primary().prefetch_related('model_documentation')
                                        .select_related('container')], index='id')
         df.year_published = df.year_published.astype('category')
         return df
@@ -142,6 +277,75 @@ class DataCache:
             self._publication_df = self._get_publication_df()
         return self._publication_df
 
+    def _get_relation_indices(self):
+        index = self.publication_df.index
+        indices = {
+            Container._meta.model_name: RelationIndex.from_pairs(index.values, self.publication_df.container_pk.values,
+                                                                 index)
+        }
+        for model, cache in [(Author, self.authors), (Platform, self.platforms), (Sponsor, self.sponsors),
+                             (Tag, self.tags)]:
+            indices[model._meta.model_name] = RelationIndex.from_relation_map(cache.relation_map, index)
+        return indices
+
+    @property
+    def relation_indices(self):
+        """Relation indices of the publication DataFrame keyed by related model name"""
+        if not hasattr(self, '_relation_indices'):
+            self._relation_indices = self._get_relation_indices()
+        return self._relation_indices
+
+    @property
+    def citation_network(self):
+        """Citations between the publications of the publication DataFrame"""
+        if not hasattr(self, '_citation_network'):
+            pairs = np.array(list(Publication.api.primary().filter(citations__isnull=False)
+                                  .values_list('pk', 'citations')), dtype=np.int64).reshape(-1, 2)
+            self._citation_network = CitationNetwork.from_pairs(pairs[:, 0], pairs[:, 1], self.publication_df.index)
+        return self._citation_network
+
+    def publication_queries(self):
+        return PublicationQueries(self.publication_df, relation_indices=self.relation_indices,
+                                  fulltext_search=self.get_fulltext_positions)
+
+    def get_fulltext_positions(self, text):
+        """
+        Sorted positions in the publication DataFrame of the publications matching a full text search
+
+        Searches run once per normalized text and are memoized
+        """
+        key = ' '.join(text.split())
+        positions = self._fulltext_positions.get(key)
+        if positions is None:
+            matching_publication_pks = np.array(
+                [int(pk) for pk in
+                 SearchQuerySet().models(Publication).filter(content=AutoQuery(key)).values_list('pk', flat=True)],
+                dtype=np.int64)
+            positions = self.publication_df.index.get_indexer(matching_publication_pks)
+            positions = np.unique(positions[positions >= 0])
+            self._fulltext_positions[key] = positions
+            while len(self._fulltext_positions) > self.fulltext_searches_kept:
+                self._fulltext_positions.popitem(last=False)
+        else:
+            self._fulltext_positions.move_to_end(key)
+        return positions
+
+    def related_names(self, model_name):
+        """Names of the related entities of a model keyed by id"""
+        cache = getattr(self, self.model_name_cache_lookup[model_name])
+        if not hasattr(cache, '_names'):
+            cache._names = {option['value']: option['label'] for option in cache.options}
+        return cache._names
+
+    def search_options(self, model_name, q, limit=20):
+        """Top ranked dropdown options of the entities of a model with a name starting with q"""
+        return getattr(self, self.model_name_cache_lookup[model_name]).search(q, limit=limit)
+
+    def get_options(self, model_name, pks):
+        """Dropdown options of the entities with the given pks"""
+        names = self.related_names(model_name)
+        return [{'label': names[pk], 'value': pk} for pk in pks if pk in names]
+
     def publication_lookup(self, model_name, pk):
         cache_key = self.model_name_cache_lookup[model_name]
         return getattr(self, cache_key).publication_lookup[pk]
@@ -151,45 +355,98 @@ data_cache = DataCache()
 
 
 class PublicationQueries:
-    def __init__(self, df: pd.DataFrame):
-        self.df = df
+    """
+    Filters of a publication DataFrame
+
+    Filters narrow down sorted positions into the DataFrame. Relation filters read them from relation indices
+    instead of scanning the publications.
+    """
+    MATCH_ALL = 'all'
+    MATCH_ANY = 'any'
+
+    def __init__(self, df: pd.DataFrame, relation_indices=None, positions=None, fulltext_search=None):
+        self.base_df = df
+        self.relation_indices = data_cache.relation_indices if relation_indices is None else relation_indices
+        self.positions = positions
+        self.fulltext_search = data_cache.get_fulltext_positions if fulltext_search is None else fulltext_search
+
+    def _filter(self, positions):
+        if self.positions is not None:
+            positions = np.intersect1d(self.positions, positions, assume_unique=True)
+        return PublicationQueries(self.base_df, relation_indices=self.relation_indices, positions=positions,
+                                  fulltext_search=self.fulltext_search)
 
-    # def build_indices(self):
-    #     for author_ids in self.df.author_ids:
+    @property
+    def df(self):
+        if self.positions is None:
+            return self.base_df
+        return self.base_df.iloc[self.positions]
 
     def filter_by_fulltext_search(self, text):
-        matching_publication_pks = [int(pk) for pk in
-                                    SearchQuerySet().models(Publication).filter(content=AutoQuery(text)).values_list(
-                                        'pk', flat=True)]
-        return PublicationQueries(self.df.filter(items=matching_publication_pks, axis=0))
+        return self._filter(self.fulltext_search(text))
 
     def filter_by_date_published(self, start_year: int, end_year: int):
-        return PublicationQueries(self.df[(start_year < self.df.year_published) & (self.df.year_published <= end_year)])
+        year_published = self.base_df.year_published.astype(float).values
+        return self._filter(np.flatnonzero((start_year < year_published) & (year_published <= end_year)))
+
+    def filter_by_pks(self, model_name, pks, match=MATCH_ANY):
+        """
+        Publications related to any (or all) of the entities with the given pks
+
+        :param model_name: model name of the related entities
+        :param match: MATCH_ANY or MATCH_ALL
+        """
+        relation_index = self.relation_indices[model_name]
+        if not pks:
+            return self._filter(relation_index.positions[:0])
+        if match == self.MATCH_ALL:
+            return self._filter(relation_index.match_all(pks))
+        return self._filter(relation_index.match_any(pks))
 
     def filter_by_author_pk(self, pk):
-        return PublicationQueries(self.df[self.df.author_pks.apply(lambda pks: pk in pks)])
+        return self.filter_by_pks(Author._meta.model_name, [pk])
 
     def filter_by_container_pk(self, pk):
-        return PublicationQueries(self.df[self.df.container_pk == pk])
+        return self.filter_by_pks(Container._meta.model_name, [pk])
 
     def filter_by_platform_pk(self, pk):
-        return PublicationQueries(self.df[self.df.platform_pks.apply(lambda pks: pk in pks)])
+        return self.filter_by_pks(Platform._meta.model_name, [pk])
 
     def filter_by_sponsor_pk(self, pk):
-        return PublicationQueries(self.df[self.df.sponsor_pks.apply(lambda pks: pk in pks)])
+        return self.filter_by_pks(Sponsor._meta.model_name, [pk])
 
-    def filter_by_tag(self, tag: str):
-        return PublicationQueries(self.df.query('@tag in tags'))
+    def filter_by_tag_pk(self, pk):
+        return self.filter_by_pks(Tag._meta.model_name, [pk])
 
     def filter_by_pk(self, model_name, pk):
-        if model_name == Author._meta.verbose_name:
-            return self.filter_by_author_pk(pk)
-        elif model_name == Container._meta.model_name:
-            return self.filter_by_container_pk(pk)
-        elif model_name == Platform._meta.verbose_name:
-            return self.filter_by_platform_pk(pk)
-        elif model_name == Sponsor._meta.verbose_name:
-            return self.filter_by_sponsor_pk(pk)
+        return self.filter_by_pks(model_name, [pk])
+
+    @staticmethod
+    def _aggregate_counts(df, keys):
+        return df.groupby(keys, observed=True) \
+            .agg(dict(title='count', is_archived='sum', has_model_documentation='sum')) \
+            .rename(columns={'title': 'count',
+                             'is_archived': 'archived_count',
+                             'has_model_documentation': 'model_documentation_count'})
+
+    def to_counts(self):
+        """Publication, archived code and model documentation counts by year"""
+        return self._aggregate_counts(self.df, ['year_published'])
+
+    def to_related_counts(self, model_name, pks):
+        """
+        Publication, archived code and model documentation counts by related entity and year
+
+        Every selected entity is counted with one groupby over the exploded publication memberships of the entities
+        """
+        positions, related_ids = self.relation_indices[model_name].explode(pks)
+        if self.positions is not None:
+            included = np.isin(positions, self.positions)
+            positions = positions[included]
+            related_ids = related_ids[included]
+        columns = ['year_published', 'title', 'is_archived', 'has_model_documentation']
+        memberships = self.base_df.iloc[positions][columns].assign(related_id=related_ids)
+        return self._aggregate_counts(memberships, ['related_id', 'year_published'])
 
     def to_is_archived(self):
         df = self.df.groupby('year_published')[['year_published', 'is_archived']].aggregate(